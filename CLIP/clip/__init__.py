@@ -1 +1,2 @@
 from .clip import *
+from .text_cache import TextEmbeddingCache
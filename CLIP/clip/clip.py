@@ -1,31 +1,37 @@
 import hashlib
+import json
 import os
 import urllib
 import warnings
+from multiprocessing import Pool
 from packaging import version
-from typing import Union, List
+from typing import Union, List, Optional, Tuple
 
+import numpy as np
 import torch
-from PIL import Image
-from torchvision.transforms import Compose, Resize, CenterCrop, ToTensor, Normalize
-from tqdm import tqdm
 
-from .model import build_model
 from .simple_tokenizer import SimpleTokenizer as _Tokenizer
 
-try:
-    from torchvision.transforms import InterpolationMode
-    BICUBIC = InterpolationMode.BICUBIC
-except ImportError:
-    BICUBIC = Image.BICUBIC
-
+# torchvision, tqdm and the model code are imported on first use (in _transform, _download and load)
+# so that tokenize, available_models and the hub entrypoints start without them
 
-if version.parse(torch.__version__) < version.parse("1.7.1"):
+_TORCH_VERSION = version.parse(torch.__version__)
+if _TORCH_VERSION < version.parse("1.7.1"):
     warnings.warn("PyTorch version 1.7.1 or higher is recommended")
+# older index_select requires indices to be long
+_LONG_TOKENS = _TORCH_VERSION < version.parse("1.8.0")
+
+
+__all__ = ["available_models", "load", "tokenize", "tokenize_batch"]
+_tokenizer = None
 
 
-__all__ = ["available_models", "load", "tokenize"]
-_tokenizer = _Tokenizer()
+def _get_tokenizer() -> _Tokenizer:
+    # built on first use so that importing clip (e.g. in pool workers that never tokenize) stays cheap
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = _Tokenizer()
+    return _tokenizer
 
 _MODELS = {
     "RN50": "https://openaipublic.azureedge.net/clip/models/afeb0e10f9e5a86da6080e35cf09123aca3b358a0c3e3b6c78a7b63bc04b6762/RN50.pt",
@@ -40,7 +46,51 @@ _MODELS = {
 }
 
 
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _verified_marker(path: str) -> str:
+    return path + ".verified"
+
+
+def _is_verified(path: str, expected_sha256: str) -> bool:
+    """Whether the sidecar written by _mark_verified still describes the file at `path`"""
+    try:
+        with open(_verified_marker(path)) as f:
+            marker = json.load(f)
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return False
+    return (marker.get("sha256") == expected_sha256
+            and marker.get("size") == stat.st_size
+            and marker.get("mtime_ns") == stat.st_mtime_ns)
+
+
+def _mark_verified(path: str, sha256: str):
+    stat = os.stat(path)
+    marker = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    try:
+        tmp_path = f"{_verified_marker(path)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(marker, f)
+        os.replace(tmp_path, _verified_marker(path))
+    except OSError:
+        # without the marker the next load simply hashes the file again
+        pass
+
+
 def _download(url: str, root: str):
+    import urllib.request
+    from tqdm import tqdm
+
     os.makedirs(root, exist_ok=True)
     filename = os.path.basename(url)
 
@@ -51,24 +101,37 @@ def _download(url: str, root: str):
         raise RuntimeError(f"{download_target} exists and is not a regular file")
 
     if os.path.isfile(download_target):
-        if hashlib.sha256(open(download_target, "rb").read()).hexdigest() == expected_sha256:
+        if _is_verified(download_target, expected_sha256):
+            return download_target
+        if _sha256_file(download_target) == expected_sha256:
+            _mark_verified(download_target, expected_sha256)
             return download_target
         else:
             warnings.warn(f"{download_target} exists, but the SHA256 checksum does not match; re-downloading the file")
 
-    with urllib.request.urlopen(url) as source, open(download_target, "wb") as output:
-        with tqdm(total=int(source.info().get("Content-Length")), ncols=80, unit='iB', unit_scale=True, unit_divisor=1024) as loop:
-            while True:
-                buffer = source.read(8192)
-                if not buffer:
-                    break
-
-                output.write(buffer)
-                loop.update(len(buffer))
-
-    if hashlib.sha256(open(download_target, "rb").read()).hexdigest() != expected_sha256:
-        raise RuntimeError("Model has been downloaded but the SHA256 checksum does not not match")
-
+    # hash while downloading into a temporary file, then move it into place
+    partial_target = f"{download_target}.{os.getpid()}.part"
+    digest = hashlib.sha256()
+    try:
+        with urllib.request.urlopen(url) as source, open(partial_target, "wb") as output:
+            with tqdm(total=int(source.info().get("Content-Length")), ncols=80, unit='iB', unit_scale=True, unit_divisor=1024) as loop:
+                while True:
+                    buffer = source.read(_HASH_CHUNK_SIZE)
+                    if not buffer:
+                        break
+
+                    output.write(buffer)
+                    digest.update(buffer)
+                    loop.update(len(buffer))
+
+        if digest.hexdigest() != expected_sha256:
+            raise RuntimeError("Model has been downloaded but the SHA256 checksum does not not match")
+        os.replace(partial_target, download_target)
+    finally:
+        if os.path.exists(partial_target):
+            os.remove(partial_target)
+
+    _mark_verified(download_target, expected_sha256)
     return download_target
 
 
@@ -76,9 +139,22 @@ def _convert_image_to_rgb(image):
     return image.convert("RGB")
 
 
+def _bicubic():
+    from torchvision.transforms import InterpolationMode
+    return InterpolationMode.BICUBIC
+
+
 def _transform(n_px):
+    from torchvision.transforms import Compose, Resize, CenterCrop, ToTensor, Normalize
+
+    try:
+        bicubic = _bicubic()
+    except ImportError:
+        from PIL import Image
+        bicubic = Image.BICUBIC
+
     return Compose([
-        Resize(n_px, interpolation=BICUBIC),
+        Resize(n_px, interpolation=bicubic),
         CenterCrop(n_px),
         _convert_image_to_rgb,
         ToTensor(),
@@ -86,12 +162,110 @@ def _transform(n_px):
     ])
 
 
+def __getattr__(name):
+    # module attributes that used to be imported eagerly
+    if name == "BICUBIC":
+        try:
+            return _bicubic()
+        except ImportError:
+            from PIL import Image
+            return Image.BICUBIC
+    if name == "build_model":
+        from .model import build_model
+        return build_model
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _is_torchscript_archive(model_path: str) -> bool:
+    import zipfile
+
+    # TorchScript archives are zip files with serialized code; state_dicts hold only data.pkl and tensors
+    try:
+        with zipfile.ZipFile(model_path) as archive:
+            return any(name.endswith("constants.pkl") or "/code/" in name for name in archive.namelist())
+    except zipfile.BadZipFile:
+        return False
+
+
+def _load_state_dict(model_path: str, opened_file) -> dict:
+    # zipfile checkpoints are memory-mapped, so build_model can adopt their tensors without a copy
+    try:
+        return torch.load(model_path, map_location="cpu", mmap=True)
+    except (RuntimeError, TypeError):
+        # legacy (non-zipfile) checkpoints or torch without mmap support
+        opened_file.seek(0)
+        return torch.load(opened_file, map_location="cpu")
+
+
+def _share_weights(model: torch.nn.Module):
+    # frozen so that no worker allocates gradients or writes to the shared pages
+    model.requires_grad_(False)
+    model.share_memory()
+
+
+_QUANTIZED_CACHE_VERSION = 2
+
+
+def _quantized_cache_path(model_path: str, quantize: str) -> str:
+    return f"{model_path}.{quantize}.pt"
+
+
+def _load_quantized(model_path: str, quantize: str) -> Optional[dict]:
+    """Returns the cached quantized state_dict if it was built from the current checkpoint with this torch version"""
+    cache_path = _quantized_cache_path(model_path, quantize)
+    if not os.path.isfile(cache_path):
+        return None
+    stat = os.stat(model_path)
+    try:
+        cached = torch.load(cache_path, map_location="cpu", weights_only=True)
+    except Exception:
+        return None
+    if (not isinstance(cached, dict)
+            or cached.get("version") != _QUANTIZED_CACHE_VERSION
+            or cached.get("torch") != str(torch.__version__)
+            or cached.get("size") != stat.st_size
+            or cached.get("mtime_ns") != stat.st_mtime_ns):
+        return None
+    return cached["state_dict"]
+
+
+def _save_quantized(model_path: str, quantize: str, model: torch.nn.Module):
+    # only tensors are stored; the modules are rebuilt from the code by load_quantized_state_dict
+    stat = os.stat(model_path)
+    cached = {"version": _QUANTIZED_CACHE_VERSION, "torch": str(torch.__version__),
+              "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "state_dict": model.state_dict()}
+    cache_path = _quantized_cache_path(model_path, quantize)
+    try:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        torch.save(cached, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # read-only checkpoint directory: the model is quantized again on the next load
+        pass
+
+
+def _build_quantized(state_dict: dict, model_path: str, quantize: str) -> torch.nn.Module:
+    from .model import build_model, load_quantized_state_dict, quantize_dynamic_int8
+
+    cached = _load_quantized(model_path, quantize)
+    if cached is not None:
+        try:
+            return load_quantized_state_dict(build_model(state_dict), cached)
+        except (RuntimeError, KeyError):
+            # written by a different version of the model code
+            pass
+    model = quantize_dynamic_int8(build_model(state_dict).float())
+    _save_quantized(model_path, quantize, model)
+    return model
+
+
 def available_models() -> List[str]:
     """Returns the names of available CLIP models"""
     return list(_MODELS.keys())
 
 
-def load(name: str, device: Union[str, torch.device] = "cuda" if torch.cuda.is_available() else "cpu", jit: bool = False, download_root: str = None):
+def load(name: str, device: Union[str, torch.device] = "cuda" if torch.cuda.is_available() else "cpu", jit: bool = False, download_root: str = None,
+         share_memory: bool = False, quantize: Optional[str] = None):
     """Load a CLIP model
 
     Parameters
@@ -108,6 +282,20 @@ def load(name: str, device: Union[str, torch.device] = "cuda" if torch.cuda.is_a
     download_root: str
         path to download the model files; by default, it uses "~/.cache/clip"
 
+    share_memory: bool
+        Move the parameters and buffers into shared memory (CPU only) and freeze them.
+        Workers that inherit the model by fork, or receive it through `torch.multiprocessing`
+        (e.g. as a Pool initializer argument with the spawn start method), map the same pages
+        instead of holding their own copy of the weights.
+
+    quantize: Optional[str]
+        "int8" applies dynamic int8 quantization to the nn.Linear layers of the text and ViT
+        transformers, including the attention projections (CPU only, non-JIT, PyTorch 2.0 or higher
+        for scaled_dot_product_attention and torch.ao.nn.quantized.dynamic). The quantized
+        state_dict is cached next to the checkpoint as `{checkpoint}.int8.pt` (loaded with
+        `weights_only=True` into modules rebuilt from the code) and recomputed when the
+        checkpoint, the PyTorch version or the model code changes.
+
     Returns
     -------
     model : torch.nn.Module
@@ -116,6 +304,20 @@ def load(name: str, device: Union[str, torch.device] = "cuda" if torch.cuda.is_a
     preprocess : Callable[[PIL.Image], torch.Tensor]
         A torchvision transform that converts a PIL image into a tensor that the returned model can take as its input
     """
+    from .model import build_model, _SDPA_AVAILABLE
+
+    if share_memory and torch.device(device).type != "cpu":
+        raise ValueError("share_memory=True requires device='cpu'")
+    if quantize is not None:
+        if quantize != "int8":
+            raise ValueError(f"Unknown quantization {quantize}; only 'int8' is supported")
+        if torch.device(device).type != "cpu" or jit:
+            raise ValueError("quantize='int8' requires device='cpu' and jit=False")
+        if share_memory:
+            raise ValueError("quantize='int8' cannot be combined with share_memory=True")
+        if not _SDPA_AVAILABLE:
+            raise RuntimeError(f"quantize='int8' requires PyTorch 2.0 or higher, found {torch.__version__}")
+
     if name in _MODELS:
         model_path = _download(_MODELS[name], download_root or os.path.expanduser("~/.cache/clip"))
     elif os.path.isfile(name):
@@ -126,6 +328,9 @@ def load(name: str, device: Union[str, torch.device] = "cuda" if torch.cuda.is_a
     with open(model_path, 'rb') as opened_file:
         try:
             # loading JIT archive
+            if not _is_torchscript_archive(model_path):
+                # skip reading a plain state_dict checkpoint into memory just to fail
+                raise RuntimeError(f"{model_path} is not a TorchScript archive")
             model = torch.jit.load(opened_file, map_location=device if jit else "cpu").eval()
             state_dict = None
         except RuntimeError:
@@ -133,12 +338,17 @@ def load(name: str, device: Union[str, torch.device] = "cuda" if torch.cuda.is_a
             if jit:
                 warnings.warn(f"File {model_path} is not a JIT archive. Loading as a state dict instead")
                 jit = False
-            state_dict = torch.load(opened_file, map_location="cpu")
+            state_dict = _load_state_dict(model_path, opened_file)
 
     if not jit:
+        if quantize is not None:
+            model = _build_quantized(state_dict or model.state_dict(), model_path, quantize)
+            return model, _transform(model.visual.input_resolution)
         model = build_model(state_dict or model.state_dict()).to(device)
         if str(device) == "cpu":
             model.float()
+        if share_memory:
+            _share_weights(model)
         return model, _transform(model.visual.input_resolution)
 
     # patch the device names
@@ -199,6 +409,8 @@ def load(name: str, device: Union[str, torch.device] = "cuda" if torch.cuda.is_a
 
         model.float()
 
+    if share_memory:
+        _share_weights(model)
     return model, _transform(model.input_resolution.item())
 
 
@@ -225,10 +437,11 @@ def tokenize(texts: Union[str, List[str]], context_length: int = 77, truncate: b
     if isinstance(texts, str):
         texts = [texts]
 
-    sot_token = _tokenizer.encoder["<|startoftext|>"]
-    eot_token = _tokenizer.encoder["<|endoftext|>"]
-    all_tokens = [[sot_token] + _tokenizer.encode(text) + [eot_token] for text in texts]
-    if version.parse(torch.__version__) < version.parse("1.8.0"):
+    tokenizer = _get_tokenizer()
+    sot_token = tokenizer.encoder["<|startoftext|>"]
+    eot_token = tokenizer.encoder["<|endoftext|>"]
+    all_tokens = [[sot_token] + tokenizer.encode(text) + [eot_token] for text in texts]
+    if _LONG_TOKENS:
         result = torch.zeros(len(all_tokens), context_length, dtype=torch.long)
     else:
         result = torch.zeros(len(all_tokens), context_length, dtype=torch.int)
@@ -243,3 +456,73 @@ def tokenize(texts: Union[str, List[str]], context_length: int = 77, truncate: b
         result[i, :len(tokens)] = torch.tensor(tokens)
 
     return result
+
+
+def _encode_chunk(texts: List[str]) -> List[List[int]]:
+    tokenizer = _get_tokenizer()
+    return [tokenizer.encode(text) for text in texts]
+
+
+def tokenize_batch(texts: List[str], context_length: int = 77, processes: Optional[int] = None,
+                   chunksize: int = 4096) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Tokenizes a large list of strings into a single preallocated buffer
+
+    Texts longer than the context length are truncated (ending with the EOT token) and flagged
+    instead of raising.
+
+    Parameters
+    ----------
+    texts : List[str]
+        The input strings to tokenize
+
+    context_length : int
+        The context length to use; all CLIP models use 77 as the context length
+
+    processes : Optional[int]
+        Number of worker processes for BPE encoding; defaults to `os.cpu_count()`.
+        Lists shorter than `chunksize` are encoded in the calling process.
+
+    chunksize : int
+        Number of texts sent to a worker at a time
+
+    Returns
+    -------
+    tokens : torch.Tensor
+        shape = [len(texts), context_length]; an int32 tensor sharing memory with a numpy buffer
+        (int64 when torch version is <1.8.0)
+
+    lengths : torch.Tensor
+        Number of tokens written in each row, including the SOT and EOT tokens
+
+    truncated : torch.Tensor
+        Boolean flags for the rows that did not fit in the context length
+    """
+    tokenizer = _get_tokenizer()
+    sot_token = tokenizer.encoder["<|startoftext|>"]
+    eot_token = tokenizer.encoder["<|endoftext|>"]
+
+    chunks = [texts[start:start + chunksize] for start in range(0, len(texts), chunksize)]
+    if len(chunks) > 1 and processes != 1:
+        with Pool(processes=processes) as pool:
+            encoded = pool.imap(_encode_chunk, chunks)
+            encoded = [tokens for chunk in encoded for tokens in chunk]
+    else:
+        encoded = [tokens for chunk in chunks for tokens in _encode_chunk(chunk)]
+
+    result = np.zeros((len(texts), context_length), dtype=np.int32)
+    lengths = np.zeros(len(texts), dtype=np.int64)
+    truncated = np.zeros(len(texts), dtype=np.bool_)
+    result[:, 0] = sot_token
+    for i, tokens in enumerate(encoded):
+        if len(tokens) + 2 > context_length:
+            tokens = tokens[:context_length - 2]
+            truncated[i] = True
+        result[i, 1:len(tokens) + 1] = tokens
+        result[i, len(tokens) + 1] = eot_token
+        lengths[i] = len(tokens) + 2
+
+    tokens = torch.from_numpy(result)
+    if _LONG_TOKENS:
+        tokens = tokens.long()
+    return tokens, torch.from_numpy(lengths), torch.from_numpy(truncated)
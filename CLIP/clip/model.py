@@ -1,3 +1,4 @@
+import inspect
 from collections import OrderedDict
 from typing import Tuple, Union
 
@@ -7,6 +8,67 @@ import torch.nn.functional as F
 from torch import nn
 
 
+# load_state_dict(assign=True) and the torch.device context manager (torch >= 2.1)
+_SUPPORTS_ASSIGN = "assign" in inspect.signature(nn.Module.load_state_dict).parameters and hasattr(torch.device, "__enter__")
+
+
+# fused attention kernel (torch >= 2.0)
+_SDPA_AVAILABLE = hasattr(F, "scaled_dot_product_attention")
+
+
+def set_attention_backend(model: nn.Module, backend: str):
+    """Selects "sdpa" (F.scaled_dot_product_attention) or "mha" (nn.MultiheadAttention, the default) for every ResidualAttentionBlock"""
+    if backend not in ("sdpa", "mha"):
+        raise ValueError(f"Unknown attention backend {backend}")
+    if backend == "sdpa" and not _SDPA_AVAILABLE:
+        raise RuntimeError("scaled_dot_product_attention requires PyTorch 2.0 or higher")
+    for module in model.modules():
+        if isinstance(module, ResidualAttentionBlock):
+            if backend == "mha" and module.attn is None:
+                raise RuntimeError("blocks with split attention projections only support the sdpa backend")
+            module.use_sdpa = backend == "sdpa"
+
+
+def quantize_dynamic_int8(model: "CLIP", calibrate: bool = True) -> "CLIP":
+    """Quantizes the nn.Linear layers of the text and ViT transformers to int8 in place (CPU inference only)
+
+    The attention in/out projections are split out of nn.MultiheadAttention first, so that they are
+    quantized along with the MLP layers. Embeddings, convolutions and the final projections stay float32.
+    With calibrate=False the layers are replaced by empty int8 layers of the same shape instead, to be
+    filled from a quantized state_dict (see load_quantized_state_dict).
+    """
+    from torch.ao.quantization import quantize_dynamic
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+
+    transformers = [model.transformer]
+    if isinstance(model.visual, VisionTransformer):
+        transformers.append(model.visual.transformer)
+    for transformer in transformers:
+        for block in transformer.resblocks:
+            block.split_attention_projections()
+        if calibrate:
+            quantize_dynamic(transformer, {nn.Linear}, dtype=torch.qint8, inplace=True)
+            continue
+        for name, module in list(transformer.named_modules()):
+            if type(module) is nn.Linear:
+                parent, _, attr = name.rpartition(".")
+                setattr(transformer.get_submodule(parent), attr,
+                        DynamicQuantizedLinear(module.in_features, module.out_features,
+                                               bias_=module.bias is not None, dtype=torch.qint8))
+    return model
+
+
+def load_quantized_state_dict(model: "CLIP", state_dict: dict) -> "CLIP":
+    """Loads the state_dict of a quantize_dynamic_int8 model into a float model built by build_model"""
+    quantize_dynamic_int8(model, calibrate=False)
+    if _SUPPORTS_ASSIGN:
+        # the float tensors of the cache replace the (possibly fp16, memory-mapped) checkpoint tensors
+        model.load_state_dict(state_dict, assign=True)
+    else:
+        model.float().load_state_dict(state_dict)
+    return model.eval()
+
+
 class Bottleneck(nn.Module):
     expansion = 4
 
@@ -172,7 +234,11 @@ class ResidualAttentionBlock(nn.Module):
     def __init__(self, d_model: int, n_head: int, attn_mask: torch.Tensor = None):
         super().__init__()
 
+        self.n_head = n_head
         self.attn = nn.MultiheadAttention(d_model, n_head)
+        # plain nn.Linear copies of the attention projections, set by split_attention_projections()
+        self.in_proj = None
+        self.out_proj = None
         self.ln_1 = LayerNorm(d_model)
         self.mlp = nn.Sequential(OrderedDict([
             ("c_fc", nn.Linear(d_model, d_model * 4)),
@@ -180,11 +246,76 @@ class ResidualAttentionBlock(nn.Module):
             ("c_proj", nn.Linear(d_model * 4, d_model))
         ]))
         self.ln_2 = LayerNorm(d_model)
-        self.attn_mask = attn_mask
+        # non-persistent buffer: follows .to()/share_memory() but is not part of the state_dict
+        self.register_buffer("attn_mask", attn_mask, persistent=False)
+        # nn.MultiheadAttention by default; set_attention_backend(model, "sdpa") opts into the fused kernel
+        self.use_sdpa = False
+        self._mask_source = None
+        self._mask_cache = {}
+        self._mask_is_causal = False
+
+    def _mask_for(self, x: torch.Tensor):
+        # converted copies of attn_mask are cached per (device, dtype) instead of replacing the attribute
+        if self.attn_mask is None:
+            return None
+        if self._mask_source is not self.attn_mask:
+            self._mask_source = self.attn_mask
+            self._mask_cache = {}
+            causal = torch.full_like(self.attn_mask, float("-inf"), device="cpu").triu_(1)
+            self._mask_is_causal = torch.equal(self.attn_mask.cpu(), causal)
+        key = (x.device, x.dtype)
+        if key not in self._mask_cache:
+            self._mask_cache[key] = self.attn_mask.to(dtype=x.dtype, device=x.device)
+        attn_mask = self._mask_cache[key]
+        if attn_mask.shape[0] != x.shape[0]:
+            # sequences trimmed by encode_text use the top-left corner of the causal mask
+            attn_mask = attn_mask[:x.shape[0], :x.shape[0]]
+        return attn_mask
+
+    def _sdpa_attention(self, x: torch.Tensor):
+        # same computation as nn.MultiheadAttention with its in_proj/out_proj parameters, using the fused kernel
+        length, batch, width = x.shape
+        heads = self.n_head
+        if self.in_proj is not None:
+            qkv = self.in_proj(x)
+        else:
+            qkv = F.linear(x, self.attn.in_proj_weight, self.attn.in_proj_bias)
+        q, k, v = qkv.view(length, batch, 3, heads, width // heads).permute(2, 1, 3, 0, 4).unbind(0)  # 3 x [N, heads, L, head_dim]
+
+        attn_mask = self._mask_for(x)
+        if attn_mask is None:
+            out = F.scaled_dot_product_attention(q, k, v)
+        elif self._mask_is_causal:
+            out = F.scaled_dot_product_attention(q, k, v, is_causal=True)
+        else:
+            out = F.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask)
+        out = out.permute(2, 0, 1, 3).reshape(length, batch, width)
+        return (self.out_proj if self.out_proj is not None else self.attn.out_proj)(out)
+
+    def split_attention_projections(self):
+        """Replaces nn.MultiheadAttention by nn.Linear in/out projections sharing its parameters
+
+        MultiheadAttention keeps in_proj as a raw parameter and out_proj as a linear that module
+        swaps (e.g. dynamic quantization) skip; after the split the block always uses the sdpa path.
+        """
+        if self.attn is None:
+            return
+        if not _SDPA_AVAILABLE:
+            raise RuntimeError("split attention projections require PyTorch 2.0 or higher")
+        width = self.attn.embed_dim
+        self.in_proj = nn.Linear(width, 3 * width, bias=self.attn.in_proj_bias is not None, device="meta")
+        self.in_proj.weight = self.attn.in_proj_weight
+        self.in_proj.bias = self.attn.in_proj_bias
+        self.out_proj = nn.Linear(width, width, bias=self.attn.out_proj.bias is not None, device="meta")
+        self.out_proj.weight = self.attn.out_proj.weight
+        self.out_proj.bias = self.attn.out_proj.bias
+        self.attn = None
+        self.use_sdpa = True
 
     def attention(self, x: torch.Tensor):
-        self.attn_mask = self.attn_mask.to(dtype=x.dtype, device=x.device) if self.attn_mask is not None else None
-        return self.attn(x, x, x, need_weights=False, attn_mask=self.attn_mask)[0]
+        if self.use_sdpa or self.attn is None:
+            return self._sdpa_attention(x)
+        return self.attn(x, x, x, need_weights=False, attn_mask=self._mask_for(x))[0]
 
     def forward(self, x: torch.Tensor):
         x = x + self.attention(self.ln_1(x))
@@ -341,9 +472,16 @@ class CLIP(nn.Module):
         return self.visual(image.type(self.dtype))
 
     def encode_text(self, text):
+        # with the causal mask, positions after the last EOT token cannot affect the features read at
+        # the EOT positions, so the trailing padding is dropped before running the transformer. The
+        # result matches the full context_length pass up to floating-point rounding (~1e-6 in fp32),
+        # since the kernels run on differently shaped inputs
+        n_ctx = int(text.argmax(dim=-1).max()) + 1 if text.shape[0] > 0 else text.shape[1]
+        text = text[:, :n_ctx]
+
         x = self.token_embedding(text).type(self.dtype)  # [batch_size, n_ctx, d_model]
 
-        x = x + self.positional_embedding.type(self.dtype)
+        x = x + self.positional_embedding[:n_ctx].type(self.dtype)
         x = x.permute(1, 0, 2)  # NLD -> LND
         x = self.transformer(x)
         x = x.permute(1, 0, 2)  # LND -> NLD
@@ -421,7 +559,7 @@ def build_model(state_dict: dict):
     transformer_heads = transformer_width // 64
     transformer_layers = len(set(k.split(".")[2] for k in state_dict if k.startswith("transformer.resblocks")))
 
-    model = CLIP(
+    args = (
         embed_dim,
         image_resolution, vision_layers, vision_width, vision_patch_size,
         context_length, vocab_size, transformer_width, transformer_heads, transformer_layers
@@ -431,6 +569,26 @@ def build_model(state_dict: dict):
         if key in state_dict:
             del state_dict[key]
 
-    convert_weights(model)
-    model.load_state_dict(state_dict)
+    if not _SUPPORTS_ASSIGN:
+        model = CLIP(*args)
+        convert_weights(model)
+        model.load_state_dict(state_dict)
+        return model.eval()
+
+    # build the module tree on the meta device (no allocation, no random init) and adopt the
+    # checkpoint tensors directly, cast to the dtypes convert_weights would have given them
+    with torch.device("meta"):
+        model = CLIP(*args)
+        convert_weights(model)
+    dtypes = {name: tensor.dtype for name, tensor in model.state_dict(keep_vars=True).items()}
+    state_dict = {
+        key: value.to(dtypes[key]) if key in dtypes and value.dtype != dtypes[key] else value
+        for key, value in state_dict.items()
+    }
+    model.load_state_dict(state_dict, assign=True)
+
+    # the causal mask is a non-persistent buffer, so it is not in the state_dict and still on the meta device
+    attn_mask = model.build_attention_mask()
+    for block in model.transformer.resblocks:
+        block.attn_mask = attn_mask
     return model.eval()
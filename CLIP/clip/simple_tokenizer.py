@@ -1,6 +1,10 @@
 import gzip
+import hashlib
+import heapq
 import html
 import os
+import pickle
+from collections import OrderedDict
 from functools import lru_cache
 
 import ftfy
@@ -12,6 +16,11 @@ def default_bpe():
     return os.path.join(os.path.dirname(os.path.abspath(__file__)), "bpe_simple_vocab_16e6.txt.gz")
 
 
+# bump when the layout of the precompiled vocab artifact changes
+VOCAB_ARTIFACT_VERSION = 1
+DEFAULT_VOCAB_CACHE_DIR = os.path.expanduser("~/.cache/clip")
+
+
 @lru_cache()
 def bytes_to_unicode():
     """
@@ -59,63 +68,127 @@ def whitespace_clean(text):
     return text
 
 
+def _compile_vocab(bpe_path: str):
+    merges = gzip.open(bpe_path).read().decode("utf-8").split('\n')
+    merges = merges[1:49152-256-2+1]
+    merges = [tuple(merge.split()) for merge in merges]
+    vocab = list(bytes_to_unicode().values())
+    vocab = vocab + [v+'</w>' for v in vocab]
+    for merge in merges:
+        vocab.append(''.join(merge))
+    vocab.extend(['<|startoftext|>', '<|endoftext|>'])
+    return vocab, merges
+
+
+def load_vocab(bpe_path: str = default_bpe(), cache_dir: str = DEFAULT_VOCAB_CACHE_DIR):
+    """
+    Returns (vocab, merges) for the given BPE file.
+
+    The parsed lists are stored in a versioned pickle next to the model cache, named after the
+    sha256 of the gz file, so later processes skip decompressing and splitting the merges.
+    Pass cache_dir=None to always parse the gz file.
+    """
+    if cache_dir is None:
+        return _compile_vocab(bpe_path)
+
+    with open(bpe_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    name = os.path.basename(bpe_path).split(".")[0]
+    artifact_path = os.path.join(cache_dir, f"{name}.{digest[:16]}.v{VOCAB_ARTIFACT_VERSION}.pkl")
+
+    try:
+        with open(artifact_path, "rb") as f:
+            artifact = pickle.load(f)
+        if artifact.get("version") == VOCAB_ARTIFACT_VERSION and artifact.get("sha256") == digest:
+            return artifact["vocab"], artifact["merges"]
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+        pass
+
+    vocab, merges = _compile_vocab(bpe_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{artifact_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"version": VOCAB_ARTIFACT_VERSION, "sha256": digest, "vocab": vocab, "merges": merges},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, artifact_path)
+    except OSError:
+        # a read-only cache only costs the parse on every start
+        pass
+    return vocab, merges
+
+
 class SimpleTokenizer(object):
-    def __init__(self, bpe_path: str = default_bpe()):
+    def __init__(self, bpe_path: str = default_bpe(), cache_size: int = 2 ** 16,
+                 vocab_cache_dir: str = DEFAULT_VOCAB_CACHE_DIR):
         self.byte_encoder = bytes_to_unicode()
         self.byte_decoder = {v: k for k, v in self.byte_encoder.items()}
-        merges = gzip.open(bpe_path).read().decode("utf-8").split('\n')
-        merges = merges[1:49152-256-2+1]
-        merges = [tuple(merge.split()) for merge in merges]
-        vocab = list(bytes_to_unicode().values())
-        vocab = vocab + [v+'</w>' for v in vocab]
-        for merge in merges:
-            vocab.append(''.join(merge))
-        vocab.extend(['<|startoftext|>', '<|endoftext|>'])
+        vocab, merges = load_vocab(bpe_path, vocab_cache_dir)
         self.encoder = dict(zip(vocab, range(len(vocab))))
         self.decoder = {v: k for k, v in self.encoder.items()}
         self.bpe_ranks = dict(zip(merges, range(len(merges))))
-        self.cache = {'<|startoftext|>': '<|startoftext|>', '<|endoftext|>': '<|endoftext|>'}
+        self.special_tokens = {'<|startoftext|>': '<|startoftext|>', '<|endoftext|>': '<|endoftext|>'}
+        # bounded LRU of bpe() results
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
         self.pat = re.compile(r"""<\|startoftext\|>|<\|endoftext\|>|'s|'t|'re|'ve|'m|'ll|'d|[\p{L}]+|[\p{N}]|[^\s\p{L}\p{N}]+""", re.IGNORECASE)
 
     def bpe(self, token):
-        if token in self.cache:
-            return self.cache[token]
-        word = tuple(token[:-1]) + ( token[-1] + '</w>',)
-        pairs = get_pairs(word)
-
-        if not pairs:
-            return token+'</w>'
-
-        while True:
-            bigram = min(pairs, key = lambda pair: self.bpe_ranks.get(pair, float('inf')))
-            if bigram not in self.bpe_ranks:
-                break
-            first, second = bigram
-            new_word = []
-            i = 0
-            while i < len(word):
-                try:
-                    j = word.index(first, i)
-                    new_word.extend(word[i:j])
-                    i = j
-                except:
-                    new_word.extend(word[i:])
-                    break
-
-                if word[i] == first and i < len(word)-1 and word[i+1] == second:
-                    new_word.append(first+second)
-                    i += 2
-                else:
-                    new_word.append(word[i])
-                    i += 1
-            new_word = tuple(new_word)
-            word = new_word
-            if len(word) == 1:
-                break
-            else:
-                pairs = get_pairs(word)
-        word = ' '.join(word)
+        if token in self.special_tokens:
+            return self.special_tokens[token]
+        cached = self.cache.get(token)
+        if cached is not None:
+            self.cache_hits += 1
+            self.cache.move_to_end(token)
+            return cached
+        self.cache_misses += 1
+
+        symbols = list(token[:-1]) + [token[-1] + '</w>']
+        if len(symbols) == 1:
+            return symbols[0]
+
+        # symbols form a linked list (merged-away entries become None); candidate merges sit in a
+        # heap ordered by (rank, position), so equal-rank merges are applied left to right like
+        # the original pass over the whole word
+        ranks = self.bpe_ranks
+        prev_index = list(range(-1, len(symbols) - 1))
+        next_index = list(range(1, len(symbols) + 1))
+        next_index[-1] = -1
+        heap = []
+        for i in range(len(symbols) - 1):
+            rank = ranks.get((symbols[i], symbols[i + 1]))
+            if rank is not None:
+                heap.append((rank, i, symbols[i], symbols[i + 1]))
+        heapq.heapify(heap)
+
+        while heap:
+            _, i, first, second = heapq.heappop(heap)
+            j = next_index[i]
+            # skip entries whose symbols were changed by an earlier merge
+            if symbols[i] != first or j == -1 or symbols[j] != second:
+                continue
+            merged = first + second
+            symbols[i] = merged
+            symbols[j] = None
+            k = next_index[j]
+            next_index[i] = k
+            if k != -1:
+                prev_index[k] = i
+                rank = ranks.get((merged, symbols[k]))
+                if rank is not None:
+                    heapq.heappush(heap, (rank, i, merged, symbols[k]))
+            p = prev_index[i]
+            if p != -1:
+                rank = ranks.get((symbols[p], merged))
+                if rank is not None:
+                    heapq.heappush(heap, (rank, p, symbols[p], merged))
+
+        word = ' '.join(symbol for symbol in symbols if symbol is not None)
         self.cache[token] = word
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
         return word
 
     def encode(self, text):
@@ -130,3 +203,6 @@ class SimpleTokenizer(object):
         text = ''.join([self.decoder[token] for token in tokens])
         text = bytearray([self.byte_decoder[c] for c in text]).decode('utf-8', errors="replace").replace('</w>', ' ')
         return text
+
+    def cache_info(self):
+        return {"hits": self.cache_hits, "misses": self.cache_misses, "size": len(self.cache), "max_size": self.cache_size}
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: the disk tier is single-writer only
+    fcntl = None
+
+import numpy as np
+import torch
+
+from .clip import tokenize
+
+
+__all__ = ["TextEmbeddingCache", "text_weights_hash"]
+
+_TEXT_TOWER_PREFIXES = ("token_embedding.", "positional_embedding", "transformer.", "ln_final.", "text_projection")
+
+
+def _update_digest(digest, value):
+    # quantized layers (clip.load(quantize="int8")) store (weight, bias) tuples and their dtype
+    if isinstance(value, (tuple, list)):
+        for item in value:
+            _update_digest(digest, item)
+    elif isinstance(value, torch.Tensor):
+        digest.update(str(value.dtype).encode("utf-8"))
+        if value.is_quantized:
+            value = value.dequantize()
+        digest.update(value.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy().tobytes())
+    elif value is not None:
+        digest.update(str(value).encode("utf-8"))
+
+
+def text_weights_hash(model: torch.nn.Module) -> str:
+    """Returns a sha256 digest of the parameters that encode_text depends on"""
+    digest = hashlib.sha256()
+    for name, value in sorted(model.state_dict().items()):
+        if name.startswith(_TEXT_TOWER_PREFIXES):
+            digest.update(name.encode("utf-8"))
+            _update_digest(digest, value)
+    return digest.hexdigest()
+
+
+def _token_key(tokens: torch.Tensor) -> bytes:
+    # everything after the EOT token (the highest id in each sequence) is padding
+    length = int(tokens.argmax()) + 1
+    return hashlib.blake2b(tokens[:length].to(torch.int32).numpy().tobytes(), digest_size=16).digest()
+
+
+class TextEmbeddingCache:
+    KEY_BYTES = 16
+
+    def __init__(self,
+                 model: torch.nn.Module,
+                 model_key: Optional[str] = None,
+                 cache_dir: Optional[str] = None,
+                 max_memory_entries: int = 65536,
+                 batch_size: int = 1024):
+        """
+        Caches the outputs of `model.encode_text`, keyed by (model weights, token ids)
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            A CLIP model returned by `clip.load()`
+
+        model_key : Optional[str]
+            Identifies the text weights; defaults to `text_weights_hash(model)`.
+            Embeddings of different models never share a cache entry.
+
+        cache_dir : Optional[str]
+            Directory for the on-disk tier; embeddings are appended to `{cache_dir}/{model_key}/`
+            and memory-mapped on later runs. No disk tier when None. Appends take an exclusive
+            `flock` on `{cache_dir}/{model_key}/lock`, so several processes can share the directory
+            (on platforms without `fcntl` only one process may write to it).
+
+        max_memory_entries : int
+            Number of embeddings kept in the in-memory LRU tier
+
+        batch_size : int
+            Maximum number of missed sequences encoded in one forward pass
+        """
+        self.model = model
+        self.model_key = model_key or text_weights_hash(model)
+        self.max_memory_entries = max_memory_entries
+        self.batch_size = batch_size
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[bytes, torch.Tensor]" = OrderedDict()
+        self._disk_dir = None
+        self._disk_rows: Dict[bytes, int] = {}
+        self._disk_embeddings: Optional[np.memmap] = None
+        self._dim = None
+        self._dtype = None
+        if cache_dir is not None:
+            self._disk_dir = os.path.join(cache_dir, self.model_key)
+            os.makedirs(self._disk_dir, exist_ok=True)
+            self._open_disk()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._disk_dir, name)
+
+    def _open_disk(self, truncate: bool = False):
+        if not os.path.isfile(self._path("meta.json")):
+            return
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        self._dim, self._dtype = meta["dim"], np.dtype(meta["dtype"])
+        row_bytes = self._dim * self._dtype.itemsize
+
+        # rows are written before their keys, so the first len(keys) rows are complete; rows past
+        # that were left by an interrupted append (or are being written by another process)
+        keys = np.fromfile(self._path("keys.bin"), dtype=np.uint8) if os.path.isfile(self._path("keys.bin")) else np.zeros(0, np.uint8)
+        rows = os.path.getsize(self._path("embeddings.bin")) // row_bytes if os.path.isfile(self._path("embeddings.bin")) else 0
+        count = min(len(keys) // self.KEY_BYTES, rows)
+        if truncate:
+            # only under the append lock: drop uncommitted rows so the next row lands at index `count`
+            for name, size in (("keys.bin", count * self.KEY_BYTES), ("embeddings.bin", count * row_bytes)):
+                if os.path.isfile(self._path(name)) and os.path.getsize(self._path(name)) > size:
+                    os.truncate(self._path(name), size)
+        keys = keys[:count * self.KEY_BYTES].reshape(count, self.KEY_BYTES)
+        self._disk_rows = {key.tobytes(): row for row, key in enumerate(keys)}
+        self._map_disk(count)
+
+    def _map_disk(self, count: int):
+        self._disk_embeddings = None
+        if count:
+            self._disk_embeddings = np.memmap(self._path("embeddings.bin"), dtype=self._dtype, mode="r", shape=(count, self._dim))
+
+    @contextmanager
+    def _append_lock(self):
+        with open(self._path("lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _append_disk(self, keys: List[bytes], embeddings: torch.Tensor):
+        array = embeddings.detach().cpu().numpy()
+        with self._append_lock():
+            # pick up rows appended by other processes since the last read
+            self._open_disk(truncate=True)
+            if self._dim is None:
+                self._dim, self._dtype = array.shape[1], array.dtype
+                with open(self._path("meta.json"), "w") as f:
+                    json.dump({"dim": self._dim, "dtype": self._dtype.name}, f)
+            new = [row for row, key in enumerate(keys) if key not in self._disk_rows]
+            if not new:
+                return
+            array = np.ascontiguousarray(array[new], dtype=self._dtype)
+
+            start = len(self._disk_rows)
+            with open(self._path("embeddings.bin"), "ab") as f:
+                f.write(array.tobytes())
+            with open(self._path("keys.bin"), "ab") as f:
+                f.write(b"".join(keys[row] for row in new))
+            for offset, row in enumerate(new):
+                self._disk_rows[keys[row]] = start + offset
+        self._map_disk(len(self._disk_rows))
+
+    def _remember(self, key: bytes, embedding: torch.Tensor):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    @torch.no_grad()
+    def encode(self, text: torch.Tensor) -> torch.Tensor:
+        """
+        Drop-in replacement for `model.encode_text(text)`
+
+        Each distinct token sequence is looked up in memory, then on disk; the remaining
+        misses are deduplicated and encoded together in forward passes of up to `batch_size`.
+
+        Parameters
+        ----------
+        text : torch.Tensor
+            Token ids returned by `clip.tokenize()`, shape = [batch_size, context_length]
+
+        Returns
+        -------
+        The text features, shape = [batch_size, embed_dim], on the device of `text`
+        """
+        cpu_text = text.cpu()
+        keys = [_token_key(tokens) for tokens in cpu_text]
+        found: Dict[bytes, torch.Tensor] = {}
+        missed: Dict[bytes, int] = {}
+        for row, key in enumerate(keys):
+            if key in found or key in missed:
+                # repeated within this call: encoded (or looked up) only once
+                self.memory_hits += 1
+                continue
+            if key in self._memory:
+                self.memory_hits += 1
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+            elif key in self._disk_rows:
+                self.disk_hits += 1
+                found[key] = torch.from_numpy(np.array(self._disk_embeddings[self._disk_rows[key]]))
+                self._remember(key, found[key])
+            else:
+                self.misses += 1
+                missed[key] = row
+
+        if missed:
+            missed_keys = list(missed)
+            rows = [missed[key] for key in missed_keys]
+            outputs = []
+            for start in range(0, len(rows), self.batch_size):
+                outputs.append(self.model.encode_text(text[rows[start:start + self.batch_size]]).cpu())
+            encoded = torch.cat(outputs)
+            if self._disk_dir is not None:
+                self._append_disk(missed_keys, encoded)
+            for key, embedding in zip(missed_keys, encoded):
+                found[key] = embedding.clone()
+                self._remember(key, found[key])
+
+        return torch.stack([found[key] for key in keys]).to(text.device)
+
+    def encode_texts(self, texts: Union[str, List[str]], context_length: int = 77, truncate: bool = True) -> torch.Tensor:
+        """Tokenizes `texts` and returns their (cached) text features"""
+        return self.encode(tokenize(texts, context_length=context_length, truncate=truncate))
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk_rows),
+        }
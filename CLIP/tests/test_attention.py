@@ -0,0 +1,72 @@
+import pytest
+import torch
+
+import clip
+from clip.model import CLIP, ResidualAttentionBlock, set_attention_backend
+
+pytestmark = pytest.mark.skipif(not hasattr(torch.nn.functional, "scaled_dot_product_attention"),
+                                reason="scaled_dot_product_attention requires PyTorch 2.0")
+
+
+def small_clip(vision_layers):
+    torch.manual_seed(0)
+    return CLIP(embed_dim=32, image_resolution=64, vision_layers=vision_layers, vision_width=64,
+                vision_patch_size=16, context_length=77, vocab_size=49408,
+                transformer_width=64, transformer_heads=4, transformer_layers=2).eval()
+
+
+@pytest.mark.parametrize("vision_layers", [2, (1, 1, 1, 1)])
+def test_sdpa_matches_multihead_attention(vision_layers):
+    model = small_clip(vision_layers)
+    image = torch.randn(3, 3, 64, 64)
+    text = clip.tokenize(["a diagram", "a dog sitting on a red couch", "a cat"])
+
+    with torch.no_grad():
+        set_attention_backend(model, "mha")
+        mha_image, mha_text = model.encode_image(image), model.encode_text(text)
+        set_attention_backend(model, "sdpa")
+        sdpa_image, sdpa_text = model.encode_image(image), model.encode_text(text)
+
+    assert torch.allclose(mha_image, sdpa_image, atol=1e-5, rtol=1e-4)
+    assert torch.allclose(mha_text, sdpa_text, atol=1e-5, rtol=1e-4)
+
+
+def test_text_mask_is_causal_and_not_reassigned():
+    model = small_clip(2)
+    block = model.transformer.resblocks[0]
+    mask = block.attn_mask
+    with torch.no_grad():
+        model.encode_text(clip.tokenize(["a dog"]))
+    assert block.attn_mask is mask
+    assert block._mask_is_causal
+
+
+def test_sdpa_with_custom_mask():
+    torch.manual_seed(0)
+    mask = torch.zeros(5, 5)
+    mask[:, 3] = float("-inf")
+    block = ResidualAttentionBlock(64, 4, attn_mask=mask).eval()
+    x = torch.randn(5, 2, 64)
+
+    with torch.no_grad():
+        block.use_sdpa = False
+        expected = block(x)
+        block.use_sdpa = True
+        actual = block(x)
+
+    assert not block._mask_is_causal
+    assert torch.allclose(expected, actual, atol=1e-5, rtol=1e-4)
+
+
+def test_multihead_attention_is_the_default_backend():
+    model = small_clip(2)
+    assert not any(block.use_sdpa for block in model.modules() if isinstance(block, ResidualAttentionBlock))
+
+
+def test_attn_mask_is_a_shared_non_persistent_buffer():
+    model = small_clip(2)
+    assert not any(key.endswith("attn_mask") for key in model.state_dict())
+
+    model.share_memory()
+    for block in model.transformer.resblocks:
+        assert block.attn_mask.is_shared()
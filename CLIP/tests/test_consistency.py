@@ -23,3 +23,24 @@ def test_consistency(model_name):
         py_probs = logits_per_image.softmax(dim=-1).cpu().numpy()
 
     assert np.allclose(jit_probs, py_probs, atol=0.01, rtol=0.1)
+
+
+@pytest.mark.skipif(not hasattr(torch.nn.functional, "scaled_dot_product_attention"),
+                    reason="int8 quantization uses the sdpa attention path (PyTorch 2.0)")
+@pytest.mark.parametrize('model_name', clip.available_models())
+def test_int8_consistency(model_name):
+    device = "cpu"
+    float_model, transform = clip.load(model_name, device=device)
+    int8_model, _ = clip.load(model_name, device=device, quantize="int8")
+
+    image = transform(Image.open("CLIP.png")).unsqueeze(0).to(device)
+    text = clip.tokenize(["a diagram", "a dog", "a cat"]).to(device)
+
+    with torch.no_grad():
+        logits_per_image, _ = float_model(image, text)
+        float_probs = logits_per_image.softmax(dim=-1).cpu().numpy()
+
+        logits_per_image, _ = int8_model(image, text)
+        int8_probs = logits_per_image.softmax(dim=-1).cpu().numpy()
+
+    assert np.allclose(float_probs, int8_probs, atol=0.05)
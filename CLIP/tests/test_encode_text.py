@@ -0,0 +1,48 @@
+import pytest
+import torch
+
+import clip
+from clip.model import CLIP, set_attention_backend
+
+BACKENDS = ["mha"] + (["sdpa"] if hasattr(torch.nn.functional, "scaled_dot_product_attention") else [])
+
+
+def full_context_encode_text(model, text):
+    # encode_text without trimming the padding after the last EOT token
+    x = model.token_embedding(text).type(model.dtype)
+    x = x + model.positional_embedding.type(model.dtype)
+    x = x.permute(1, 0, 2)
+    x = model.transformer(x)
+    x = x.permute(1, 0, 2)
+    x = model.ln_final(x).type(model.dtype)
+    return x[torch.arange(x.shape[0]), text.argmax(dim=-1)] @ model.text_projection
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_trimmed_encode_text_matches_full_context(backend):
+    torch.manual_seed(0)
+    model = CLIP(embed_dim=32, image_resolution=64, vision_layers=2, vision_width=64,
+                 vision_patch_size=16, context_length=77, vocab_size=49408,
+                 transformer_width=64, transformer_heads=4, transformer_layers=3).eval()
+    set_attention_backend(model, backend)
+    texts = ["a dog", "a red couch in a living room with a cat sleeping on it", "", " ".join(["dog"] * 100)]
+
+    with torch.no_grad():
+        for batch in (texts[:1], texts[:3], texts):
+            text = clip.tokenize(batch, truncate=True)
+            trimmed = model.encode_text(text)
+            full = full_context_encode_text(model, text)
+            # not bit-identical: the shorter sequence changes the matmul/softmax reduction shapes
+            assert torch.allclose(trimmed, full, atol=1e-5, rtol=1e-4)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_empty_batch(backend):
+    model = CLIP(embed_dim=32, image_resolution=64, vision_layers=2, vision_width=64,
+                 vision_patch_size=16, context_length=77, vocab_size=49408,
+                 transformer_width=64, transformer_heads=4, transformer_layers=2).eval()
+    set_attention_backend(model, backend)
+
+    with torch.no_grad():
+        features = model.encode_text(torch.zeros(0, 77, dtype=torch.long))
+    assert features.shape == (0, 32)
@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+CLIP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# extra seconds `import clip` may take on top of `import torch`
+IMPORT_BUDGET = 1.0
+
+
+def run_python(code):
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=CLIP_ROOT)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def test_light_entry_points_skip_heavy_modules():
+    result = run_python(
+        "import json, sys\n"
+        "import torch\n"
+        "baseline = set(sys.modules)\n"
+        "import clip, hubconf\n"
+        "clip.available_models()\n"
+        "clip.tokenize(['a diagram', 'a dog'])\n"
+        "loaded = set(sys.modules) - baseline\n"
+        "print(json.dumps(sorted(m for m in loaded if m.split('.')[0] in ('torchvision', 'tqdm') or m == 'clip.model')))\n"
+    )
+    assert result == []
+
+
+def test_import_time_budget():
+    result = run_python(
+        "import json, time\n"
+        "start = time.perf_counter()\n"
+        "import torch\n"
+        "middle = time.perf_counter()\n"
+        "import clip\n"
+        "end = time.perf_counter()\n"
+        "print(json.dumps({'torch': middle - start, 'clip': end - middle}))\n"
+    )
+    assert result["clip"] < IMPORT_BUDGET, result
+
+
+def test_transform_loads_on_first_use():
+    result = run_python(
+        "import json, sys\n"
+        "import clip\n"
+        "before = 'torchvision' in sys.modules\n"
+        "preprocess = clip.clip._transform(224)\n"
+        "print(json.dumps([before, 'torchvision' in sys.modules, type(preprocess).__name__]))\n"
+    )
+    assert result == [False, True, "Compose"]
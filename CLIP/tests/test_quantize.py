@@ -0,0 +1,81 @@
+import os
+
+import pytest
+import torch
+
+import clip
+from clip.model import CLIP, convert_weights
+
+pytestmark = pytest.mark.skipif(not hasattr(torch.nn.functional, "scaled_dot_product_attention"),
+                                reason="int8 quantization uses the sdpa attention path (PyTorch 2.0)")
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    torch.manual_seed(0)
+    model = CLIP(embed_dim=32, image_resolution=64, vision_layers=2, vision_width=64,
+                 vision_patch_size=16, context_length=77, vocab_size=49408,
+                 transformer_width=64, transformer_heads=4, transformer_layers=2)
+    convert_weights(model)
+    path = str(tmp_path / "small.pt")
+    torch.save(model.state_dict(), path)
+    return path
+
+
+def encode(model, text):
+    with torch.no_grad():
+        return model.encode_image(torch.ones(2, 3, 64, 64)), model.encode_text(text)
+
+
+def test_int8_is_close_to_float(checkpoint):
+    float_model, _ = clip.load(checkpoint, device="cpu")
+    int8_model, _ = clip.load(checkpoint, device="cpu", quantize="int8")
+    text = clip.tokenize(["a diagram", "a dog", "a cat"])
+
+    for expected, actual in zip(encode(float_model, text), encode(int8_model, text)):
+        assert torch.nn.functional.cosine_similarity(expected, actual).min() > 0.99
+
+
+def test_int8_cache_holds_tensors_only_and_round_trips(checkpoint, monkeypatch):
+    first, _ = clip.load(checkpoint, device="cpu", quantize="int8")
+    cache_path = checkpoint + ".int8.pt"
+    cached = torch.load(cache_path, weights_only=True)
+    assert not any(isinstance(value, torch.nn.Module) for value in cached.values())
+
+    # a cache hit must not quantize again
+    monkeypatch.setattr("torch.ao.quantization.quantize_dynamic",
+                        lambda *args, **kwargs: pytest.fail("quantized again on a cache hit"))
+    second, _ = clip.load(checkpoint, device="cpu", quantize="int8")
+
+    text = clip.tokenize(["a dog"])
+    for expected, actual in zip(encode(first, text), encode(second, text)):
+        assert torch.equal(expected, actual)
+
+
+def test_int8_cache_is_rebuilt_for_a_new_checkpoint(checkpoint):
+    clip.load(checkpoint, device="cpu", quantize="int8")
+    cache_path = checkpoint + ".int8.pt"
+    stamp = os.stat(cache_path).st_mtime_ns
+
+    state_dict = torch.load(checkpoint)
+    state_dict["text_projection"] = state_dict["text_projection"] * 2
+    torch.save(state_dict, checkpoint)
+    model, _ = clip.load(checkpoint, device="cpu", quantize="int8")
+
+    assert os.stat(cache_path).st_mtime_ns != stamp
+    assert torch.equal(model.text_projection, state_dict["text_projection"].float())
+
+
+def test_text_cache_on_int8_model(checkpoint, tmp_path):
+    float_model, _ = clip.load(checkpoint, device="cpu")
+    int8_model, _ = clip.load(checkpoint, device="cpu", quantize="int8")
+
+    cache = clip.TextEmbeddingCache(int8_model, cache_dir=str(tmp_path / "text"))
+    assert cache.model_key != clip.TextEmbeddingCache(float_model).model_key
+    assert torch.equal(cache.encode_texts(["a dog", "a cat"]), encode(int8_model, clip.tokenize(["a dog", "a cat"]))[1])
+
+
+def test_int8_requires_sdpa(checkpoint, monkeypatch):
+    monkeypatch.setattr("clip.model._SDPA_AVAILABLE", False)
+    with pytest.raises(RuntimeError, match="PyTorch 2.0"):
+        clip.load(checkpoint, device="cpu", quantize="int8")
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from clip.simple_tokenizer import SimpleTokenizer, basic_clean, get_pairs, whitespace_clean
+
+
+def reference_bpe(bpe_ranks, token):
+    """The original SimpleTokenizer.bpe merge loop, without the cache"""
+    word = tuple(token[:-1]) + (token[-1] + '</w>',)
+    pairs = get_pairs(word)
+
+    if not pairs:
+        return token+'</w>'
+
+    while True:
+        bigram = min(pairs, key=lambda pair: bpe_ranks.get(pair, float('inf')))
+        if bigram not in bpe_ranks:
+            break
+        first, second = bigram
+        new_word = []
+        i = 0
+        while i < len(word):
+            try:
+                j = word.index(first, i)
+                new_word.extend(word[i:j])
+                i = j
+            except ValueError:
+                new_word.extend(word[i:])
+                break
+
+            if word[i] == first and i < len(word)-1 and word[i+1] == second:
+                new_word.append(first+second)
+                i += 2
+            else:
+                new_word.append(word[i])
+                i += 1
+        word = tuple(new_word)
+        if len(word) == 1:
+            break
+        else:
+            pairs = get_pairs(word)
+    return ' '.join(word)
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return SimpleTokenizer()
+
+
+def random_tokens(tokenizer, count, seed=0):
+    rng = random.Random(seed)
+    pieces = [''.join(merge) for merge in tokenizer.bpe_ranks]
+    alphabet = list(tokenizer.byte_encoder.values())
+    tokens = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.5:
+            # words stitched together from vocabulary pieces
+            token = ''.join(rng.choice(pieces).replace('</w>', '') for _ in range(rng.randint(1, 4)))
+        elif kind < 0.8:
+            # arbitrary byte-level symbols
+            token = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 16)))
+        else:
+            # long runs of repeated symbols exercise overlapping pairs
+            token = rng.choice(alphabet[:30]) * rng.randint(1, 12) + rng.choice(alphabet[:30]) * rng.randint(0, 12)
+        tokens.append(token or 'a')
+    return tokens
+
+
+def test_bpe_matches_reference(tokenizer):
+    for token in random_tokens(tokenizer, 50000):
+        assert tokenizer.bpe(token) == reference_bpe(tokenizer.bpe_ranks, token), token
+
+
+def test_encode_matches_reference():
+    tokenizer = SimpleTokenizer(cache_size=128)
+    rng = random.Random(1)
+    words = [''.join(merge).replace('</w>', '') for merge in list(tokenizer.bpe_ranks)[::7]]
+    for _ in range(2000):
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 20)))
+        text = rng.choice(['', '<|startoftext|>']) + text + rng.choice(['', '!?', ' 123', '<|endoftext|>'])
+        expected = []
+        for token in tokenizer.pat.findall(whitespace_clean(basic_clean(text)).lower()):
+            token = ''.join(tokenizer.byte_encoder[b] for b in token.encode('utf-8'))
+            if token in tokenizer.special_tokens:
+                bpe = token
+            else:
+                bpe = reference_bpe(tokenizer.bpe_ranks, token)
+            expected.extend(tokenizer.encoder[piece] for piece in bpe.split(' '))
+        assert tokenizer.encode(text) == expected, text
+
+
+def test_cache_is_bounded():
+    tokenizer = SimpleTokenizer(cache_size=4)
+    for token in ["cat", "dog", "bird", "tree", "car", "cat"]:
+        tokenizer.bpe(token)
+    info = tokenizer.cache_info()
+    assert info["size"] == 4
+    assert info["misses"] == 6
+    assert info["hits"] == 0
+    tokenizer.bpe("cat")
+    assert tokenizer.cache_info()["hits"] == 1
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import torch
+
+import clip
+from clip.model import CLIP
+
+
+def small_clip():
+    torch.manual_seed(0)
+    return CLIP(embed_dim=32, image_resolution=64, vision_layers=2, vision_width=64,
+                vision_patch_size=16, context_length=77, vocab_size=49408,
+                transformer_width=64, transformer_heads=4, transformer_layers=2).eval()
+
+
+def reference(model, texts):
+    with torch.no_grad():
+        return model.encode_text(clip.tokenize(texts))
+
+
+def test_interrupted_append_is_discarded_on_reopen(tmp_path):
+    model = small_clip()
+    cache = clip.TextEmbeddingCache(model, model_key="k", cache_dir=str(tmp_path))
+    cache.encode_texts(["a dog", "a cat"])
+
+    # a row written without its key, as left behind by a crash in the middle of an append
+    with open(os.path.join(tmp_path, "k", "embeddings.bin"), "ab") as f:
+        f.write(np.full(32, 7, np.float32).tobytes())
+
+    clip.TextEmbeddingCache(model, model_key="k", cache_dir=str(tmp_path)).encode_texts(["a bird"])
+
+    reopened = clip.TextEmbeddingCache(model, model_key="k", cache_dir=str(tmp_path))
+    features = reopened.encode_texts(["a dog", "a cat", "a bird"])
+    assert reopened.stats()["disk_hits"] == 3
+    assert torch.allclose(features, reference(model, ["a dog", "a cat", "a bird"]), atol=1e-6)
+
+
+def test_writers_sharing_a_directory_stay_aligned(tmp_path):
+    model = small_clip()
+    first = clip.TextEmbeddingCache(model, model_key="k", cache_dir=str(tmp_path))
+    second = clip.TextEmbeddingCache(model, model_key="k", cache_dir=str(tmp_path))
+    first.encode_texts(["a dog"])
+    second.encode_texts(["a cat", "a dog"])
+    first.encode_texts(["a bird"])
+
+    reopened = clip.TextEmbeddingCache(model, model_key="k", cache_dir=str(tmp_path))
+    features = reopened.encode_texts(["a dog", "a cat", "a bird"])
+    assert reopened.stats()["disk_entries"] == 3
+    assert torch.allclose(features, reference(model, ["a dog", "a cat", "a bird"]), atol=1e-6)
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+import torch
+
+import clip
+
+
+def random_texts(count, max_words):
+    rng = random.Random(0)
+    words = "a dog cat couch red blue green sitting on the of in with person man woman tree 🙂 naïve".split()
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(0, max_words))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_matches_tokenize(processes):
+    texts = random_texts(10000, 90)
+    tokens, lengths, truncated = clip.tokenize_batch(texts, chunksize=1000, processes=processes)
+    expected = clip.tokenize(texts, truncate=True)
+
+    assert tokens.shape == expected.shape
+    assert torch.equal(tokens.long(), expected.long())
+    assert torch.equal(lengths.long(), (expected != 0).sum(dim=1))
+    assert truncated.any()
+
+
+def test_overlong_texts_are_truncated_and_flagged():
+    texts = ["a dog", " ".join(["dog"] * 200), ""]
+    tokens, lengths, truncated = clip.tokenize_batch(texts)
+    eot = clip.tokenize("")[0, 1]
+
+    assert truncated.tolist() == [False, True, False]
+    assert lengths.tolist()[1] == 77
+    assert tokens[1, -1] == eot
+    assert torch.equal(tokens.long(), clip.tokenize(texts, truncate=True).long())
+    with pytest.raises(RuntimeError):
+        clip.tokenize(texts)
+
+
+def test_empty_input():
+    tokens, lengths, truncated = clip.tokenize_batch([])
+    assert tokens.shape == (0, 77)
+    assert lengths.shape == (0,)
+    assert truncated.shape == (0,)
@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+from tqdm import tqdm
+
+from generate_image_categories import generate_categories_prompt, parse_category
+from process_image_data import (
+    PROCESSED_JSON,
+    RESULT_SEGMENT_DIR,
+    MANIFEST_DB,
+    SYSTEM_PROMPT,
+    load_data,
+    build_region_record,
+    sync_manifest,
+    export_results
+)
+from select_image_caption import select_image_caption_prompt
+from utils import Manifest, ResultStore
+from utils.manifest import DONE
+from utils.batch import BatchWriter, build_batch_request, iter_batch_results, make_custom_id, parse_custom_id
+from utils.gpt import build_messages
+
+'''
+Batch API 용 요청 파일 생성 및 결과 반영
+
+1. caption 선택 요청 생성:  python batch_requests.py caption
+2. category 선택 요청 생성: python batch_requests.py category
+3. 결과 반영:               python batch_requests.py ingest <결과 jsonl> ...
+
+custom_id 형태: {task}/{vgid}/{region_id} (예: caption/2333448/2333448_0)
+
+제출된 region 은 manifest 에 submitted 로 기록되며 (category 는 submissions 테이블), batch 가
+만료/실패/유실되어 SUBMITTED_TIMEOUT (utils/manifest.py) 안에 결과가 반영되지 않으면 다시 요청 대상이 됨
+그 사이 다른 경로로 이미 done 이 된 region 의 늦게 도착한 caption 결과는 반영하지 않음
+'''
+
+# 경로 설정
+BATCH_DIR = "/home/cwhjpaper/data/batch"
+
+CAPTION_TASK = "caption"
+CATEGORY_TASK = "category"
+
+# caption 선택이 남은 region 을 batch 요청으로 작성
+# caption 이 하나뿐인 region 은 요청 없이 바로 저장
+def write_caption_batch(model="gpt-4o", max_tokens=1000):
+    manifest = Manifest(MANIFEST_DB)
+    store = ResultStore(RESULT_SEGMENT_DIR)
+    sync_manifest(manifest)
+
+    with BatchWriter(os.path.join(BATCH_DIR, CAPTION_TASK)) as writer:
+        for json_file, pending_region_ids in tqdm(manifest.outstanding()):
+            vgid, region_ids, captions, _, images = load_data(json_file, pending_region_ids)
+            if vgid is None:
+                continue
+            for idx, region_id in enumerate(region_ids):
+                if len(captions[idx]) > 1:
+                    messages = build_messages(select_image_caption_prompt(captions[idx]), images[idx], SYSTEM_PROMPT)
+                    writer.write(build_batch_request(make_custom_id(CAPTION_TASK, vgid, region_id),
+                                                     messages, max_tokens=max_tokens, model=model))
+                    manifest.mark_submitted(vgid, region_id)
+                else:
+                    store.append(vgid, region_id, build_region_record(captions[idx], None))
+                    manifest.mark_done(vgid, region_id)
+
+    print("batch files:", writer.paths)
+    return writer.paths
+
+# caption 은 선택되었지만 category 가 비어 있는 region 을 batch 요청으로 작성
+# 이미 제출되어 결과를 기다리는 region 은 다시 요청하지 않음
+def write_category_batch(model="gpt-4o", max_tokens=1000):
+    manifest = Manifest(MANIFEST_DB)
+    save_data = ResultStore(RESULT_SEGMENT_DIR).merged(PROCESSED_JSON)
+    submitted = manifest.task_submitted(CATEGORY_TASK)
+    written = []
+
+    with BatchWriter(os.path.join(BATCH_DIR, CATEGORY_TASK)) as writer:
+        for vgid, regions in tqdm(save_data.items()):
+            for region_id, region in regions.items():
+                if not region.get("caption") or region.get("category") or (vgid, region_id) in submitted:
+                    continue
+                messages = build_messages(generate_categories_prompt(region["caption"], None), None, SYSTEM_PROMPT)
+                writer.write(build_batch_request(make_custom_id(CATEGORY_TASK, vgid, region_id),
+                                                 messages, max_tokens=max_tokens, model=model))
+                written.append((vgid, region_id))
+    manifest.mark_task_submitted(CATEGORY_TASK, written)
+
+    print("batch files:", writer.paths)
+    return writer.paths
+
+# Batch API 결과 파일들을 결과 저장소에 반영
+def ingest_batch_results(result_paths):
+    manifest = Manifest(MANIFEST_DB)
+    store = ResultStore(RESULT_SEGMENT_DIR)
+    errors = []
+
+    # caption 결과는 원본 caption 목록이 필요하므로 raw JSON 파일별로 묶어서 한 번씩만 읽음
+    caption_results = {}
+    for path in result_paths:
+        for custom_id, response, error in iter_batch_results(path):
+            try:
+                task, vgid, region_id = parse_custom_id(custom_id)
+            except (AttributeError, ValueError):
+                errors.append({"custom_id": custom_id, "error": error or "unknown custom_id"})
+                continue
+            if task == CAPTION_TASK and manifest.status(vgid, region_id) == DONE:
+                continue
+            if task == CATEGORY_TASK:
+                manifest.clear_task_submitted(task, vgid, region_id)
+            if response is None:
+                errors.append({"custom_id": custom_id, "error": error})
+                if task == CAPTION_TASK:
+                    manifest.mark_failed(vgid, region_id, error)
+                continue
+
+            if task == CAPTION_TASK:
+                json_file = manifest.lookup_file(vgid, region_id)
+                if json_file is None:
+                    errors.append({"custom_id": custom_id, "error": "region not in manifest"})
+                    continue
+                caption_results.setdefault(json_file, []).append((vgid, region_id, response))
+            elif task == CATEGORY_TASK:
+                category = parse_category(response)
+                if category is None:
+                    errors.append({"custom_id": custom_id, "error": "unknown category", "response": response})
+                    continue
+                store.append(vgid, region_id, {"category": category})
+
+    for json_file, results in tqdm(caption_results.items()):
+        _, region_ids, captions, _, _ = load_data(json_file, [region_id for _, region_id, _ in results])
+        captions_by_region = dict(zip(region_ids or [], captions or []))
+        for vgid, region_id, response in results:
+            # 같은 region 의 결과가 여러 파일에 있으면 처음 반영된 결과만 사용
+            if manifest.status(vgid, region_id) == DONE:
+                continue
+            try:
+                store.append(vgid, region_id, build_region_record(captions_by_region[region_id], response))
+                manifest.mark_done(vgid, region_id)
+            except Exception:
+                errors.append({"custom_id": make_custom_id(CAPTION_TASK, vgid, region_id),
+                               "error": "invalid answer", "response": response})
+                manifest.mark_failed(vgid, region_id, response)
+
+    export_results()
+    if errors:
+        os.makedirs(BATCH_DIR, exist_ok=True)
+        error_path = os.path.join(BATCH_DIR, "ingest_errors.json")
+        with open(error_path, "w", encoding="utf-8") as error_file:
+            json.dump(errors, error_file, ensure_ascii=False, indent=4)
+        print(f"{len(errors)} errors saved to {error_path}")
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=[CAPTION_TASK, CATEGORY_TASK, "ingest"])
+    parser.add_argument("results", nargs="*", help="ingest 할 Batch API 결과 jsonl 파일들")
+    args = parser.parse_args()
+
+    if args.mode == CAPTION_TASK:
+        write_caption_batch()
+    elif args.mode == CATEGORY_TASK:
+        write_category_batch()
+    else:
+        ingest_batch_results(args.results)
+
+if __name__ == "__main__":
+    main()
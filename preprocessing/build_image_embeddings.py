@@ -0,0 +1,62 @@
+import os
+
+import clip
+import torch
+
+from process_image_data import (
+    CROP_PADDING,
+    CROPPED_IMAGE_DIR,
+    IMAGE_DIR,
+    RAW_JSON_DIR,
+    USE_CROP_PROVIDER,
+    read_raw_regions
+)
+from utils.clip_scoring import embed_regions
+from utils.embedding_store import EmbeddingStore
+
+'''
+모든 region crop 의 CLIP 이미지 임베딩을 한 번 계산해서 EMBEDDING_DIR 에 저장하는 파일
+
+이미 저장된 (vgid, region_id) 는 건너뛰므로 새 데이터가 추가되면 다시 실행해서 이어 붙이면 됨
+실험 코드에서는 EmbeddingStore(EMBEDDING_DIR).tensor() 로 모델 없이 바로 사용
+'''
+
+# 경로 설정
+EMBEDDING_DIR = "/home/cwhjpaper/data/embeddings/clip_vit_b32"
+
+# CLIP 설정
+CLIP_MODEL = "ViT-B/32"
+BATCH_SIZE = 256
+NUM_WORKERS = None  # None 이면 cpu_count() - 1
+NORMALIZE = True
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+def main():
+    store = EmbeddingStore(EMBEDDING_DIR, normalize=NORMALIZE)
+
+    items = []
+    for json_file in sorted(f for f in os.listdir(RAW_JSON_DIR) if f.endswith('.json')):
+        try:
+            vgid, regions = read_raw_regions(json_file)
+        except Exception:
+            print(f"Error loading {json_file}")
+            continue
+        items.extend((vgid, region) for region in regions if (vgid, region["id"]) not in store)
+    print(f"{len(store)} stored, {len(items)} regions to embed")
+    if not items:
+        return
+
+    model, preprocess = clip.load(CLIP_MODEL, device=device)
+    model.eval()
+    added = embed_regions(model, preprocess, items, store,
+                          crop_dir=None if USE_CROP_PROVIDER else CROPPED_IMAGE_DIR,
+                          image_dir=IMAGE_DIR,
+                          padding=CROP_PADDING,
+                          batch_size=BATCH_SIZE,
+                          num_workers=NUM_WORKERS,
+                          device=device)
+    print(f"{added} embeddings added to {EMBEDDING_DIR} ({len(store)} total)")
+
+if __name__ == "__main__":
+    main()
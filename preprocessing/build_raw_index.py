@@ -0,0 +1,22 @@
+import time
+
+from utils import RawIndex
+
+'''
+RAW_JSON_DIR 의 raw JSON 파일들을 한 번 읽어서 컬럼 인덱스(RAW_INDEX_DIR)를 만드는 파일
+
+이후 단계에서는 USE_RAW_INDEX = True 로 설정하면 raw JSON 을 다시 파싱하지 않고
+memory-map 된 인덱스에서 vgid / region_id 로 region 정보를 조회함
+'''
+
+# 경로 설정
+RAW_JSON_DIR = "/home/cwhjpaper/data/json/raw"
+RAW_INDEX_DIR = "/home/cwhjpaper/data/json/raw_index"
+
+def main():
+    start = time.time()
+    index = RawIndex.build(RAW_JSON_DIR, RAW_INDEX_DIR)
+    print(f"{len(index)} regions indexed to {RAW_INDEX_DIR} ({time.time() - start:.1f}s)")
+
+if __name__ == "__main__":
+    main()
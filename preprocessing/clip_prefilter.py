@@ -0,0 +1,166 @@
+import json
+import os
+from tqdm import tqdm
+
+import clip
+import numpy as np
+import torch
+
+from process_image_data import (
+    CROP_PADDING,
+    CROPPED_IMAGE_DIR,
+    IMAGE_DIR,
+    MANIFEST_DB,
+    RESULT_SEGMENT_DIR,
+    USE_CROP_PROVIDER,
+    build_region_record,
+    read_raw_regions,
+    sync_manifest
+)
+from utils import Manifest, ResultStore
+from utils.clip_scoring import score_regions
+
+'''
+GPT 요청 전에 CLIP 으로 caption 을 먼저 골라 보는 단계
+
+1. 남은 region 마다 crop 이미지와 후보 caption 들을 CLIP 으로 점수화 (utils/clip_scoring.py, 결과는 CLIP_SCORES_DIR)
+2. 1등과 2등 caption 확률 차이(margin)가 MARGIN_THRESHOLD 이상이면 1등 caption 을 바로 저장하고 manifest 에 완료 표시
+3. margin 이 작은 region 만 pending 으로 남아서 process_image_data.py 의 GPT 단계로 넘어감
+
+모든 판단(확률, margin, 자동 선택 여부)은 PREFILTER_LOG_PATH 에 jsonl 로 남기므로 threshold 조정에 사용할 수 있음
+판단은 점수화 배치마다 바로 저장되므로 중간에 중단해도 다시 실행하면 남은 region 부터 이어서 진행
+'''
+
+# 경로 설정
+PREFILTER_LOG_PATH = "/home/cwhjpaper/data/json/processed/clip_prefilter_log.jsonl"
+CLIP_SCORES_DIR = "/home/cwhjpaper/data/clip_scores"
+TEXT_CACHE_DIR = "/home/cwhjpaper/data/cache/clip_text"
+
+# CLIP 설정
+CLIP_MODEL = "ViT-B/32"
+MARGIN_THRESHOLD = 0.6
+BATCH_SIZE = 256
+NUM_WORKERS = None  # None 이면 cpu_count() - 1
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+# 이미 점수화한 region (재실행 시 GPT 로 넘긴 region 을 다시 점수화하지 않음)
+def load_scored_keys():
+    scored = set()
+    if not os.path.exists(PREFILTER_LOG_PATH):
+        return scored
+    with open(PREFILTER_LOG_PATH, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                decision = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            scored.add((decision["vgid"], decision["region_id"]))
+    return scored
+
+# 1등 caption 의 index 와 1등-2등 확률 차이
+def top_margin(probs):
+    ranked = sorted(range(len(probs)), key=lambda idx: probs[idx], reverse=True)
+    return ranked[0], probs[ranked[0]] - probs[ranked[1]]
+
+# 남은 작업(tasks) 중 CLIP 으로 확실하게 고를 수 있는 region 을 처리하고, GPT 가 필요한 작업만 반환
+def prefilter_tasks(tasks, threshold=MARGIN_THRESHOLD):
+    scored = load_scored_keys()
+    remaining = {}
+    candidates = []
+    for json_file, pending_region_ids in tqdm(tasks, desc="clip"):
+        try:
+            vgid, regions = read_raw_regions(json_file)
+        except Exception:
+            remaining.setdefault(json_file, []).extend(pending_region_ids)
+            continue
+
+        pending = set(pending_region_ids)
+        for region in regions:
+            if region["id"] not in pending:
+                continue
+            # caption 이 하나뿐이거나 이미 점수화한 region 은 그대로 다음 단계로 넘김
+            if len(region["captions"]) < 2 or (vgid, region["id"]) in scored:
+                remaining.setdefault(json_file, []).append(region["id"])
+                continue
+            candidates.append((json_file, vgid, region))
+
+    if not candidates:
+        return list(remaining.items())
+
+    model, preprocess = clip.load(CLIP_MODEL, device=device)
+    model.eval()
+    # 같은 caption 이 여러 region 에 반복되므로 text feature 는 실행 간에도 재사용
+    text_cache = clip.TextEmbeddingCache(model, model_key=CLIP_MODEL.replace("/", "-"), cache_dir=TEXT_CACHE_DIR)
+
+    manifest = Manifest(MANIFEST_DB)
+    store = ResultStore(RESULT_SEGMENT_DIR)
+    accepted = 0
+    decided = set()
+    os.makedirs(os.path.dirname(PREFILTER_LOG_PATH), exist_ok=True)
+    log_file = open(PREFILTER_LOG_PATH, 'a', encoding='utf-8')
+
+    # 배치마다 판단을 바로 저장하므로 중간에 중단되어도 load_scored_keys 로 이어서 진행
+    def decide(rows, region_logits):
+        nonlocal accepted
+        for row, logits in zip(rows, region_logits):
+            json_file, vgid, region = candidates[row]
+            logits = np.asarray(logits, dtype=np.float64)
+            decided.add(row)
+            # crop 을 읽지 못한 region 은 기록하지 않고 GPT 단계로 넘김
+            if np.isnan(logits).any():
+                remaining.setdefault(json_file, []).append(region["id"])
+                continue
+
+            probs = np.exp(logits - logits.max())
+            probs = (probs / probs.sum()).tolist()
+            top, margin = top_margin(probs)
+            is_accepted = margin >= threshold
+            if is_accepted:
+                store.append(vgid, region["id"], build_region_record(region["captions"], str(top)))
+                manifest.mark_done(vgid, region["id"])
+                accepted += 1
+            else:
+                remaining.setdefault(json_file, []).append(region["id"])
+            log_file.write(json.dumps({"file": json_file,
+                                       "vgid": vgid,
+                                       "region_id": region["id"],
+                                       "probs": probs,
+                                       "top": top,
+                                       "margin": margin,
+                                       "accepted": is_accepted}, ensure_ascii=False) + "\n")
+        log_file.flush()
+
+    try:
+        scores = score_regions(model, preprocess,
+                               [(vgid, region) for _, vgid, region in candidates],
+                               CLIP_SCORES_DIR,
+                               crop_dir=None if USE_CROP_PROVIDER else CROPPED_IMAGE_DIR,
+                               image_dir=IMAGE_DIR,
+                               padding=CROP_PADDING,
+                               batch_size=BATCH_SIZE,
+                               num_workers=NUM_WORKERS,
+                               device=device,
+                               text_cache=text_cache,
+                               on_batch=decide)
+        # 이전 실행에서 점수화했지만 판단을 남기기 전에 중단된 region 과 읽지 못한 crop
+        rows = [row for row in range(len(candidates)) if row not in decided]
+        decide(rows, [scores.logits(row) for row in rows])
+    finally:
+        log_file.close()
+        store.close()
+        manifest.close()
+    print("text cache:", text_cache.stats())
+    print(f"CLIP prefilter: {accepted}/{len(candidates)} regions accepted (margin >= {threshold})")
+    return list(remaining.items())
+
+def main():
+    manifest = Manifest(MANIFEST_DB)
+    sync_manifest(manifest)
+    tasks = manifest.outstanding()
+    manifest.close()
+    remaining = prefilter_tasks(tasks)
+    print(f"{sum(len(region_ids) for _, region_ids in remaining)} regions left for GPT")
+
+if __name__ == "__main__":
+    main()
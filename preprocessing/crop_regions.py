@@ -0,0 +1,36 @@
+import json
+
+from utils.cropper import group_regions_by_vgid, crop_all_regions
+
+'''
+raw JSON 의 region bbox 로 CROPPED_IMAGE_DIR 를 (다시) 생성하기 위한 파일
+
+원본 이미지는 vgid 마다 한 번만 디코딩하고, 모든 region 을 padding 정책에 맞게 crop 하여
+프로세스 풀에서 저장함
+'''
+
+# 경로 설정
+RAW_JSON_DIR = "/home/cwhjpaper/data/json/raw"
+IMAGE_DIR = "/home/cwhjpaper/data/images"
+CROPPED_IMAGE_DIR = "/home/cwhjpaper/data/cropped_images"
+CROP_ERROR_LOG = "/home/cwhjpaper/data/json/processed/crop_errors_log.json"
+
+# crop 설정
+PADDING = 0            # region 마다 늘릴 픽셀 수 (이미지 경계에서 잘림)
+MAX_CROP_SIDE = None   # 저장할 crop 의 최대 변 길이 (지정하면 축소 디코딩 사용)
+JPEG_QUALITY = 75
+
+def main():
+    groups = group_regions_by_vgid(RAW_JSON_DIR)
+    print("Number of images: ", len(groups))
+
+    errors = crop_all_regions(groups, IMAGE_DIR, CROPPED_IMAGE_DIR,
+                              padding=PADDING, max_crop_side=MAX_CROP_SIDE, quality=JPEG_QUALITY)
+
+    if errors:
+        with open(CROP_ERROR_LOG, "w", encoding="utf-8") as error_file:
+            json.dump(errors, error_file, ensure_ascii=False, indent=4)
+        print(f"Errors saved to {CROP_ERROR_LOG}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
+import re
 import openai
 
+# 프롬프트의 [Categories] 번호 순서와 동일해야 함
+CATEGORIES = [
+    "person", "object", "artifact", "location", "substance", "group", "plant",
+    "animal", "body", "phenomenon", "food", "time", "event", "shape"
+]
+
 
 def generate_categories_prompt(caption, file_num, model="gpt-4o", temperature=0):
     """
@@ -50,3 +57,16 @@ def generate_categories_prompt(caption, file_num, model="gpt-4o", temperature=0)
     
     return prompt
 
+
+def parse_category(response):
+    """
+    @description
+    GPT 응답의 "Answer: 번호" 에서 category 이름을 찾아 반환하는 함수 (찾지 못하면 None)
+    """
+    match = re.search(r'Answer\s*:\s*(\d+)', response) or re.search(r'(\d+)', response)
+    if match is None:
+        return None
+    index = int(match.group(1)) - 1
+    if 0 <= index < len(CATEGORIES):
+        return CATEGORIES[index]
+    return None
@@ -1,9 +1,13 @@
 import os
 import json
-from PIL import Image
+from collections import defaultdict
+
+from utils.cropper import crop_image_regions
+from utils.raw_index import RawIndex
 
 API_KEYS_PATH = "api_keys.json"
 RAW_JSON_DIR = "/home/cwhjpaper/data/json/raw"
+RAW_INDEX_DIR = "/home/cwhjpaper/data/json/raw_index"
 IMAGE_DIR = "/home/cwhjpaper/data/images"
 CROPPED_IMAGE_DIR = "/home/cwhjpaper/data/cropped_images"
 IMAGE_DATA_JSON  = "/home/cwhjpaper/data/json/processed/image_metadata.json"
@@ -32,40 +36,51 @@ with open(ERROR_LOG_JSON, 'r', encoding='utf-8') as file:
     error_cases = json.load(file)
     print("Number of currunt error data: ", len(error_cases))
     
+# True 면 raw JSON 을 다시 읽지 않고 build_raw_index.py 로 만든 인덱스에서 region 을 찾음
+USE_RAW_INDEX = False
+
+# 원본 이미지 기준으로 region 마다 늘릴 픽셀 수 (이미지 경계에서 잘림)
+EDGE_CASE_PADDING = 10
+
 with open(EDGE_CASE_JSON, 'r', encoding='utf-8') as file:
     edge_cases = json.load(file)
+
+# 같은 이미지의 edge case 는 묶어서 원본 이미지를 한 번만 디코딩
+edge_regions = defaultdict(list)
+raw_index = RawIndex(RAW_INDEX_DIR) if USE_RAW_INDEX else None
 for json_path in list(edge_cases.keys()):
-    edge_json_path = os.path.join(RAW_JSON_DIR, json_path)
     region_id = edge_cases[json_path][0]["region_id"]
+    if raw_index is not None:
+        row = raw_index.find(region_id)
+        if row is None:
+            print("region not found:", region_id)
+            continue
+        target_region = raw_index.region(row)
+        edge_regions[target_region["vgid"]].append(target_region)
+        continue
+
+    edge_json_path = os.path.join(RAW_JSON_DIR, json_path)
     try:
         with open(edge_json_path, 'r', encoding='utf-8') as file:
             edge_json = json.load(file)
         vgid = list(edge_json.keys())[0]
         target_region = next((target for target in edge_json[vgid]["regions"] if target["id"] == region_id), None)
-        full_image_path = os.path.join(IMAGE_DIR, f"{vgid}.jpg")
-        
-        if not os.path.exists(full_image_path):
-            print("파일이 존재하지 않습니다:", full_image_path)
-        elif target_region:
-            with Image.open(full_image_path) as img:
-                print(f"이미지 처리 중: {vgid}")
-                # 원복 코드
-                # x = target_region['x'] 
-                # y = target_region['y']
-                # width = target_region['width']
-                # height = target_region['height']
-                
-                # 임의로 20px씩 늘림
-                x = target_region['x']-10 if target_region['x'] > 10 else 0 
-                y = target_region['y']-10 if target_region['y'] > 10 else 0
-                width = target_region['width']+20
-                height = target_region['height']+20
-                
-                cropped_img = img.crop((x,y,x+width,y+height))
-
-                cropped_path = os.path.join(CROPPED_IMAGE_DIR, f"{vgid}/{region_id}.jpg")
-                cropped_img.save(cropped_path)
-                print(f"저장 완료: {cropped_path}")
+        if target_region:
+            edge_regions[vgid].append(target_region)
     except FileNotFoundError:
         print("file not found")
-        
\ No newline at end of file
+
+for vgid, regions in edge_regions.items():
+    full_image_path = os.path.join(IMAGE_DIR, f"{vgid}.jpg")
+    if not os.path.exists(full_image_path):
+        print("파일이 존재하지 않습니다:", full_image_path)
+        continue
+
+    print(f"이미지 처리 중: {vgid}")
+    # 원복: EDGE_CASE_PADDING = 0
+    results = crop_image_regions(full_image_path, regions, os.path.join(CROPPED_IMAGE_DIR, vgid), padding=EDGE_CASE_PADDING)
+    for region_id, error in results:
+        if error is None:
+            print(f"저장 완료: {os.path.join(CROPPED_IMAGE_DIR, f'{vgid}/{region_id}.jpg')}")
+        else:
+            print(f"저장 실패: {vgid}/{region_id} ({error})")
@@ -1,21 +1,61 @@
+import asyncio
 import json
-import base64
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from tqdm import tqdm
 from multiprocessing import Pool, cpu_count
 from filelock import FileLock
 import openai
 
-from select_image_caption import select_image_caption_prompt
+from select_image_caption import (
+    select_image_caption_prompt,
+    select_image_captions_packed_prompt,
+    parse_packed_answers
+)
+from utils import AsyncGPTHandler, CropProvider, ImagePayload, Manifest, RawIndex, ResponseCache, ResultStore
+from utils.gpt import build_messages
 
 # 경로 설정
 API_KEYS_PATH = "api_keys.json"
 RAW_JSON_DIR = "/home/cwhjpaper/data/json/raw"
+RAW_INDEX_DIR = "/home/cwhjpaper/data/json/raw_index"
 CROPPED_IMAGE_DIR = "/home/cwhjpaper/data/cropped_images"
+IMAGE_DIR = "/home/cwhjpaper/data/images"
 PROCESSED_JSON = "/home/cwhjpaper/data/json/processed/image_metadata.json"
+RESULT_SEGMENT_DIR = "/home/cwhjpaper/data/json/processed/image_metadata_segments"
+MANIFEST_DB = "/home/cwhjpaper/data/json/processed/select_manifest.sqlite"
+RESPONSE_CACHE_DB = "/home/cwhjpaper/data/cache/gpt_responses.sqlite"
+RESPONSE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
 ERROR_LOG_PATH = "/home/cwhjpaper/data/json/processed/select_errors_log.json"
 
+# 비동기 모드 설정 (계정의 rate limit 에 맞게 조정)
+ASYNC_MODE = False
+MAX_CONCURRENCY = 32
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 30000
+
+# 전송할 crop 이미지 설정 (긴 변이 IMAGE_MAX_SIDE 를 넘으면 줄여서 JPEG 로 다시 인코딩)
+IMAGE_MAX_SIDE = 768
+IMAGE_JPEG_QUALITY = 85
+LOW_DETAIL_MAX_SIDE = 512
+
+# True 면 raw JSON 대신 build_raw_index.py 로 만든 컬럼 인덱스에서 region 정보를 읽음
+USE_RAW_INDEX = False
+
+# True 면 CROPPED_IMAGE_DIR 대신 IMAGE_DIR 의 원본 이미지에서 바로 crop
+USE_CROP_PROVIDER = False
+CROP_PADDING = 0
+CROP_CACHE_SIZE = 8
+
+# True 면 GPT 요청 전에 CLIP 으로 점수화해서 margin 이 큰 region 은 바로 저장 (clip_prefilter.py)
+CLIP_PREFILTER = False
+
+# 하나의 요청에 묶어서 보낼 region 수 (1 이면 region 마다 개별 요청, 2 이상이면 묶음 prompt 사용)
+PACK_SIZE = 1
+PACKED_MAX_TOKENS = 1000
+
 # API 키 로드
 def load_gpt_api_key(json_path):
     try:
@@ -26,126 +66,362 @@ def load_gpt_api_key(json_path):
         print("Error: API key file not found.")
         exit(1)
 
-# JSON 데이터 로드
-def load_data(json_file):
-    try:
-        file_path = os.path.join(RAW_JSON_DIR, json_file)
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+# 프로세스별 crop provider (같은 vgid 의 region 들이 원본 디코딩을 공유)
+crop_provider = None
+
+def get_crop_provider():
+    global crop_provider
+    if crop_provider is None:
+        crop_provider = CropProvider(IMAGE_DIR, cache_size=CROP_CACHE_SIZE, padding=CROP_PADDING)
+    return crop_provider
+
+# region 의 crop 이미지 payload
+def region_image(vgid, region):
+    if USE_CROP_PROVIDER:
+        bbox = (region["x"], region["y"], region["width"], region["height"])
+        source = partial(get_crop_provider().crop, vgid, bbox)
+    else:
+        source = os.path.join(CROPPED_IMAGE_DIR, f"{vgid}/{region['id']}.jpg")
+    return ImagePayload(source,
+                        max_side=IMAGE_MAX_SIDE,
+                        quality=IMAGE_JPEG_QUALITY,
+                        low_detail_side=LOW_DETAIL_MAX_SIDE)
+
+# 프로세스별 raw 컬럼 인덱스 (memory-map 이므로 여러 worker 가 페이지 캐시를 공유)
+raw_index = None
+
+def get_raw_index():
+    global raw_index
+    if raw_index is None:
+        raw_index = RawIndex(RAW_INDEX_DIR)
+    return raw_index
+
+# raw JSON 파일 하나의 vgid 와 region 목록
+# region: {"id", "x", "y", "width", "height", "captions": [...], "counterfactual_captions": [...]}
+def read_raw_regions(json_file):
+    if USE_RAW_INDEX:
+        index = get_raw_index()
+        regions = list(index.iter_regions(index.rows_for_file(json_file)))
+        return regions[0]["vgid"], regions
+
+    file_path = os.path.join(RAW_JSON_DIR, json_file)
+    with open(file_path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
 
-        vgid = list(data.keys())[0]
-        regions = data[vgid]['regions']
+    vgid = list(data.keys())[0]
+    regions = data[vgid]['regions']
+    for region in regions:
+        region["counterfactual_captions"] = [counterfactual_caption["counterfactual_caption"] for counterfactual_caption in region["captions"]]
+        region["captions"] = [caption["caption"] for caption in region["captions"]]
+    return vgid, regions
+
+# JSON 데이터 로드 (region_ids 가 주어지면 해당 region 만 반환)
+# 이미지는 요청 직전에 인코딩되도록 ImagePayload 로 반환
+def load_data(json_file, only_region_ids=None):
+    try:
+        vgid, regions = read_raw_regions(json_file)
+        if only_region_ids is not None:
+            only_region_ids = set(only_region_ids)
+            regions = [region for region in regions if region["id"] in only_region_ids]
         region_ids = [region["id"] for region in regions]
-        captions = [[caption["caption"] for caption in region["captions"]] for region in regions]
-        counterfactual_captions = [[counterfactual_caption["counterfactual_caption"] for counterfactual_caption in region["captions"]] for region in regions]
+        captions = [region["captions"] for region in regions]
+        counterfactual_captions = [region["counterfactual_captions"] for region in regions]
         
-        base64_images = []
-        for region_id in region_ids:
-            try:
-                image_path = os.path.join(CROPPED_IMAGE_DIR, f"{vgid}/{region_id}.jpg")
-                with open(image_path, "rb") as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-                base64_images.append(base64_image)
-            except FileNotFoundError:
-                base64_images.append("")
+        images = [region_image(vgid, region) for region in regions]
     except:
         print(f"Error loading JSON data")
         return None, None, None, None, None 
 
-    return vgid, region_ids, captions, counterfactual_captions, base64_images
+    return vgid, region_ids, captions, counterfactual_captions, images
+
+SYSTEM_PROMPT = """You are a concise and accurate AI assistant.
+                    Do not include phrases like "Sure," "Certainly," "Of course," "Absolutely," "Let me provide that," 
+                    or "Here’s the information" in your responses."""
+
+# GPT API 호출 (cache 가 주어지면 동일한 요청의 응답을 재사용)
+# validate 가 주어지면 통과한 응답만 캐시에 저장하고 재사용 (해석할 수 없는 답은 재시도 시 다시 요청)
+def ask_gpt(prompt, base64_image, max_tokens, model="gpt-4o", temperature=0, cache=None, validate=None):
+    if cache is not None:
+        cache_key = ResponseCache.make_key(model, temperature, max_tokens, SYSTEM_PROMPT, prompt, base64_image)
+        cached = cache.get(cache_key)
+        if cached is not None and (validate is None or validate(cached)):
+            return cached
 
-# GPT API 호출
-def ask_gpt(prompt, base64_image, max_tokens, model="gpt-4o", temperature=0):
     try:
         response = openai.ChatCompletion.create(
             model=model,
-            messages=[
-                {"role": "system", 
-                 "content": """You are a concise and accurate AI assistant.
-                    Do not include phrases like "Sure," "Certainly," "Of course," "Absolutely," "Let me provide that," 
-                    or "Here’s the information" in your responses."""},
-                {"role": "user", "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {
-                        "url": f"data:image/png;base64,{base64_image}"
-                    }}
-                ]}
-            ],
+            messages=build_messages(prompt, base64_image, SYSTEM_PROMPT),
             max_tokens=max_tokens,
             temperature=temperature
         )
-        return response.choices[0].message['content'].strip()
+        answer = response.choices[0].message['content'].strip()
+        if cache is not None and (validate is None or validate(answer)):
+            cache.put(cache_key, answer)
+        return answer
     except Exception as e:
         print(f"OpenAI API call error: {e}")
         return None
 
-# JSON 파일 처리
-def process_json_file(json_file):
-    vgid, region_ids, captions, counterfactual_captions, base64_images = load_data(json_file)
+# GPT 응답에서 선택된 caption 번호 추출
+def parse_selected_index(response):
+    if re.search(r'[^:]*$', response):
+        return re.sub(r'\D', '', re.search(r'[^:]*$', response).group(0).strip())
+    return re.sub(r'\D', '', response.strip())
+
+# 저장할 region record 생성 (caption 이 하나뿐이면 response 없이 0번 선택)
+def build_region_record(region_captions, response):
+    cleaned_response = parse_selected_index(response) if response is not None else "0"
+    return {"caption": region_captions[int(cleaned_response)], "category": ""}
+
+# 응답에서 region 의 caption 번호를 찾을 수 있는지 확인
+def is_valid_answer(region_captions, response):
+    try:
+        build_region_record(region_captions, response)
+    except (ValueError, IndexError):
+        return False
+    return True
+
+# 묶음 응답에서 하나 이상의 region 의 답을 찾을 수 있는지 확인
+def is_valid_packed_answer(captions_list, response):
+    return any(answer is not None for answer in parse_packed_answers(response, captions_list))
+
+# worker 별 결과 저장소, manifest, 응답 캐시 연결
+result_store = None
+manifest = None
+response_cache = None
+
+def init_worker():
+    global result_store, manifest, response_cache
+    result_store = ResultStore(RESULT_SEGMENT_DIR)
+    manifest = Manifest(MANIFEST_DB)
+    response_cache = ResponseCache(RESPONSE_CACHE_DB, RESPONSE_CACHE_MAX_BYTES)
+
+# region 묶음을 PACK_SIZE 개 이하로 나눔 (caption 이 하나뿐인 region 은 요청이 필요 없으므로 따로 1개씩)
+def pack_regions(captions):
+    multi = [idx for idx in range(len(captions)) if len(captions[idx]) > 1]
+    chunks = [[idx] for idx in range(len(captions)) if len(captions[idx]) <= 1]
+    chunks += [multi[start:start + PACK_SIZE] for start in range(0, len(multi), max(PACK_SIZE, 1))]
+    return chunks
+
+# 여러 region 을 한 번에 요청한 응답을 region 별 응답 형태("Answer: n")로 변환
+# 답을 찾지 못한 region 은 None
+def split_packed_response(response, captions_list):
+    answers = parse_packed_answers(response, captions_list)
+    return [f"Answer: {answer}" if answer is not None else None for answer in answers]
+
+# region 묶음의 caption 선택 (묶음 요청 후 답을 찾지 못한 region 만 개별 요청으로 재시도)
+def select_captions(captions_list, images):
+    if len(captions_list) == 1 and len(captions_list[0]) <= 1:
+        return [None]
+
+    responses = [None] * len(captions_list)
+    if len(captions_list) > 1:
+        packed_prompt = select_image_captions_packed_prompt(captions_list)
+        response = ask_gpt(packed_prompt, images, max_tokens=PACKED_MAX_TOKENS, cache=response_cache,
+                           validate=partial(is_valid_packed_answer, captions_list))
+        responses = split_packed_response(response, captions_list)
+
+    for idx, region_captions in enumerate(captions_list):
+        if responses[idx] is None:
+            select_caption_prompt = select_image_caption_prompt(region_captions)
+            responses[idx] = ask_gpt(select_caption_prompt, images[idx], max_tokens=1000, cache=response_cache,
+                                     validate=partial(is_valid_answer, region_captions))
+    return responses
+
+# 선택 결과 저장 후 region 별 처리 결과 반환
+def save_selected_captions(json_file, vgid, region_ids, captions_list, responses):
+    results = []
+    for region_id, region_captions, response in zip(region_ids, captions_list, responses):
+        if len(region_captions) <= 1:
+            print("has only 1 caption", json_file, region_id, region_captions)
+        elif response is None:
+            manifest.mark_failed(vgid, region_id, "GPT response is None")
+            results.append({"file": json_file, "region_id": region_id, "status": "error", "response": None})
+            continue
+
+        try:
+            # region 단위로 segment 에 바로 추가 (전체 파일을 다시 쓰지 않음)
+            result_store.append(vgid, region_id, build_region_record(region_captions, response))
+            manifest.mark_done(vgid, region_id)
+            results.append({"file": json_file, "region_id": region_id, "status": "success", "error": None})
+        except Exception:
+            manifest.mark_failed(vgid, region_id, response)
+            results.append({"file": json_file, "region_id": region_id, "status": "error", "response": response})
+    return results
+
+# 처리 중 예외가 난 region 묶음을 실패로 기록하고 region 별 error 결과 반환
+def mark_regions_failed(json_file, vgid, region_ids, error):
+    results = []
+    for region_id in region_ids:
+        manifest.mark_failed(vgid, region_id, error)
+        results.append({"file": json_file, "region_id": region_id, "status": "error", "response": error})
+    return results
+
+# JSON 파일 처리 (task: (json 파일 이름, 남은 region id 목록))
+# 실패한 region 마다 하나씩 error 결과를 반환 (모두 성공하면 success 결과 하나)
+def process_json_file(task):
+    json_file, pending_region_ids = task
+    vgid, region_ids, captions, counterfactual_captions, images = load_data(json_file, pending_region_ids)
     if vgid is None:
-        return {"file": json_file, "region_id": None, "status": "error", "error": "Failed to load data"}
+        return [{"file": json_file, "region_id": None, "status": "error", "response": "Failed to load data"}]
 
     try:
-        lock = FileLock(PROCESSED_JSON + ".lock")
-        with lock:
-            if not os.path.exists(PROCESSED_JSON):
-                save_data = {}
-            else:
-                with open(PROCESSED_JSON, 'r', encoding='utf-8') as file:
-                    save_data = json.load(file)
-
-            if vgid not in save_data:
-                save_data[vgid] = {}
-
-            for idx, region_id in enumerate(region_ids):
-                if region_id not in save_data[vgid]:
-                    save_data[vgid][region_id] = {}
-                    if len(captions[idx]) > 1:
-                        select_caption_prompt = select_image_caption_prompt(captions[idx])
-                        response = ask_gpt(select_caption_prompt, base64_images[idx], max_tokens=1000)
-                        if response is None:
-                            return {"file": json_file, "region_id": region_id, "status": "error", "error": "GPT response is None"}
-
-                        if re.search(r'[^:]*$', response):
-                            cleaned_response = re.sub(r'\D', '', re.search(r'[^:]*$', response).group(0).strip())
-                        else:
-                            cleaned_response = re.sub(r'\D', '', response.strip())
-                    else:
-                        print("has only 1 caption", json_file, region_id, captions[idx])
-                        cleaned_response = "0"
-
-                    try:
-                         save_data[vgid][region_id]['category'] = ""
-                    except Exception:
-                        return {"file": json_file, 
-                                "region_id": region_id, 
-                                "status": "error", 
-                                "response": response}
-
-            # 저장하기 전에 모든 작업 완료 확인
-            with open(PROCESSED_JSON, 'w', encoding='utf-8') as file:
-                json.dump(save_data, file, ensure_ascii=False, indent='\t')
+        errors = []
+        for chunk in pack_regions(captions):
+            chunk_captions = [captions[idx] for idx in chunk]
+            responses = select_captions(chunk_captions, [images[idx] for idx in chunk])
+            results = save_selected_captions(json_file, vgid, [region_ids[idx] for idx in chunk], chunk_captions, responses)
+            errors.extend(result for result in results if result["status"] == "error")
+        if errors:
+            return errors
 
     except Exception:
-        return {"file": json_file, 
-                "region_id": None, 
-                "status": "error", 
-                "response": None}
+        return [{"file": json_file, 
+                 "region_id": None, 
+                 "status": "error", 
+                 "response": None}]
+
+    return [{"file": json_file, 
+             "region_id": None, 
+             "status": "success", 
+             "error": None}]
+
+# region 묶음의 비동기 caption 선택 (select_captions 와 동일한 규칙)
+async def select_captions_async(handler, captions_list, images):
+    if len(captions_list) == 1 and len(captions_list[0]) <= 1:
+        return [None]
+
+    responses = [None] * len(captions_list)
+    if len(captions_list) > 1:
+        packed_prompt = select_image_captions_packed_prompt(captions_list)
+        response = await handler.ask_gpt(packed_prompt, images, max_tokens=PACKED_MAX_TOKENS,
+                                         validate=partial(is_valid_packed_answer, captions_list))
+        responses = split_packed_response(response, captions_list)
+
+    retry = [idx for idx in range(len(captions_list)) if responses[idx] is None]
+    retried = await asyncio.gather(*(
+        handler.ask_gpt(select_image_caption_prompt(captions_list[idx]), images[idx], max_tokens=1000,
+                        validate=partial(is_valid_answer, captions_list[idx]))
+        for idx in retry
+    ))
+    for idx, response in zip(retry, retried):
+        responses[idx] = response
+    return responses
 
-    return {"file": json_file, 
-            "region_id": None, 
-            "status": "success", 
-            "error": None}
+# 비동기 모드: 파일을 읽는 producer 와 요청을 보내는 consumer 들이 bounded queue 로 연결됨
+# 동시 요청 수와 분당 요청/토큰 수는 AsyncGPTHandler 가 제한하므로 처리량은 계정의 rate limit 에 따라 결정됨
+async def process_json_files_async(tasks):
+    handler = AsyncGPTHandler(API_KEYS_PATH,
+                              max_concurrency=MAX_CONCURRENCY,
+                              requests_per_minute=REQUESTS_PER_MINUTE,
+                              tokens_per_minute=TOKENS_PER_MINUTE,
+                              cache=response_cache)
+    queue = asyncio.Queue(maxsize=MAX_CONCURRENCY * 2)
+    results = []
+    # segment 추가와 manifest(SQLite) 갱신은 event loop 밖의 전용 thread 하나에서 순서대로 실행
+    save_executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+
+    async def producer():
+        for json_file, pending_region_ids in tqdm(tasks):
+            vgid, region_ids, captions, _, images = await asyncio.to_thread(load_data, json_file, pending_region_ids)
+            if vgid is None:
+                results.append({"file": json_file, "region_id": None, "status": "error", "response": None})
+                continue
+            for chunk in pack_regions(captions):
+                await queue.put((json_file, vgid,
+                                 [region_ids[idx] for idx in chunk],
+                                 [captions[idx] for idx in chunk],
+                                 [images[idx] for idx in chunk]))
+        for _ in range(MAX_CONCURRENCY):
+            await queue.put(None)
+
+    async def consumer():
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            json_file, vgid, chunk_region_ids, chunk_captions, chunk_images = job
+            # job 하나의 실패는 해당 region 들만 failed 로 기록하고 다음 job 을 계속 처리
+            try:
+                responses = await select_captions_async(handler, chunk_captions, chunk_images)
+                results.extend(await loop.run_in_executor(save_executor, save_selected_captions,
+                                                          json_file, vgid, chunk_region_ids, chunk_captions, responses))
+            except Exception as e:
+                print(f"Error processing {json_file} {chunk_region_ids}: {e!r}")
+                results.extend(await loop.run_in_executor(save_executor, mark_regions_failed,
+                                                          json_file, vgid, chunk_region_ids, repr(e)))
+
+    try:
+        async with handler:
+            await asyncio.gather(producer(), *(consumer() for _ in range(MAX_CONCURRENCY)))
+    finally:
+        save_executor.shutdown()
+    return results
+
+# segment 들을 image_metadata.json 형태로 병합
+def export_results():
+    store = ResultStore(RESULT_SEGMENT_DIR)
+    lock = FileLock(PROCESSED_JSON + ".lock")
+    with lock:
+        count = store.compact(PROCESSED_JSON, base_path=PROCESSED_JSON)
+    print(f"{count} records exported to {PROCESSED_JSON}")
+
+# manifest 에 아직 없는 raw JSON 파일만 읽어서 region 들을 등록
+# 한 번 등록된 파일은 재시작 시 다시 파싱하지 않음
+def sync_manifest(manifest):
+    known_files = manifest.known_files()
+    new_files = [f for f in os.listdir(RAW_JSON_DIR) if f.endswith('.json') and f not in known_files]
+    if not new_files:
+        return
+
+    # 기존 결과 파일로 처리된 region 은 done 으로 등록 (manifest 도입 전 결과 이전)
+    done_keys = load_processed_keys()
+    for json_file in tqdm(new_files, desc="manifest"):
+        try:
+            vgid, regions = read_raw_regions(json_file)
+            region_ids = [region["id"] for region in regions]
+        except Exception:
+            print(f"Error loading JSON data: {json_file}")
+            continue
+        manifest.register_file(json_file, vgid, region_ids, done_keys)
+
+# 이미 처리된 region 목록 (기존 결과 파일 + segment)
+def load_processed_keys():
+    keys = ResultStore(RESULT_SEGMENT_DIR).processed_keys()
+    if os.path.exists(PROCESSED_JSON):
+        with open(PROCESSED_JSON, 'r', encoding='utf-8') as file:
+            save_data = json.load(file)
+        keys.update((vgid, region_id) for vgid in save_data for region_id in save_data[vgid])
+    return keys
 
 # 메인 함수
 def main():
     openai.api_key = load_gpt_api_key(API_KEYS_PATH)
-    json_files = [f for f in os.listdir(RAW_JSON_DIR) if f.endswith('.json')]
-
     errors = {}
 
-    with Pool(processes=cpu_count()) as pool:
-        results = list(tqdm(pool.imap(process_json_file, json_files), total=len(json_files)))
+    # 남은 작업만 스케줄링
+    progress = Manifest(MANIFEST_DB)
+    sync_manifest(progress)
+    tasks = progress.outstanding()
+    print("manifest:", progress.counts())
+    progress.close()
+
+    if CLIP_PREFILTER:
+        from clip_prefilter import prefilter_tasks
+        tasks = prefilter_tasks(tasks)
+
+    if ASYNC_MODE:
+        init_worker()
+        results = asyncio.run(process_json_files_async(tasks))
+    else:
+        results = []
+        with Pool(processes=cpu_count(), initializer=init_worker) as pool:
+            for file_results in tqdm(pool.imap(process_json_file, tasks), total=len(tasks)):
+                results.extend(file_results)
+
+    export_results()
+    print("response cache:", ResponseCache(RESPONSE_CACHE_DB, RESPONSE_CACHE_MAX_BYTES).stats())
 
     for result in results:
         if result["status"] == "error":
@@ -1,84 +1,87 @@
 from process_image_data import (
-    load_gpt_api_key,
-    load_data,
-    ask_gpt,
-    process_json_file
+    RAW_JSON_DIR,
+    read_raw_regions
 )
 import json
 import os
-from multiprocessing import Pool, cpu_count
+from filelock import FileLock
 from tqdm import tqdm
-import openai
 
 
 
 # 경로 설정
-API_KEYS_PATH = "api_keys.json"
-RAW_JSON_DIR = "/home/cwhjpaper/data/json/raw"
-CROPPED_IMAGE_DIR = "/home/cwhjpaper/data/cropped_images"
 PROCESSED_JSON = "/home/cwhjpaper/data/json/processed/copy_image_metadata.json"
 ERROR_LOG_PATH = "/home/cwhjpaper/data/json/processed/select_errors_log_caption_test.json"
 
-def select_candidate_captions(json_file):
-    # json_file에서 image_id를 읽어옴
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        image_id = list(data.keys())[0]  # 첫 번째 image_id를 가져옴
-
-    # copy_image_metadata.json에서 image_id를 찾음
-    with open(PROCESSED_JSON, 'r', encoding='utf-8') as f:
-        processed_data = json.load(f)
-
-    if image_id not in processed_data:
-        return {"file": json_file, "region_id": None, "status": "error", "error": "Image ID not found in processed data"}
-
-    # 각 region_id의 caption과 counterfactual_caption을 가져옴
-    for region_id, region_data in data[image_id]["regions"].items():
-        caption = region_data.get("caption", "")
-        counterfactual_caption = find_error_caption(caption, region_data["captions"], region_data["counterfactual_captions"])
-        
-        # processed_data에 category와 counterfactual_caption 추가
-        if region_id in processed_data[image_id]:
-            processed_data[image_id][region_id]["counterfactual_caption"] = counterfactual_caption
-
-    # 변경된 데이터를 다시 저장
-    with open(PROCESSED_JSON, 'w', encoding='utf-8') as f:
-        json.dump(processed_data, f, ensure_ascii=False, indent=4)
-
-    return {"file": json_file, "region_id": None, "status": "success"}
-
-def find_error_caption(caption, captions_list, counterfactual_list):
-    for i, region_captions in enumerate(captions_list):
-        for j, original_caption in enumerate(region_captions):
-            if original_caption == caption:
-                return counterfactual_list[i][j]
-    return "No counterfactual caption found."
+NOT_FOUND_CAPTION = "No counterfactual caption found."
 
-def main():
-    openai.api__key = load_gpt_api_key(API_KEYS_PATH)
-    json_files = [f for f in os.listdir(RAW_JSON_DIR) if f.endswith('.json')]
+'''
+선택된 caption 에 대응하는 counterfactual caption 을 PROCESSED_JSON 에 추가하는 파일
+
+1. raw 데이터를 한 번 훑어서 (vgid, region_id, caption) -> counterfactual caption 인덱스를 만듦
+2. PROCESSED_JSON 을 한 번 읽어 인덱스로 채운 뒤, lock 을 잡고 임시 파일에 써서 한 번에 교체
+'''
+
+# raw 데이터 전체에서 (vgid, region_id, caption) -> counterfactual caption 인덱스 생성
+# 파일 하나씩 읽고 버리므로 메모리에는 인덱스만 남음
+def build_counterfactual_index(json_files):
+    index = {}
     errors = {}
-    
-    with Pool(processes=cpu_count()) as pool:
-        results = list(tqdm(pool.imap(select_candidate_captions, json_files), total=len(json_files)))
-
-    for result in results:
-        if result["status"] == "error":
-            file = result["file"]
-            if file not in errors:
-                errors[file] = []
-            errors[file].append({
-                "region_id": result["region_id"],
-                "response": result["response"]
-            })
+    for json_file in tqdm(json_files, desc="index"):
+        try:
+            vgid, regions = read_raw_regions(json_file)
+        except Exception as e:
+            errors[json_file] = [{"region_id": None, "response": str(e)}]
+            continue
+        for region in regions:
+            for caption, counterfactual_caption in zip(region["captions"], region["counterfactual_captions"]):
+                # 같은 caption 이 여러 번 있으면 기존 find_error_caption 처럼 처음 것을 사용
+                index.setdefault((vgid, region["id"], caption), counterfactual_caption)
+    return index, errors
+
+# processed_data 의 각 region 에 counterfactual_caption 을 채움
+def apply_counterfactual_index(processed_data, index):
+    missing = []
+    for vgid, regions in processed_data.items():
+        for region_id, region_data in regions.items():
+            counterfactual_caption = index.get((vgid, region_id, region_data.get("caption", "")))
+            if counterfactual_caption is None:
+                missing.append((vgid, region_id))
+                counterfactual_caption = NOT_FOUND_CAPTION
+            region_data["counterfactual_caption"] = counterfactual_caption
+    return missing
+
+def select_candidate_captions(json_files):
+    index, errors = build_counterfactual_index(json_files)
+
+    # PROCESSED_JSON 은 export_results 가 쓰는 image_metadata.json 의 사본이므로 이 lock 은
+    # 이 스크립트를 동시에 여러 번 실행한 경우(같은 사본을 쓰는 다른 프로세스)만 막음
+    # 읽고-수정하고-교체를 lock 안에서 하므로 중간에 다른 쓰기가 끼어들지 않음
+    with FileLock(PROCESSED_JSON + ".lock"):
+        with open(PROCESSED_JSON, 'r', encoding='utf-8') as f:
+            processed_data = json.load(f)
+
+        missing = apply_counterfactual_index(processed_data, index)
+
+        tmp_path = PROCESSED_JSON + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(processed_data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, PROCESSED_JSON)
+
+    return missing, errors
+
+def main():
+    json_files = sorted(f for f in os.listdir(RAW_JSON_DIR) if f.endswith('.json'))
+    missing, errors = select_candidate_captions(json_files)
+    print(f"{len(missing)} regions without counterfactual caption")
 
     if errors:
         with open(ERROR_LOG_PATH, "w", encoding="utf-8") as error_file:
             json.dump(errors, error_file, ensure_ascii=False, indent=4)
         print(f"Errors saved to {ERROR_LOG_PATH}")
 
-        print("Success (•̀ᴗ•́)و ̑̑") # 귀욥다 ,,,, 
-        
+    print("Success (•̀ᴗ•́)و ̑̑") # 귀욥다 ,,,,
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
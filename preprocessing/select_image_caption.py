@@ -1,3 +1,6 @@
+import re
+
+
 def select_image_caption_prompt(captions):
     """
     @description
@@ -32,3 +35,59 @@ def select_image_caption_prompt(captions):
     
     return prompt
 
+
+
+def select_image_captions_packed_prompt(captions_list):
+    """
+    @description
+    여러 region 의 이미지와 caption 목록을 하나의 요청으로 묶어 caption 을 select 하기 위한 prompt를 작성하는 함수
+    이미지는 captions_list 와 같은 순서로 메시지에 첨부되어야 함
+    """
+
+    formatted_captions = ""
+    for image_idx, captions in enumerate(captions_list):
+        formatted_captions = f"{formatted_captions}Image {image_idx + 1}:\n\t"
+        for idx, caption in enumerate(captions):
+            formatted_captions = f"{formatted_captions}\t{idx}. {caption}\n\t"
+
+    prompt = (
+        f"""
+        {len(captions_list)} images are attached in order (Image 1, Image 2, ...). Each image has its own list of captions.
+        For each image, select the most accurate and specific caption that best describes the main object featured in that image, only from that image's own captions. Indicate your choice by selecting the corresponding number. It is better if the characteristics or movements of the main object are described specifically.
+        Even if it is hard to recognize, You need to identify the main object in each image and select the best match from the provided options.
+        If you are unable to identify or determine the main object in an image or unable to view it, write the reason on that image's line instead of a number.
+        
+        [Caption selection rules]
+
+        1. The selected caption must not include any details that cannot be verified from the image.
+        2. The selected caption can contain grammatical errors.
+
+        [Captions]
+        {formatted_captions}
+
+        [Response format]
+        Answer with exactly one line per image, in order. The format of the answer is as follows:
+        Image 1: 1
+        Image 2: 0
+        """
+    )
+    
+    return prompt
+
+
+def parse_packed_answers(response, captions_list):
+    """
+    @description
+    묶음 요청의 응답에서 이미지별로 선택된 caption 번호를 찾아 captions_list 순서대로 반환하는 함수
+    번호를 찾지 못했거나 범위를 벗어난 이미지는 None
+    """
+    answers = [None] * len(captions_list)
+    if response is None:
+        return answers
+
+    for match in re.finditer(r'Image\s*(\d+)\s*:\s*(\d+)\s*$', response, re.IGNORECASE | re.MULTILINE):
+        image_idx = int(match.group(1)) - 1
+        caption_idx = int(match.group(2))
+        if 0 <= image_idx < len(captions_list) and caption_idx < len(captions_list[image_idx]):
+            answers[image_idx] = caption_idx
+    return answers
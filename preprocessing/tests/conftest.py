@@ -0,0 +1,5 @@
+import os
+import sys
+
+# preprocessing 스크립트들은 `from utils import ...` 처럼 디렉토리 기준으로 import 함
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+from utils.async_gpt import AsyncGPTHandler
+from utils.response_cache import ResponseCache
+
+
+def completion(content):
+    return web.json_response({"id": "x", "object": "chat.completion", "choices": [
+        {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]})
+
+
+@asynccontextmanager
+async def fake_openai(handler):
+    """chat completions 만 흉내 내는 로컬 HTTP 서버 (요청 도착 시각을 기록)"""
+    calls = []
+
+    async def chat(request):
+        calls.append(time.monotonic())
+        return await handler(request, len(calls))
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}/v1", calls
+    finally:
+        await runner.cleanup()
+
+
+async def answer_one(request, n):
+    return completion("Answer: 1")
+
+
+def test_retry_after_is_honoured():
+    async def rate_limited_once(request, n):
+        if n == 1:
+            return web.json_response({"error": {"message": "slow down", "type": "rate_limit"}},
+                                     status=429, headers={"Retry-After": "0.5"})
+        return completion("Answer: 1")
+
+    async def run():
+        async with fake_openai(rate_limited_once) as (api_base, calls):
+            async with AsyncGPTHandler(api_key="k", api_base=api_base) as handler:
+                answer = await handler.ask_gpt("prompt", "AA")
+        return answer, calls
+
+    answer, calls = asyncio.run(run())
+    assert answer == "Answer: 1"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.45
+
+
+def test_non_retryable_error_returns_none():
+    async def bad_request(request, n):
+        return web.json_response({"error": {"message": "bad", "type": "invalid_request_error"}}, status=400)
+
+    async def run():
+        async with fake_openai(bad_request) as (api_base, calls):
+            async with AsyncGPTHandler(api_key="k", api_base=api_base) as handler:
+                answer = await handler.ask_gpt("prompt", "AA")
+        return answer, calls
+
+    answer, calls = asyncio.run(run())
+    assert answer is None
+    assert len(calls) == 1
+
+
+def test_requests_per_minute_limit():
+    async def run():
+        async with fake_openai(answer_one) as (api_base, calls):
+            async with AsyncGPTHandler(api_key="k", api_base=api_base, requests_per_minute=600) as handler:
+                # 한도까지 이미 사용한 상태에서 시작 (초당 10개씩 다시 채워짐)
+                handler._request_bucket.tokens = 0
+                answers = await handler.ask_gpt_many([{"prompt": "p", "base64_image": "AA"} for _ in range(4)])
+        return answers, calls
+
+    start = time.monotonic()
+    answers, calls = asyncio.run(run())
+    assert answers == ["Answer: 1"] * 4
+    # 0.1초마다 하나씩 통과
+    assert calls[-1] - start >= 0.35
+
+
+def test_tokens_per_minute_limit():
+    estimate = AsyncGPTHandler.estimate_tokens("p", 100)
+
+    async def run():
+        async with fake_openai(answer_one) as (api_base, calls):
+            async with AsyncGPTHandler(api_key="k", api_base=api_base,
+                                       tokens_per_minute=estimate * 600) as handler:
+                handler._token_bucket.tokens = 0
+                answers = await handler.ask_gpt_many([{"prompt": "p", "base64_image": "AA", "max_tokens": 100}
+                                                      for _ in range(4)])
+        return answers, calls
+
+    answers, calls = asyncio.run(run())
+    assert answers == ["Answer: 1"] * 4
+    assert calls[-1] - calls[0] >= 0.25
+
+
+def test_cached_answers_skip_the_request(tmp_path):
+    async def run(cache):
+        async with fake_openai(answer_one) as (api_base, calls):
+            async with AsyncGPTHandler(api_key="k", api_base=api_base, cache=cache) as handler:
+                first = await handler.ask_gpt("prompt", "AA")
+                second = await handler.ask_gpt("prompt", "AA")
+            assert handler._cache_executor is None
+        return first, second, calls
+
+    first, second, calls = asyncio.run(run(ResponseCache(str(tmp_path / "cache.sqlite"))))
+    assert first == second == "Answer: 1"
+    assert len(calls) == 1
+
+
+def test_answers_that_fail_validation_are_not_cached(tmp_path):
+    async def unparsable_once(request, n):
+        return completion("I cannot see the image" if n == 1 else "Answer: 1")
+
+    def validate(answer):
+        return answer.startswith("Answer")
+
+    async def run(cache):
+        async with fake_openai(unparsable_once) as (api_base, calls):
+            async with AsyncGPTHandler(api_key="k", api_base=api_base, cache=cache) as handler:
+                answers = [await handler.ask_gpt("prompt", "AA", validate=validate) for _ in range(3)]
+        return answers, calls
+
+    answers, calls = asyncio.run(run(ResponseCache(str(tmp_path / "cache.sqlite"))))
+    assert answers == ["I cannot see the image", "Answer: 1", "Answer: 1"]
+    assert len(calls) == 2
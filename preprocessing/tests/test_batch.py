@@ -0,0 +1,126 @@
+import json
+import os
+
+import pytest
+
+import batch_requests
+import process_image_data
+from utils.batch import iter_batch_results, make_custom_id, parse_custom_id
+from utils.manifest import DONE, FAILED, PENDING, Manifest
+from utils.result_store import ResultStore
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "batch_output.jsonl")
+
+
+def test_custom_id_round_trip():
+    custom_id = make_custom_id("caption", "2333448", "2333448_0")
+    assert custom_id == "caption/2333448/2333448_0"
+    assert parse_custom_id(custom_id) == ("caption", "2333448", "2333448_0")
+
+
+def test_iter_batch_results():
+    assert list(iter_batch_results(FIXTURE)) == [
+        ("caption/1/1_0", "Answer: 1", None),
+        ("caption/1/1_1", None, json.dumps({"code": "batch_expired", "message": "This request could not be "
+                                            "executed before the completion window expired."})),
+        ("caption/1/1_2", None, "status_code 500"),
+        ("caption/1/1_3", None, "malformed response body"),
+        ("caption/2/2_0", "Answer: 7", None),
+        (None, None, 'malformed line: {"id": "r", "custom_id": "caption/1/1_'),
+        ("not-a-custom-id", None, json.dumps({"code": "x", "message": "y"})),
+        ("category/2/2_1", "Answer: 1", None),
+        ("category/2/2_2", "I am not sure", None),
+    ]
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for vgid, count in (("1", 4), ("2", 3)):
+        regions = [{"id": f"{vgid}_{idx}", "x": 0, "y": 0, "width": 4, "height": 4,
+                    "captions": [{"caption": f"{vgid}_{idx}_a", "counterfactual_caption": "x"},
+                                 {"caption": f"{vgid}_{idx}_b", "counterfactual_caption": "y"}]}
+                   for idx in range(count)]
+        (raw_dir / f"{vgid}.json").write_text(json.dumps({vgid: {"regions": regions}}))
+
+    paths = {"RAW_JSON_DIR": raw_dir,
+             "CROPPED_IMAGE_DIR": tmp_path / "crops",
+             "RESULT_SEGMENT_DIR": tmp_path / "segments",
+             "PROCESSED_JSON": tmp_path / "image_metadata.json",
+             "MANIFEST_DB": tmp_path / "manifest.sqlite"}
+    for name, value in paths.items():
+        monkeypatch.setattr(process_image_data, name, str(value))
+        if hasattr(batch_requests, name):
+            monkeypatch.setattr(batch_requests, name, str(value))
+    monkeypatch.setattr(batch_requests, "BATCH_DIR", str(tmp_path / "batch"))
+
+    manifest = Manifest(str(paths["MANIFEST_DB"]))
+    process_image_data.sync_manifest(manifest)
+    return manifest
+
+
+def test_ingest(workspace):
+    store = ResultStore(batch_requests.RESULT_SEGMENT_DIR)
+    store.append("2", "2_1", {"caption": "2_1_a", "category": ""})
+    store.append("2", "2_2", {"caption": "2_2_a", "category": ""})
+    store.close()
+
+    errors = batch_requests.ingest_batch_results([FIXTURE])
+
+    assert [error["custom_id"] for error in errors] == [
+        "caption/1/1_1", "caption/1/1_2", "caption/1/1_3", None, "not-a-custom-id", "category/2/2_2",
+        "caption/2/2_0"]
+    assert [workspace.status("1", f"1_{idx}") for idx in range(4)] == [DONE, FAILED, FAILED, FAILED]
+    assert workspace.status("2", "2_0") == FAILED
+    assert workspace.status("2", "2_1") == PENDING
+
+    with open(batch_requests.PROCESSED_JSON, encoding="utf-8") as file:
+        exported = json.load(file)
+    assert exported["1"] == {"1_0": {"caption": "1_0_b", "category": ""}}
+    assert exported["2"]["2_1"]["category"] == "person"
+    assert exported["2"]["2_2"]["category"] == ""
+    assert os.path.exists(os.path.join(batch_requests.BATCH_DIR, "ingest_errors.json"))
+
+
+def test_ingest_skips_regions_that_are_already_done(workspace):
+    # SUBMITTED_TIMEOUT 이후 다시 요청되어 다른 경로로 이미 처리된 region
+    store = ResultStore(batch_requests.RESULT_SEGMENT_DIR)
+    store.append("1", "1_0", {"caption": "1_0_a", "category": ""})
+    store.append("1", "1_1", {"caption": "1_1_a", "category": ""})
+    store.close()
+    workspace.mark_done("1", "1_0")
+    workspace.mark_done("1", "1_1")
+
+    errors = batch_requests.ingest_batch_results([FIXTURE, FIXTURE])
+
+    assert "caption/1/1_1" not in [error["custom_id"] for error in errors]
+    assert workspace.status("1", "1_0") == DONE
+    assert workspace.status("1", "1_1") == DONE
+    assert ResultStore(batch_requests.RESULT_SEGMENT_DIR).merged()["1"] == {
+        "1_0": {"caption": "1_0_a", "category": ""},
+        "1_1": {"caption": "1_1_a", "category": ""}}
+
+
+def test_duplicate_results_are_ingested_once(workspace):
+    batch_requests.ingest_batch_results([FIXTURE, FIXTURE])
+    records = [key for *key, _ in ResultStore(batch_requests.RESULT_SEGMENT_DIR).iter_records()]
+    assert records.count(["1", "1_0"]) == 1
+
+
+def test_category_batch_is_not_written_twice(workspace):
+    store = ResultStore(batch_requests.RESULT_SEGMENT_DIR)
+    store.append("2", "2_1", {"caption": "2_1_a", "category": ""})
+    store.append("2", "2_2", {"caption": "2_2_a", "category": ""})
+    store.close()
+
+    [path] = batch_requests.write_category_batch()
+    with open(path, encoding="utf-8") as file:
+        assert [json.loads(line)["custom_id"] for line in file] == ["category/2/2_1", "category/2/2_2"]
+    assert batch_requests.write_category_batch() == []
+
+    # 2_1 은 category 가 반영되고, 알 수 없는 답을 받은 2_2 와 새로 caption 이 선택된 1_0 만 요청
+    batch_requests.ingest_batch_results([FIXTURE])
+    [path] = batch_requests.write_category_batch()
+    with open(path, encoding="utf-8") as file:
+        assert sorted(json.loads(line)["custom_id"] for line in file) == ["category/1/1_0", "category/2/2_2"]
@@ -0,0 +1,102 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("clip")
+
+import clip_prefilter
+import process_image_data
+from utils.manifest import DONE, PENDING, Manifest
+from utils.result_store import ResultStore
+from stub_clip import StubCLIP, preprocess
+
+
+def region(region_id, x, captions):
+    return {"id": region_id, "x": x, "y": 0, "width": 20, "height": 20,
+            "captions": [{"caption": caption, "counterfactual_caption": ""} for caption in captions]}
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    (tmp_path / "raw").mkdir()
+    (tmp_path / "images").mkdir()
+    # 왼쪽은 빨강, 오른쪽은 노랑 (빨강과 초록의 중간)
+    pixels = np.zeros((20, 40, 3), dtype=np.uint8)
+    pixels[:, :20] = (255, 0, 0)
+    pixels[:, 20:] = (255, 255, 0)
+    Image.fromarray(pixels).save(tmp_path / "images" / "1.jpg", quality=100)
+    raw = {
+        "1.json": {"1": {"regions": [region("1_0", 0, ["green", "red"]),
+                                     region("1_1", 20, ["red", "green"]),
+                                     region("1_2", 0, ["red"])]}},
+        # 원본 이미지가 없는 region
+        "2.json": {"2": {"regions": [region("2_0", 0, ["red", "green"])]}},
+    }
+    for json_file, data in raw.items():
+        (tmp_path / "raw" / json_file).write_text(json.dumps(data))
+
+    monkeypatch.setattr(process_image_data, "RAW_JSON_DIR", str(tmp_path / "raw"))
+    for name, value in {"IMAGE_DIR": tmp_path / "images",
+                        "MANIFEST_DB": tmp_path / "manifest.sqlite",
+                        "RESULT_SEGMENT_DIR": tmp_path / "segments",
+                        "PREFILTER_LOG_PATH": tmp_path / "prefilter_log.jsonl",
+                        "CLIP_SCORES_DIR": tmp_path / "scores",
+                        "TEXT_CACHE_DIR": tmp_path / "text_cache"}.items():
+        monkeypatch.setattr(clip_prefilter, name, str(value))
+    monkeypatch.setattr(clip_prefilter, "USE_CROP_PROVIDER", True)
+    monkeypatch.setattr(clip_prefilter, "NUM_WORKERS", 0)
+    monkeypatch.setattr(clip_prefilter, "BATCH_SIZE", 2)
+    monkeypatch.setattr(clip_prefilter, "CLIP_MODEL", "stub")
+    monkeypatch.setattr(clip_prefilter.clip, "load", lambda *args, **kwargs: (StubCLIP(), preprocess))
+
+    manifest = Manifest(clip_prefilter.MANIFEST_DB)
+    process_image_data.sync_manifest(manifest)
+    return manifest
+
+
+def read_log():
+    with open(clip_prefilter.PREFILTER_LOG_PATH, encoding="utf-8") as file:
+        return {decision["region_id"]: decision for decision in map(json.loads, file)}
+
+
+def test_only_confident_regions_are_accepted(workspace):
+    remaining = clip_prefilter.prefilter_tasks(workspace.outstanding(), threshold=0.6)
+
+    assert sorted((json_file, sorted(region_ids)) for json_file, region_ids in remaining) == [
+        ("1.json", ["1_1", "1_2"]), ("2.json", ["2_0"])]
+    log = read_log()
+    assert sorted(log) == ["1_0", "1_1"]
+    assert log["1_0"]["accepted"] and log["1_0"]["top"] == 1 and log["1_0"]["margin"] > 0.99
+    assert not log["1_1"]["accepted"] and log["1_1"]["margin"] < 0.6
+
+    assert workspace.status("1", "1_0") == DONE
+    assert workspace.status("1", "1_1") == PENDING
+    assert ResultStore(clip_prefilter.RESULT_SEGMENT_DIR).merged() == {
+        "1": {"1_0": {"caption": "red", "category": ""}}}
+
+
+def test_threshold_above_every_margin_accepts_nothing(workspace):
+    clip_prefilter.prefilter_tasks(workspace.outstanding(), threshold=1.01)
+    assert not any(decision["accepted"] for decision in read_log().values())
+    assert workspace.counts()["done"] == 0
+
+
+def test_only_unscored_regions_are_scored_again(workspace, monkeypatch):
+    clip_prefilter.prefilter_tasks(workspace.outstanding(), threshold=0.6)
+
+    # 판단이 기록된 region 은 건너뛰고, crop 을 읽지 못한 region 만 다시 점수화
+    scored = []
+    score_regions = clip_prefilter.score_regions
+
+    def recording_score_regions(model, preprocess, items, *args, **kwargs):
+        scored.extend(region["id"] for _, region in items)
+        return score_regions(model, preprocess, items, *args, **kwargs)
+
+    monkeypatch.setattr(clip_prefilter, "score_regions", recording_score_regions)
+    remaining = clip_prefilter.prefilter_tasks(workspace.outstanding(), threshold=0.6)
+    assert scored == ["2_0"]
+    assert sorted((json_file, sorted(region_ids)) for json_file, region_ids in remaining) == [
+        ("1.json", ["1_1", "1_2"]), ("2.json", ["2_0"])]
+    assert sorted(read_log()) == ["1_0", "1_1"]
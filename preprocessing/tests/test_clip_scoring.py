@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+clip = pytest.importorskip("clip")
+
+from utils.clip_scoring import ClipScores, score_regions
+from utils.crop_provider import CropProvider
+from utils.cropper import crop_image_regions
+from stub_clip import COLORS, StubCLIP, preprocess
+
+
+def region(region_id, x, captions):
+    return {"id": region_id, "x": x, "y": 0, "width": 20, "height": 20, "captions": captions}
+
+
+ITEMS = [
+    ("1", region("1_0", 0, ["red", "green", "blue"])),
+    ("1", region("1_1", 20, ["red", "green"])),
+    ("2", region("2_0", 0, ["red", "green"])),  # 원본 이미지가 없는 region
+    ("1", region("1_2", 20, ["blue", "red"])),
+]
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    pixels = np.zeros((20, 40, 3), dtype=np.uint8)
+    pixels[:, :20] = (255, 0, 0)
+    pixels[:, 20:] = (255, 255, 0)
+    Image.fromarray(pixels).save(tmp_path / "1.jpg", quality=100)
+    return tmp_path
+
+
+def expected_logits(image_dir, vgid, item):
+    features = preprocess(CropProvider(str(image_dir)).crop(vgid, (item["x"], item["y"], item["width"], item["height"])))
+    features = (features / features.norm()).numpy()
+    return np.array([100 * features[COLORS.index(caption)] for caption in item["captions"]], dtype=np.float32)
+
+
+def score(image_dir, output_dir, **kwargs):
+    kwargs.setdefault("image_dir", str(image_dir))
+    return score_regions(StubCLIP(), preprocess, ITEMS, str(output_dir), batch_size=2, num_workers=0, **kwargs)
+
+
+def test_scores(image_dir, tmp_path):
+    batches = []
+    scores = score(image_dir, tmp_path / "scores", on_batch=lambda indices, logits: batches.append(indices))
+
+    assert len(scores) == 4
+    assert scores.find("1", "1_2") == 3
+    for row in (0, 1, 3):
+        vgid, item = ITEMS[row]
+        assert np.allclose(scores.logits(row), expected_logits(image_dir, vgid, item), atol=1e-3)
+    assert np.isnan(scores.logits(2)).all()
+    assert scores.probs(0).argmax() == 0
+    assert abs(scores.probs(1)[0] - scores.probs(1)[1]) < 0.5
+    assert sorted(index for indices in batches for index in indices) == [0, 1, 3]
+
+
+def test_text_cache_and_saved_crops_give_the_same_scores(image_dir, tmp_path):
+    expected = score(image_dir, tmp_path / "scores")
+
+    text_cache = clip.TextEmbeddingCache(StubCLIP(), model_key="stub", cache_dir=str(tmp_path / "text_cache"))
+    crop_image_regions(str(image_dir / "1.jpg"), [item for vgid, item in ITEMS if vgid == "1"],
+                       str(tmp_path / "crops" / "1"), quality=100)
+    actual = score(image_dir, tmp_path / "scores2", crop_dir=str(tmp_path / "crops"), text_cache=text_cache)
+
+    for row in (0, 1, 3):
+        assert np.allclose(actual.logits(row), expected.logits(row), atol=0.5)
+    assert text_cache.stats()["misses"] > 0
+
+
+def test_rerun_only_scores_missing_rows(image_dir, tmp_path):
+    output_dir = tmp_path / "scores"
+    first = score(image_dir, output_dir)
+    expected = [first.logits(row).copy() for row in range(len(first))]
+    del first
+
+    # 1_1 의 점수를 저장하기 전에 중단된 상태
+    similarities = np.load(os.path.join(output_dir, "similarities.npy"), mmap_mode="r+")
+    similarities[3:5] = np.nan
+    similarities.flush()
+    del similarities
+
+    batches = []
+    scores = score(image_dir, output_dir, on_batch=lambda indices, logits: batches.append(indices))
+    assert sorted(index for indices in batches for index in indices) == [1]
+    for row in (0, 1, 3):
+        assert np.array_equal(scores.logits(row), expected[row])
+
+    # region 목록이 바뀌면 새로 계산
+    batches.clear()
+    score_regions(StubCLIP(), preprocess, ITEMS[:2], str(output_dir), image_dir=str(image_dir), batch_size=2,
+                  num_workers=0, on_batch=lambda indices, logits: batches.append(indices))
+    assert sorted(index for indices in batches for index in indices) == [0, 1]
+    assert len(ClipScores(str(output_dir))) == 2
@@ -0,0 +1,58 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.crop_provider import CropProvider
+from utils.cropper import crop_image_regions
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    rng = np.random.RandomState(0)
+    for vgid in ("1", "2", "3"):
+        pixels = rng.randint(0, 255, (60, 80, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(tmp_path / f"{vgid}.jpg", quality=95)
+    return tmp_path
+
+
+def test_crops_match_the_original(image_dir):
+    provider = CropProvider(str(image_dir))
+    crop = provider.crop("1", (10, 20, 30, 15))
+
+    with Image.open(image_dir / "1.jpg") as image:
+        expected = image.convert("RGB").crop((10, 20, 40, 35))
+    assert crop.size == (30, 15)
+    assert np.array_equal(np.asarray(crop), np.asarray(expected))
+    assert provider.crop("1", (75, 55, 30, 30), padding=2).size == (7, 7)
+
+
+def test_cache_hits_and_eviction(image_dir):
+    provider = CropProvider(str(image_dir), cache_size=2)
+    provider.crop("1", (0, 0, 5, 5))
+    provider.crop("1", (5, 5, 5, 5))
+    provider.crop("2", (0, 0, 5, 5))
+    assert provider.stats() == {"hits": 1, "misses": 2, "cached": 2}
+
+    # 1 을 최근에 사용했으므로 3 을 읽을 때 2 가 밀려남
+    provider.crop("1", (0, 0, 5, 5))
+    provider.crop("3", (0, 0, 5, 5))
+    provider.crop("2", (0, 0, 5, 5))
+    assert provider.stats() == {"hits": 2, "misses": 4, "cached": 2}
+
+
+def test_on_the_fly_crop_matches_the_saved_crop(image_dir, tmp_path):
+    regions = [{"id": "1_0", "x": 10, "y": 20, "width": 30, "height": 15}]
+    crop_image_regions(str(image_dir / "1.jpg"), regions, str(tmp_path / "crops"), padding=3, quality=90)
+
+    data = CropProvider(str(image_dir), padding=3).crop_bytes("1", (10, 20, 30, 15), quality=90)
+    with open(os.path.join(tmp_path, "crops", "1_0.jpg"), "rb") as file:
+        assert data == file.read()
+    assert Image.open(io.BytesIO(data)).size == (36, 21)
+
+
+def test_missing_image(image_dir):
+    with pytest.raises(FileNotFoundError):
+        CropProvider(str(image_dir)).crop("9", (0, 0, 5, 5))
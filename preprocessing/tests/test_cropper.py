@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.cropper import crop_image_regions, pad_box
+
+
+@pytest.mark.parametrize("box, padding, expected", [
+    ((10, 20, 30, 40), 0, (10, 20, 40, 60)),
+    ((10, 20, 30, 40), 5, (5, 15, 45, 65)),
+    # 왼쪽/위 경계에서 padding 이 0 아래로 내려가지 않음
+    ((2, 3, 10, 10), 10, (0, 0, 22, 23)),
+    # 오른쪽/아래 경계를 넘지 않음
+    ((90, 70, 20, 20), 10, (80, 60, 100, 80)),
+    # 음수 좌표 (raw 데이터에 가끔 있는 값)
+    ((-5, -5, 20, 20), 0, (0, 0, 15, 15)),
+    # 이미지 밖의 region 은 크기 0 의 박스
+    ((150, 100, 10, 10), 0, (100, 80, 100, 80)),
+])
+def test_pad_box(box, padding, expected):
+    assert pad_box(*box, padding, (100, 80)) == expected
+
+
+def test_pad_box_never_inverts():
+    for x in range(-20, 120, 7):
+        for width in (0, 1, 15, 200):
+            left, top, right, bottom = pad_box(x, x, width, width, 3, (100, 80))
+            assert 0 <= left <= right <= 100
+            assert 0 <= top <= bottom <= 80
+
+
+def make_image(path, size=(400, 300)):
+    rng = np.random.RandomState(0)
+    Image.fromarray(rng.randint(0, 255, (size[1], size[0], 3), dtype=np.uint8)).save(path, quality=95)
+
+
+def test_crop_image_regions(tmp_path):
+    image_path = str(tmp_path / "1.jpg")
+    make_image(image_path)
+    regions = [
+        {"id": "1_0", "x": 10, "y": 10, "width": 50, "height": 40},
+        {"id": "1_1", "x": 380, "y": 290, "width": 50, "height": 50},
+    ]
+
+    results = crop_image_regions(image_path, regions, str(tmp_path / "out"), padding=5)
+    assert results == [("1_0", None), ("1_1", None)]
+    with Image.open(tmp_path / "out" / "1_0.jpg") as crop:
+        assert crop.size == (60, 50)
+    with Image.open(tmp_path / "out" / "1_1.jpg") as crop:
+        assert crop.size == (25, 15)
+
+
+def test_crop_image_regions_with_max_crop_side(tmp_path):
+    image_path = str(tmp_path / "1.jpg")
+    make_image(image_path, size=(1600, 1200))
+    regions = [
+        {"id": "1_0", "x": 0, "y": 0, "width": 1600, "height": 1200},
+        {"id": "1_1", "x": 100, "y": 100, "width": 40, "height": 20},
+    ]
+
+    results = crop_image_regions(image_path, regions, str(tmp_path / "out"), max_crop_side=200)
+    assert results == [("1_0", None), ("1_1", None)]
+    with Image.open(tmp_path / "out" / "1_0.jpg") as crop:
+        assert crop.size == (200, 150)
+    # 작은 region 이 있으면 축소 디코딩하지 않으므로 원본 해상도로 저장
+    with Image.open(tmp_path / "out" / "1_1.jpg") as crop:
+        assert crop.size == (40, 20)
+
+
+def test_region_outside_the_image_is_reported(tmp_path):
+    image_path = str(tmp_path / "1.jpg")
+    make_image(image_path)
+    results = crop_image_regions(image_path, [{"id": "1_0", "x": 500, "y": 500, "width": 10, "height": 10}],
+                                 str(tmp_path / "out"))
+    assert results[0][0] == "1_0"
+    assert results[0][1] is not None
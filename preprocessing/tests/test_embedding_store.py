@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from utils.embedding_store import EmbeddingStore
+
+
+def test_append_skips_existing_keys_and_reopens(tmp_path):
+    store = EmbeddingStore(str(tmp_path), normalize=False)
+    assert store.append([("1", "1_0"), ("1", "1_1")], np.array([[1, 0], [0, 1]], dtype=np.float32)) == 2
+    assert store.append([("1", "1_1"), ("2", "2_0")], np.array([[7, 7], [2, 2]], dtype=np.float32)) == 1
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert reopened.keys == [("1", "1_0"), ("1", "1_1"), ("2", "2_0")]
+    assert reopened.get("1", "1_1").tolist() == [0, 1]
+    assert reopened.rows([("2", "2_0"), ("3", "3_0")]).tolist() == [2, -1]
+    assert reopened.missing([("1", "1_0"), ("3", "3_0")]) == [("3", "3_0")]
+
+
+def test_normalize(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.append([("1", "1_0")], np.array([[3, 4]], dtype=np.float32))
+    assert np.allclose(store.get("1", "1_0"), [0.6, 0.8], atol=1e-3)
+
+
+def test_rows_without_keys_are_dropped_on_reopen(tmp_path):
+    store = EmbeddingStore(str(tmp_path), normalize=False)
+    store.append([("1", "1_0"), ("1", "1_1")], np.array([[1, 0], [0, 1]], dtype=np.float32))
+
+    # append 가 행을 쓴 뒤 key 를 쓰기 전에 중단된 상태
+    with open(os.path.join(tmp_path, "embeddings.f16"), "ab") as file:
+        file.write(np.array([[9, 9]], dtype=np.float16).tobytes())
+    with open(os.path.join(tmp_path, "keys.tsv"), "a", encoding="utf-8") as file:
+        file.write("9\t9_")
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert len(reopened) == 2
+    reopened.append([("2", "2_0")], np.array([[5, 5]], dtype=np.float32))
+
+    store = EmbeddingStore(str(tmp_path))
+    assert store.keys == [("1", "1_0"), ("1", "1_1"), ("2", "2_0")]
+    assert store.get("2", "2_0").tolist() == [5, 5]
+    assert store.matrix.shape == (3, 2)
+
+
+def test_failed_append_in_the_same_process(tmp_path):
+    store = EmbeddingStore(str(tmp_path), normalize=False)
+    store.append([("1", "1_0")], np.array([[1, 0]], dtype=np.float32))
+    with open(os.path.join(tmp_path, "embeddings.f16"), "ab") as file:
+        file.write(np.array([[9, 9]], dtype=np.float16).tobytes())
+
+    store.append([("2", "2_0")], np.array([[5, 5]], dtype=np.float32))
+    assert store.get("2", "2_0").tolist() == [5, 5]
+    assert EmbeddingStore(str(tmp_path)).get("2", "2_0").tolist() == [5, 5]
+
+
+def test_memmap_reopen_and_append(tmp_path):
+    store = EmbeddingStore(str(tmp_path), normalize=False)
+    store.append([("1", "1_0"), ("1", "1_1")], np.array([[1, 0], [0, 1]], dtype=np.float32))
+    before = store.matrix
+    assert isinstance(before, np.memmap) and before.shape == (2, 2)
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert reopened.dim == 2
+    reopened.append([("2", "2_0")], np.array([[0.6, 0.8]], dtype=np.float32))
+    matrix = reopened.matrix
+    assert isinstance(matrix, np.memmap) and matrix.shape == (3, 2)
+    assert np.allclose(matrix, [[1, 0], [0, 1], [0.6, 0.8]], atol=1e-3)
+    # 이전에 열어 둔 memory-map 은 그대로 유효
+    assert before.tolist() == [[1, 0], [0, 1]]
+
+    # copy-on-write 매핑이므로 수정해도 파일은 바뀌지 않음
+    tensor = reopened.tensor()
+    tensor[0, 0] = 5
+    assert matrix[0, 0] == 5
+    assert EmbeddingStore(str(tmp_path)).get("1", "1_0").tolist() == [1, 0]
+
+
+def test_dimension_mismatch(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.append([("1", "1_0")], np.ones((1, 4), dtype=np.float32))
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path)).append([("1", "1_1")], np.ones((1, 3), dtype=np.float32))
@@ -0,0 +1,47 @@
+import base64
+
+from PIL import Image
+
+from utils.image_payload import ImagePayload
+from utils.response_cache import ResponseCache
+
+
+def test_small_jpeg_is_sent_as_is(tmp_path):
+    path = tmp_path / "1_0.jpg"
+    Image.new("RGB", (100, 50), "red").save(path)
+
+    payload = ImagePayload(str(path))
+    assert base64.b64decode(payload.encode()) == path.read_bytes()
+    assert payload.detail == "low"
+
+
+def test_large_image_is_resized(tmp_path):
+    path = tmp_path / "1_0.png"
+    Image.new("RGB", (2000, 1000), "red").save(path)
+
+    payload = ImagePayload(str(path), max_side=768)
+    payload.encode()
+    assert payload.size == (768, 384)
+    assert payload.detail == "high"
+
+
+def test_missing_image(tmp_path):
+    assert ImagePayload(str(tmp_path / "missing.jpg")).encode() == ""
+
+
+def test_corrupt_image_falls_back_to_raw_bytes(tmp_path):
+    path = tmp_path / "1_0.jpg"
+    path.write_bytes(b"\xff\xd8\xff\xe0 truncated")
+
+    payload = ImagePayload(str(path))
+    assert base64.b64decode(payload.encode()) == path.read_bytes()
+    assert payload.detail == "high"
+    # ask_gpt 가 요청 전에 만드는 캐시 키도 예외 없이 만들어져야 합니다
+    assert ResponseCache.make_key("gpt-4o", 0, 100, "system", "prompt", payload)
+
+
+def test_failing_crop_source(tmp_path):
+    def crop():
+        raise OSError("cannot identify image file")
+
+    assert ImagePayload(crop).encode() == ""
@@ -0,0 +1,87 @@
+import sqlite3
+
+from utils.manifest import DONE, FAILED, PENDING, SUBMITTED, SUBMITTED_TIMEOUT, Manifest
+
+
+def make_manifest(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+    manifest.register_file("a.json", "1", ["1_0", "1_1", "1_2"], done_keys={("1", "1_2")})
+    manifest.register_file("b.json", "2", ["2_0"])
+    return manifest
+
+
+def status(manifest, vgid, region_id):
+    return manifest.conn.execute("SELECT status FROM units WHERE vgid = ? AND region_id = ?",
+                                 (vgid, region_id)).fetchone()[0]
+
+
+def test_register_file(tmp_path):
+    manifest = make_manifest(tmp_path)
+    assert manifest.known_files() == {"a.json", "b.json"}
+    assert manifest.counts() == {"pending": 3, "done": 1, "failed": 0, "submitted": 0}
+    assert manifest.outstanding() == [("a.json", ["1_0", "1_1"]), ("b.json", ["2_0"])]
+    assert manifest.lookup_file("2", "2_0") == "b.json"
+    assert manifest.lookup_file("3", "3_0") is None
+
+
+def test_register_file_again_keeps_state(tmp_path):
+    manifest = make_manifest(tmp_path)
+    manifest.mark_done("1", "1_0")
+    manifest.register_file("a.json", "1", ["1_0", "1_1", "1_2"])
+    assert status(manifest, "1", "1_0") == DONE
+    assert status(manifest, "1", "1_2") == DONE
+
+
+def test_state_transitions(tmp_path):
+    manifest = make_manifest(tmp_path)
+    manifest.mark_done("1", "1_0")
+    manifest.mark_failed("1", "1_1", "GPT response is None")
+    assert status(manifest, "1", "1_1") == FAILED
+    assert manifest.outstanding() == [("a.json", ["1_1"]), ("b.json", ["2_0"])]
+    assert manifest.outstanding(include_failed=False) == [("b.json", ["2_0"])]
+
+    manifest.mark("1", "1_1", PENDING)
+    assert manifest.conn.execute("SELECT error FROM units WHERE region_id = '1_1'").fetchone()[0] is None
+    assert manifest.counts() == {"pending": 2, "done": 2, "failed": 0, "submitted": 0}
+
+
+def test_state_survives_reopen(tmp_path):
+    manifest = make_manifest(tmp_path)
+    manifest.mark_done("2", "2_0")
+    manifest.close()
+
+    reopened = Manifest(str(tmp_path / "manifest.sqlite"))
+    assert reopened.outstanding() == [("a.json", ["1_0", "1_1"])]
+
+
+def test_submitted_regions_are_requeued_after_the_timeout(tmp_path):
+    manifest = make_manifest(tmp_path)
+    manifest.mark_submitted("1", "1_0")
+    assert manifest.outstanding() == [("a.json", ["1_1"]), ("b.json", ["2_0"])]
+    assert manifest.counts()["submitted"] == 1
+
+    # batch 가 만료/유실되어 결과가 오지 않은 경우
+    manifest.conn.execute("UPDATE units SET submitted_at = submitted_at - 2 * ? WHERE region_id = '1_0'",
+                          (SUBMITTED_TIMEOUT,))
+    assert manifest.outstanding() == [("a.json", ["1_0", "1_1"]), ("b.json", ["2_0"])]
+    assert manifest.outstanding(submitted_timeout=None) == [("a.json", ["1_1"]), ("b.json", ["2_0"])]
+
+    manifest.mark_done("1", "1_0")
+    assert manifest.conn.execute("SELECT submitted_at FROM units WHERE region_id = '1_0'").fetchone()[0] is None
+
+
+def test_old_manifest_gets_submitted_at(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE files (file TEXT PRIMARY KEY, vgid TEXT);
+        CREATE TABLE units (file TEXT NOT NULL, vgid TEXT NOT NULL, region_id TEXT NOT NULL,
+                            status INTEGER NOT NULL DEFAULT 0, error TEXT, PRIMARY KEY (vgid, region_id));
+    """)
+    conn.execute("INSERT INTO units VALUES ('a.json', '1', '1_0', ?, NULL)", (SUBMITTED,))
+    conn.commit()
+    conn.close()
+
+    manifest = Manifest(path)
+    assert manifest.outstanding() == []
+    assert manifest.outstanding(submitted_timeout=-1) == [("a.json", ["1_0"])]
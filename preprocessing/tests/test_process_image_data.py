@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import pytest
+
+import process_image_data
+from utils.manifest import Manifest
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for vgid in ("1", "2"):
+        regions = [{"id": f"{vgid}_{idx}", "x": 0, "y": 0, "width": 4, "height": 4,
+                    "captions": [{"caption": f"{vgid}_{idx}_a", "counterfactual_caption": "x"},
+                                 {"caption": f"{vgid}_{idx}_b", "counterfactual_caption": "y"}]}
+                   for idx in range(2)]
+        (raw_dir / f"{vgid}.json").write_text(json.dumps({vgid: {"regions": regions}}))
+    (tmp_path / "keys.json").write_text(json.dumps({"openai": {"api_key": "k"}}))
+
+    for name, value in {"RAW_JSON_DIR": raw_dir,
+                        "CROPPED_IMAGE_DIR": tmp_path / "crops",
+                        "RESULT_SEGMENT_DIR": tmp_path / "segments",
+                        "MANIFEST_DB": tmp_path / "manifest.sqlite",
+                        "RESPONSE_CACHE_DB": tmp_path / "cache.sqlite",
+                        "API_KEYS_PATH": tmp_path / "keys.json"}.items():
+        monkeypatch.setattr(process_image_data, name, str(value))
+    for name in ("result_store", "manifest", "response_cache"):
+        monkeypatch.setattr(process_image_data, name, None)
+    monkeypatch.setattr(process_image_data, "MAX_CONCURRENCY", 2)
+
+    manifest = Manifest(process_image_data.MANIFEST_DB)
+    process_image_data.sync_manifest(manifest)
+    process_image_data.init_worker()
+    return manifest
+
+
+def test_failing_job_does_not_abort_the_async_run(pipeline, monkeypatch):
+    async def select_captions_async(handler, captions_list, images):
+        if captions_list[0][0].startswith("1_0"):
+            raise OSError("cannot identify image file")
+        return ["Answer: 1"] * len(captions_list)
+
+    monkeypatch.setattr(process_image_data, "select_captions_async", select_captions_async)
+    results = asyncio.run(process_image_data.process_json_files_async(pipeline.outstanding()))
+
+    errors = [result for result in results if result["status"] == "error"]
+    assert [(result["file"], result["region_id"]) for result in errors] == [("1.json", "1_0")]
+    assert "cannot identify image file" in errors[0]["response"]
+    assert pipeline.counts() == {"pending": 0, "done": 3, "failed": 1, "submitted": 0}
+    assert process_image_data.ResultStore(process_image_data.RESULT_SEGMENT_DIR).processed_keys() == {
+        ("1", "1_1"), ("2", "2_0"), ("2", "2_1")}
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+import process_image_data
+from utils.raw_index import RawIndex
+
+RAW = {
+    "a.json": {"1": {"regions": [
+        {"id": "1_0", "x": 1, "y": 2, "width": 3, "height": 4,
+         "captions": [{"caption": "a dog", "counterfactual_caption": "a cat"},
+                      {"caption": "한국어 caption", "counterfactual_caption": "a dog"}]},
+        {"id": "1_1", "x": 0, "y": 0, "width": 10, "height": 10,
+         "captions": [{"caption": "a dog", "counterfactual_caption": ""}]},
+    ]}},
+    "b.json": {"2": {"regions": []}},
+    "c.json": {"3": {"regions": [
+        {"id": "3_0", "x": 5, "y": 6, "width": 7, "height": 8, "captions": []},
+    ]}},
+}
+
+
+@pytest.fixture
+def raw_dir(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for json_file, data in RAW.items():
+        (raw_dir / json_file).write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return raw_dir
+
+
+def test_build_and_lookup(raw_dir, tmp_path):
+    RawIndex.build(str(raw_dir), str(tmp_path / "index"))
+    index = RawIndex(str(tmp_path / "index"))
+
+    assert len(index) == 3
+    assert index.region(index.find("1_0")) == {
+        "file": "a.json", "vgid": "1", "id": "1_0", "x": 1, "y": 2, "width": 3, "height": 4,
+        "captions": ["a dog", "한국어 caption"], "counterfactual_captions": ["a cat", "a dog"]}
+    assert index.counterfactual_captions(index.find("1_1")) == [""]
+    assert index.captions(index.find("3_0")) == []
+    assert index.find("9_0") is None
+
+    assert index.rows_for_file("a.json") == range(0, 2)
+    assert index.rows_for_file("b.json") == range(0)
+    assert index.rows_for_vgid("3") == range(2, 3)
+    assert [region["id"] for region in index.iter_regions()] == ["1_0", "1_1", "3_0"]
+
+
+def test_selected_files(raw_dir, tmp_path):
+    index = RawIndex.build(str(raw_dir), str(tmp_path / "index"), json_files=["c.json"])
+    assert [region["id"] for region in index.iter_regions()] == ["3_0"]
+
+
+def test_read_raw_regions_matches_the_json(raw_dir, tmp_path, monkeypatch):
+    RawIndex.build(str(raw_dir), str(tmp_path / "index"))
+    monkeypatch.setattr(process_image_data, "RAW_JSON_DIR", str(raw_dir))
+    monkeypatch.setattr(process_image_data, "RAW_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(process_image_data, "raw_index", None)
+
+    from_json = process_image_data.read_raw_regions("a.json")
+    monkeypatch.setattr(process_image_data, "USE_RAW_INDEX", True)
+    vgid, regions = process_image_data.read_raw_regions("a.json")
+
+    assert vgid == from_json[0]
+    for region, expected in zip(regions, from_json[1]):
+        for key, value in expected.items():
+            assert region[key] == value
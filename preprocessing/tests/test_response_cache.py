@@ -0,0 +1,62 @@
+import base64
+
+from PIL import Image
+
+from utils.image_payload import ImagePayload
+from utils.response_cache import ResponseCache
+
+
+def make_key(prompt="prompt", image="AA", model="gpt-4o"):
+    return ResponseCache.make_key(model, 0, 1000, "system", prompt, image)
+
+
+def test_key_is_stable():
+    assert make_key() == make_key()
+    assert make_key(image=["AA", "BB"]) == make_key(image=["AA", "BB"])
+    assert len({make_key(), make_key(prompt="other"), make_key(image="BB"), make_key(model="gpt-4o-mini"),
+                make_key(image=["AA", "BB"]), make_key(image=["BB", "AA"]), make_key(image=None)}) == 7
+
+
+def test_payload_key_matches_the_sent_bytes(tmp_path):
+    path = tmp_path / "1_0.jpg"
+    Image.new("RGB", (64, 32), "red").save(path)
+    encoded = base64.b64encode(path.read_bytes()).decode("utf-8")
+
+    assert make_key(image=ImagePayload(str(path))) == make_key(image=encoded)
+    assert make_key(image=ImagePayload(str(path))) == make_key(image=ImagePayload(str(path)))
+
+
+def test_hit_and_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    assert cache.get("a") is None
+    cache.put("a", "Answer: 1")
+    assert cache.get("a") == "Answer: 1"
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    reopened = ResponseCache(str(tmp_path / "cache.sqlite"))
+    assert reopened.get("a") == "Answer: 1"
+    assert reopened.stats() == {"hits": 2, "misses": 1, "bytes": 9, "entries": 1}
+
+
+def test_get_does_not_write(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    cache.put("a", "Answer: 1")
+    changes = cache.conn.total_changes
+    for _ in range(10):
+        cache.get("a")
+        cache.get("b")
+    assert cache.conn.total_changes == changes
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=20)
+    cache.put("a", "x" * 8)
+    cache.put("b", "x" * 8)
+    cache.get("a")
+    cache.put("c", "x" * 8)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["bytes"] == 16
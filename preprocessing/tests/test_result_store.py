@@ -0,0 +1,67 @@
+import json
+import os
+
+from utils.result_store import ResultStore
+
+
+def test_records_are_merged_in_order_over_the_base_file(tmp_path):
+    base_path = tmp_path / "image_metadata.json"
+    base_path.write_text(json.dumps({"1": {"1_0": {"caption": "old", "category": "animal"}}}), encoding="utf-8")
+
+    store = ResultStore(str(tmp_path / "segments"))
+    store.append("1", "1_0", {"caption": "new"})
+    store.append("2", "2_0", {"caption": "a dog", "category": ""})
+    store.append("2", "2_0", {"category": "animal"})
+    store.close()
+
+    assert store.processed_keys() == {("1", "1_0"), ("2", "2_0")}
+    assert store.merged(str(base_path)) == {
+        "1": {"1_0": {"caption": "new", "category": "animal"}},
+        "2": {"2_0": {"caption": "a dog", "category": "animal"}},
+    }
+
+
+def test_compact_writes_the_merged_file(tmp_path):
+    store = ResultStore(str(tmp_path / "segments"))
+    store.append("1", "1_0", {"caption": "한국어 caption"})
+    store.close()
+
+    output_path = str(tmp_path / "out.json")
+    assert store.compact(output_path) == 1
+    with open(output_path, encoding="utf-8") as file:
+        assert json.load(file) == {"1": {"1_0": {"caption": "한국어 caption"}}}
+    assert not os.path.exists(output_path + ".tmp")
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    segment_dir = tmp_path / "segments"
+    store = ResultStore(str(segment_dir))
+    store.append("1", "1_0", {"caption": "a"})
+    store.close()
+    # 쓰는 도중 종료된 worker 의 segment
+    (segment_dir / "99999.jsonl").write_text('{"vgid": "1", "region_id": "1_1", "rec', encoding="utf-8")
+
+    assert list(ResultStore(str(segment_dir)).iter_records()) == [("1", "1_0", {"caption": "a"})]
+
+
+def test_each_process_writes_its_own_segment(tmp_path):
+    store = ResultStore(str(tmp_path))
+    store.append("1", "1_0", {"caption": "a"})
+    store.close()
+    assert os.listdir(tmp_path) == [f"{os.getpid()}.jsonl"]
+
+
+def test_segments_are_merged_in_write_order(tmp_path):
+    def line(caption, ts=None):
+        item = {"vgid": "1", "region_id": "1_0", "record": {"caption": caption}}
+        if ts is not None:
+            item["ts"] = ts
+        return json.dumps(item) + "\n"
+
+    # pid 이름의 사전순(1 < 2)과 기록 시각의 순서가 반대인 segment
+    (tmp_path / "1.jsonl").write_text(line("late", ts=200), encoding="utf-8")
+    (tmp_path / "2.jsonl").write_text(line("legacy") + line("early", ts=100), encoding="utf-8")
+
+    store = ResultStore(str(tmp_path))
+    assert [record["caption"] for _, _, record in store.iter_records()] == ["legacy", "early", "late"]
+    assert store.merged() == {"1": {"1_0": {"caption": "late"}}}
@@ -0,0 +1,33 @@
+import json
+
+import process_image_data
+import select_candidate_captions
+from select_candidate_captions import NOT_FOUND_CAPTION
+
+
+def test_counterfactual_captions_are_merged_in_one_pass(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    raw = {"1": {"regions": [
+        {"id": "1_0", "x": 0, "y": 0, "width": 1, "height": 1,
+         "captions": [{"caption": "a dog", "counterfactual_caption": "a cat"},
+                      {"caption": "a dog", "counterfactual_caption": "a bird"},
+                      {"caption": "a red car", "counterfactual_caption": "a blue car"}]},
+    ]}}
+    (raw_dir / "1.json").write_text(json.dumps(raw))
+    (raw_dir / "broken.json").write_text("{")
+    processed = tmp_path / "copy_image_metadata.json"
+    processed.write_text(json.dumps({"1": {"1_0": {"caption": "a dog", "category": "animal"},
+                                           "1_1": {"caption": "a tree", "category": ""}}}))
+
+    monkeypatch.setattr(process_image_data, "RAW_JSON_DIR", str(raw_dir))
+    monkeypatch.setattr(select_candidate_captions, "PROCESSED_JSON", str(processed))
+    missing, errors = select_candidate_captions.select_candidate_captions(["1.json", "broken.json"])
+
+    assert missing == [("1", "1_1")]
+    assert list(errors) == ["broken.json"]
+    assert json.loads(processed.read_text()) == {"1": {
+        # 같은 caption 이 여러 번 있으면 처음 것을 사용
+        "1_0": {"caption": "a dog", "category": "animal", "counterfactual_caption": "a cat"},
+        "1_1": {"caption": "a tree", "category": "", "counterfactual_caption": NOT_FOUND_CAPTION}}}
+    assert not (tmp_path / "copy_image_metadata.json.tmp").exists()
@@ -0,0 +1,51 @@
+import pytest
+
+from process_image_data import split_packed_response
+from select_image_caption import parse_packed_answers
+
+CAPTIONS = [["a", "b"], ["a", "b", "c"], ["a", "b"]]
+
+
+@pytest.mark.parametrize("response, expected", [
+    ("Image 1: 1\nImage 2: 2\nImage 3: 0", [1, 2, 0]),
+    ("image 1 : 1\n  Image 2:2  \nIMAGE 3: 0", [1, 2, 0]),
+    # 순서가 바뀌어도 번호로 매칭
+    ("Image 3: 0\nImage 1: 1\nImage 2: 2", [1, 2, 0]),
+    # 이유가 적힌 이미지와 빠진 이미지
+    ("Image 1: 1\nImage 2: I cannot see the object", [1, None, None]),
+    # 없는 이미지 번호는 무시
+    ("Image 0: 1\nImage 1: 1\nImage 4: 1", [1, None, None]),
+    # 범위를 벗어난 caption 번호
+    ("Image 1: 2\nImage 2: 3\nImage 3: 1", [None, None, 1]),
+    # 한 줄에 번호 외의 내용이 있으면 답으로 보지 않음
+    ("Image 1: 1 because it is red\nImage 2: 1", [None, 1, None]),
+    ('{"Image 1": 1, "Image 2": 2}', [None, None, None]),
+    ("Answer: 1", [None, None, None]),
+    ("", [None, None, None]),
+    (None, [None, None, None]),
+])
+def test_parse_packed_answers(response, expected):
+    assert parse_packed_answers(response, CAPTIONS) == expected
+
+
+def test_unanswered_regions_fall_back_to_single_prompts():
+    assert split_packed_response("Image 1: 1\nImage 3: I am not sure", CAPTIONS) == ["Answer: 1", None, None]
+    assert split_packed_response(None, CAPTIONS) == [None, None, None]
+
+
+def test_select_captions_retries_unanswered_regions(monkeypatch):
+    import process_image_data
+
+    calls = []
+
+    def ask_gpt(prompt, image, max_tokens, cache=None, validate=None):
+        calls.append(image)
+        if isinstance(image, list):
+            return "Image 1: 1\nImage 2: cannot see\nImage 3: 5"
+        return "Answer: 0"
+
+    monkeypatch.setattr(process_image_data, "ask_gpt", ask_gpt)
+    responses = process_image_data.select_captions(CAPTIONS, ["i1", "i2", "i3"])
+
+    assert responses == ["Answer: 1", "Answer: 0", "Answer: 0"]
+    assert calls == [["i1", "i2", "i3"], "i2", "i3"]
@@ -1,3 +1,10 @@
 from .gpt import GPTHandler
+from .async_gpt import AsyncGPTHandler
+from .crop_provider import CropProvider
+from .image_payload import ImagePayload
+from .manifest import Manifest
+from .raw_index import RawIndex
+from .response_cache import ResponseCache
+from .result_store import ResultStore
 
-__all__ = ['GPTHandler']
+__all__ = ['GPTHandler', 'AsyncGPTHandler', 'CropProvider', 'ImagePayload', 'Manifest', 'RawIndex', 'ResponseCache', 'ResultStore']
@@ -0,0 +1,214 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, List, Dict, Any
+
+import openai
+
+from .gpt import GPTHandler, SYSTEM_PROMPT, build_messages
+from .image_payload import ImageInput, ImagePayload
+from .response_cache import ResponseCache
+
+# 재시도 대상 HTTP 상태 코드 (rate limit 과 서버 오류)
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# 이미지 한 장이 차지하는 입력 토큰 추정치 (high detail 512px 타일 기준의 보수적인 값)
+IMAGE_TOKEN_ESTIMATE = 765
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        """분당 허용량을 초 단위로 채우는 token bucket
+
+        Args:
+            per_minute (float): 분당 허용량. bucket 의 최대 용량이기도 합니다.
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """amount 만큼의 여유가 생길 때까지 기다린 뒤 차감합니다.
+
+        lock 을 잡고 기다리므로 먼저 요청한 쪽이 먼저 통과합니다(FIFO).
+        용량보다 큰 요청은 용량만큼으로 잘라서 처리합니다.
+        """
+        amount = min(float(amount), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AsyncGPTHandler:
+    def __init__(self,
+                 json_path: Optional[str] = None,
+                 api_key: Optional[str] = None,
+                 max_concurrency: int = 16,
+                 requests_per_minute: float = 500,
+                 tokens_per_minute: float = 30000,
+                 max_retries: int = 6,
+                 api_base: Optional[str] = None,
+                 request_timeout: float = 120,
+                 cache: Optional[ResponseCache] = None):
+        """비동기 GPT 핸들러 초기화
+
+        동시에 진행 중인 요청 수와 분당 요청/토큰 수를 제한하며, 429/5xx 응답은
+        Retry-After 헤더를 따르거나 지수 백오프로 재시도합니다.
+
+        Args:
+            json_path (Optional[str]): OpenAI API 키가 저장된 JSON 파일 경로
+            api_key (Optional[str]): API 키를 직접 지정할 경우 사용
+            max_concurrency (int, optional): 동시에 보낼 수 있는 최대 요청 수. Defaults to 16.
+            requests_per_minute (float, optional): 분당 최대 요청 수. Defaults to 500.
+            tokens_per_minute (float, optional): 분당 최대 토큰 수 (입력 추정치 + max_tokens). Defaults to 30000.
+            max_retries (int, optional): 재시도 가능한 오류에 대한 최대 재시도 횟수. Defaults to 6.
+            api_base (Optional[str]): API 엔드포인트. 테스트 시 로컬 가짜 서버 주소를 지정합니다.
+            request_timeout (float, optional): 요청당 타임아웃(초). Defaults to 120.
+            cache (Optional[ResponseCache]): 동일한 요청의 응답을 재사용할 디스크 캐시
+        """
+        self.api_key = api_key if api_key is not None else GPTHandler.load_api_key(json_path)
+        self.api_base = api_base
+        self.max_retries = max_retries
+        self.request_timeout = request_timeout
+        self.cache = cache
+        # SQLite 캐시 조회/저장은 event loop 를 막지 않도록 전용 thread 하나에서 순서대로 실행 (처음 사용할 때 생성)
+        self._cache_executor = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._request_bucket = TokenBucket(requests_per_minute)
+        self._token_bucket = TokenBucket(tokens_per_minute)
+        self._session = None
+        self._session_token = None
+
+    async def __aenter__(self):
+        """요청들이 하나의 aiohttp 세션(커넥션 풀)을 공유하도록 설정합니다."""
+        import aiohttp
+
+        self._session = aiohttp.ClientSession()
+        self._session_token = openai.aiosession.set(self._session)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        openai.aiosession.reset(self._session_token)
+        await self._session.close()
+        self._session = None
+        if self._cache_executor is not None:
+            self._cache_executor.shutdown()
+            self._cache_executor = None
+
+    @staticmethod
+    def estimate_tokens(prompt: str, max_tokens: int, n_images: int = 1) -> int:
+        """요청이 TPM 한도에서 차지할 토큰 수를 추정합니다 (문자 4개당 1토큰)."""
+        return len(SYSTEM_PROMPT) // 4 + len(prompt) // 4 + n_images * IMAGE_TOKEN_ESTIMATE + max_tokens
+
+    @staticmethod
+    def _encode_images(base64_image: ImageInput) -> None:
+        # ImagePayload 는 처음 encode() 할 때 PIL 로 디코딩/재인코딩하고 결과를 보관함
+        images = base64_image if isinstance(base64_image, list) else [base64_image]
+        for image in images:
+            if isinstance(image, ImagePayload):
+                image.encode()
+
+    async def _run_cache(self, func, *args):
+        if self._cache_executor is None:
+            self._cache_executor = ThreadPoolExecutor(max_workers=1)
+        return await asyncio.get_running_loop().run_in_executor(self._cache_executor, func, *args)
+
+    @staticmethod
+    def _retry_after(error: openai.error.OpenAIError) -> Optional[float]:
+        headers = getattr(error, "headers", None) or {}
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (openai.error.Timeout, openai.error.APIConnectionError,
+                              openai.error.TryAgain, asyncio.TimeoutError)):
+            return True
+        return getattr(error, "http_status", None) in RETRY_STATUSES
+
+    async def ask_gpt(self,
+                      prompt: str,
+                      base64_image: ImageInput,
+                      max_tokens: int = 1000,
+                      model: str = "gpt-4o",
+                      temperature: float = 0,
+                      validate: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """GPT API를 비동기로 호출하여 응답을 받아옵니다.
+
+        Args:
+            prompt (str): GPT에게 전달할 프롬프트
+            base64_image (ImageInput): Base64로 인코딩된 이미지 또는 ImagePayload (여러 장이면 순서대로 첨부)
+            max_tokens (int, optional): 최대 토큰 수. Defaults to 1000.
+            model (str, optional): 사용할 GPT 모델. Defaults to "gpt-4o".
+            temperature (float, optional): 응답의 다양성 조절. Defaults to 0.
+            validate (Optional[Callable[[str], bool]]): 주어지면 True 를 반환한 응답만 캐시에 저장하고 재사용합니다.
+
+        Returns:
+            Optional[str]: GPT의 응답 또는 에러 발생 시 None
+        """
+        # 이미지 인코딩은 worker thread 에서 미리 해 두므로 이후의 make_key/build_messages 는 바로 반환
+        await asyncio.to_thread(self._encode_images, base64_image)
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(model, temperature, max_tokens, SYSTEM_PROMPT, prompt, base64_image)
+            cached = await self._run_cache(self.cache.get, cache_key)
+            if cached is not None and (validate is None or validate(cached)):
+                return cached
+
+        messages = build_messages(prompt, base64_image)
+        n_images = len(base64_image) if isinstance(base64_image, list) else 1
+        estimated_tokens = self.estimate_tokens(prompt, max_tokens, n_images)
+
+        for attempt in range(self.max_retries + 1):
+            await self._request_bucket.acquire(1)
+            await self._token_bucket.acquire(estimated_tokens)
+            try:
+                async with self._semaphore:
+                    response = await openai.ChatCompletion.acreate(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        api_key=self.api_key,
+                        api_base=self.api_base,
+                        request_timeout=self.request_timeout
+                    )
+                answer = response.choices[0].message['content'].strip()
+                if self.cache is not None and (validate is None or validate(answer)):
+                    await self._run_cache(self.cache.put, cache_key, answer)
+                return answer
+            except Exception as e:
+                if attempt == self.max_retries or not self._is_retryable(e):
+                    print(f"OpenAI error: {e}")
+                    return None
+                delay = self._retry_after(e)
+                if delay is None:
+                    delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+                await asyncio.sleep(delay)
+        return None
+
+    async def ask_gpt_many(self, jobs: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """여러 요청을 한도 안에서 동시에 보내고 입력 순서대로 응답을 반환합니다.
+
+        Args:
+            jobs (List[Dict[str, Any]]): ask_gpt 의 keyword 인자 dict 목록
+
+        Returns:
+            List[Optional[str]]: 각 요청의 응답 (실패 시 None)
+        """
+        return await asyncio.gather(*(self.ask_gpt(**job) for job in jobs))
+
@@ -0,0 +1,142 @@
+import json
+import os
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+
+# OpenAI Batch API 의 입력 파일 제한 (요청 50,000개 / 200MB) 보다 약간 작게 잡은 값
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+
+def make_custom_id(task: str, vgid: str, region_id: str) -> str:
+    """작업 종류와 region 을 나타내는 안정적인 custom_id 를 만듭니다.
+
+    region_id 에는 '_' 가 포함되므로 구분자로 '/' 를 사용합니다. (예: caption/2333448/2333448_0)
+    """
+    return f"{task}/{vgid}/{region_id}"
+
+
+def parse_custom_id(custom_id: str) -> Tuple[str, str, str]:
+    """make_custom_id 로 만든 custom_id 를 (task, vgid, region_id) 로 분리합니다."""
+    task, vgid, region_id = custom_id.split("/", 2)
+    return task, vgid, region_id
+
+
+def build_batch_request(custom_id: str,
+                        messages: List[Dict[str, Any]],
+                        max_tokens: int = 1000,
+                        model: str = "gpt-4o",
+                        temperature: float = 0) -> Dict[str, Any]:
+    """Batch API 입력 파일의 한 줄에 해당하는 요청을 만듭니다.
+
+    Args:
+        custom_id (str): 결과와 요청을 연결하기 위한 id
+        messages (List[Dict[str, Any]]): ChatCompletion 요청의 messages
+        max_tokens (int, optional): 최대 토큰 수. Defaults to 1000.
+        model (str, optional): 사용할 GPT 모델. Defaults to "gpt-4o".
+        temperature (float, optional): 응답의 다양성 조절. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: /v1/chat/completions 요청
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+    }
+
+
+class BatchWriter:
+    def __init__(self,
+                 path_prefix: str,
+                 max_requests: int = MAX_REQUESTS_PER_FILE,
+                 max_bytes: int = MAX_BYTES_PER_FILE):
+        """Batch API 입력 JSONL 을 제한 크기마다 나누어 쓰는 writer
+
+        Args:
+            path_prefix (str): 출력 파일 경로 접두사. {path_prefix}_000.jsonl 형태로 저장됩니다.
+            max_requests (int, optional): 파일 하나에 담을 최대 요청 수
+            max_bytes (int, optional): 파일 하나의 최대 크기(바이트)
+        """
+        self.path_prefix = path_prefix
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.paths: List[str] = []
+        self._file = None
+        self._requests = 0
+        self._bytes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path_prefix)), exist_ok=True)
+
+    def _rotate(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        path = f"{self.path_prefix}_{len(self.paths):03d}.jsonl"
+        self._file = open(path, 'w', encoding='utf-8')
+        self.paths.append(path)
+        self._requests = 0
+        self._bytes = 0
+
+    def write(self, request: Dict[str, Any]) -> None:
+        line = (json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8")
+        if (self._file is None or self._requests >= self.max_requests
+                or (self._requests and self._bytes + len(line) > self.max_bytes)):
+            self._rotate()
+        self._file.write(line.decode("utf-8"))
+        self._requests += 1
+        self._bytes += len(line)
+
+    def close(self) -> List[str]:
+        """파일을 닫고 지금까지 작성된 파일 경로 목록을 반환합니다."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_batch_results(path: str) -> Iterator[Tuple[Optional[str], Optional[str], Optional[str]]]:
+    """Batch API 결과 JSONL 을 읽어 (custom_id, 응답 텍스트, 에러) 를 반환합니다.
+
+    요청이 실패했거나 응답 형식이 올바르지 않으면 응답 텍스트는 None 이고 에러에 사유가 담깁니다.
+    JSON 으로 읽을 수 없는 줄(예: 다운로드 도중 잘린 파일)은 custom_id 도 None 으로 반환합니다.
+
+    Args:
+        path (str): 결과(또는 에러) JSONL 파일 경로
+
+    Yields:
+        Tuple[Optional[str], Optional[str], Optional[str]]: (custom_id, 응답 텍스트, 에러 메시지)
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                yield None, None, f"malformed line: {line.strip()[:200]}"
+                continue
+            custom_id = item.get("custom_id")
+            if item.get("error"):
+                yield custom_id, None, json.dumps(item["error"], ensure_ascii=False)
+                continue
+
+            response = item.get("response") or {}
+            if response.get("status_code") != 200:
+                yield custom_id, None, f"status_code {response.get('status_code')}"
+                continue
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                yield custom_id, None, "malformed response body"
+                continue
+            yield custom_id, content.strip(), None
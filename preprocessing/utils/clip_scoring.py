@@ -0,0 +1,300 @@
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import clip
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from tqdm import tqdm
+
+from .crop_provider import CropProvider
+from .embedding_store import EmbeddingStore
+
+# (vgid, region) 목록. region 은 read_raw_regions 형태 (id, x, y, width, height, captions)
+RegionItem = Tuple[str, Dict[str, Any]]
+
+
+class RegionCropDataset(Dataset):
+    def __init__(self,
+                 items: Sequence[RegionItem],
+                 preprocess: Callable[[Image.Image], torch.Tensor],
+                 crop_dir: Optional[str] = None,
+                 image_dir: Optional[str] = None,
+                 padding: int = 0,
+                 cache_size: int = 8):
+        """region crop 을 읽어서 CLIP 입력 텐서로 변환하는 Dataset
+
+        crop_dir 이 주어지면 {crop_dir}/{vgid}/{region_id}.jpg 를 읽고, 아니면 image_dir 의
+        원본 이미지에서 CropProvider 로 바로 crop 합니다. 디코딩과 preprocess 는 DataLoader
+        worker 프로세스에서 실행됩니다.
+
+        Args:
+            items (Sequence[RegionItem]): 점수화할 (vgid, region) 목록
+            preprocess (Callable): clip.load 가 반환한 이미지 transform
+            crop_dir (Optional[str]): 미리 저장된 crop 이미지 디렉토리
+            image_dir (Optional[str]): 원본 이미지 디렉토리 (crop_dir 이 없을 때 사용)
+            padding (int, optional): 원본에서 crop 할 때의 padding. Defaults to 0.
+            cache_size (int, optional): worker 마다 보관할 디코딩된 원본 이미지 수. Defaults to 8.
+        """
+        if crop_dir is None and image_dir is None:
+            raise ValueError("crop_dir or image_dir is required")
+        self.items = items
+        self.preprocess = preprocess
+        self.crop_dir = crop_dir
+        self.image_dir = image_dir
+        self.padding = padding
+        self.cache_size = cache_size
+        self._provider: Optional[CropProvider] = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _load(self, vgid: str, region: Dict[str, Any]) -> Image.Image:
+        if self.crop_dir is not None:
+            with Image.open(os.path.join(self.crop_dir, f"{vgid}/{region['id']}.jpg")) as image:
+                return image.convert("RGB")
+        # CropProvider 는 worker 프로세스 안에서 처음 사용할 때 만듦
+        if self._provider is None:
+            self._provider = CropProvider(self.image_dir, cache_size=self.cache_size, padding=self.padding)
+        return self._provider.crop(vgid, (region["x"], region["y"], region["width"], region["height"]))
+
+    def __getitem__(self, index: int) -> Tuple[int, Optional[torch.Tensor]]:
+        vgid, region = self.items[index]
+        try:
+            return index, self.preprocess(self._load(vgid, region))
+        except Exception:
+            return index, None
+
+
+def _collate(batch: List[Tuple[int, Optional[torch.Tensor]]]) -> Tuple[List[int], Optional[torch.Tensor]]:
+    # 읽지 못한 crop 은 제외 (출력에는 NaN 으로 남음)
+    batch = [(index, image) for index, image in batch if image is not None]
+    if not batch:
+        return [], None
+    return [index for index, _ in batch], torch.stack([image for _, image in batch])
+
+
+def _open_similarities(output_dir: str, ids: List[List[str]], offsets: np.ndarray) -> np.ndarray:
+    """output_dir 의 similarities.npy 를 엽니다.
+
+    같은 region 목록(ids.json, offsets.npy)으로 만든 결과가 있으면 r+ 로 열어서 이미 계산한 값을
+    그대로 사용하고, 아니면 NaN 으로 채운 새 파일을 만듭니다. 새 파일을 먼저 만들고 ids.json 을
+    마지막에 쓰므로 중간에 중단되어도 ids.json 은 항상 similarities.npy 의 배치와 일치합니다.
+    """
+    path = os.path.join(output_dir, "similarities.npy")
+    try:
+        with open(os.path.join(output_dir, "ids.json"), "r", encoding="utf-8") as file:
+            same = json.load(file) == ids
+        same = same and np.array_equal(np.load(os.path.join(output_dir, "offsets.npy")), offsets)
+    except (OSError, ValueError):
+        same = False
+    if same:
+        similarities = np.load(path, mmap_mode="r+")
+        if similarities.shape == (int(offsets[-1]),):
+            return similarities
+        del similarities
+
+    similarities = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(int(offsets[-1]),))
+    similarities[:] = np.nan
+    similarities.flush()
+    np.save(os.path.join(output_dir, "offsets.npy"), offsets)
+    with open(os.path.join(output_dir, "ids.json"), "w", encoding="utf-8") as file:
+        json.dump(ids, file, ensure_ascii=False)
+    return similarities
+
+
+def score_regions(model: torch.nn.Module,
+                  preprocess: Callable[[Image.Image], torch.Tensor],
+                  items: Sequence[RegionItem],
+                  output_dir: str,
+                  crop_dir: Optional[str] = None,
+                  image_dir: Optional[str] = None,
+                  padding: int = 0,
+                  batch_size: int = 256,
+                  num_workers: Optional[int] = None,
+                  device: str = "cpu",
+                  text_cache: Optional[clip.TextEmbeddingCache] = None,
+                  on_batch: Optional[Callable[[List[int], List[np.ndarray]], None]] = None) -> "ClipScores":
+    """region crop 과 후보 caption 들의 CLIP 유사도를 배치로 계산하여 저장합니다.
+
+    caption 은 시작할 때 중복 없이 한 번에 토큰화하고, crop 은 batch_size 개씩 encode_image 에
+    넣으며, 배치 안의 caption 은 중복을 제거한 뒤 한 번에 encode_text 합니다. region 마다 자기 caption 들에 대한 logit (logit_scale * cosine) 을
+    output_dir/similarities.npy 에 이어서 저장하며, region 별 구간은 offsets.npy, region 순서는
+    ids.json 에 저장됩니다. 읽지 못한 crop 의 값은 NaN 입니다.
+
+    같은 items 로 다시 실행하면 기존 similarities.npy 를 이어서 사용하고 아직 NaN 인 region 만
+    다시 계산합니다.
+
+    Args:
+        model (torch.nn.Module): clip.load 로 불러온 모델
+        preprocess (Callable): clip.load 가 반환한 이미지 transform
+        items (Sequence[RegionItem]): 점수화할 (vgid, region) 목록
+        output_dir (str): 결과를 저장할 디렉토리
+        crop_dir (Optional[str]): 미리 저장된 crop 이미지 디렉토리
+        image_dir (Optional[str]): 원본 이미지 디렉토리 (crop_dir 이 없을 때 사용)
+        padding (int, optional): 원본에서 crop 할 때의 padding. Defaults to 0.
+        batch_size (int, optional): encode_image 한 번에 넣을 crop 수. Defaults to 256.
+        num_workers (Optional[int]): 디코딩/preprocess worker 수. 기본값은 cpu_count() - 1.
+        device (str, optional): 모델 device. Defaults to "cpu".
+        text_cache (Optional[clip.TextEmbeddingCache]): 주어지면 encode_text 대신 캐시를 거쳐 text feature 를 계산합니다.
+        on_batch (Optional[Callable]): 배치의 결과를 저장한 뒤 (items 의 index 목록, region 별 logit 목록) 으로
+            호출됩니다. 호출 시점에는 해당 행이 similarities.npy 에 flush 되어 있습니다.
+
+    Returns:
+        ClipScores: 저장된 결과
+    """
+    if num_workers is None:
+        num_workers = max((os.cpu_count() or 1) - 1, 0)
+    if str(device) == "cpu":
+        # 메인 프로세스의 forward 는 모든 코어를 사용 (worker 는 torch 가 1 thread 로 설정)
+        torch.set_num_threads(os.cpu_count() or 1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    np.cumsum([len(region["captions"]) for _, region in items], out=offsets[1:])
+    similarities = _open_similarities(output_dir, [[vgid, region["id"]] for vgid, region in items], offsets)
+
+    # 이전 실행에서 계산하지 못한 region 만 다시 점수화
+    todo = [index for index in range(len(items))
+            if offsets[index + 1] > offsets[index] and np.isnan(similarities[offsets[index]:offsets[index + 1]]).all()]
+
+    if not todo:
+        similarities.flush()
+        del similarities
+        return ClipScores(output_dir)
+
+    # 전체 caption 을 중복 없이 한 번에 토큰화 (BPE 는 worker 프로세스에서 실행)
+    caption_rows: Dict[str, int] = {}
+    for index in todo:
+        for caption in items[index][1]["captions"]:
+            caption_rows.setdefault(caption, len(caption_rows))
+    tokens, _, _ = clip.tokenize_batch(list(caption_rows), processes=num_workers or 1)
+
+    dataset = RegionCropDataset([items[index] for index in todo], preprocess, crop_dir=crop_dir, image_dir=image_dir, padding=padding)
+    loader = DataLoader(dataset,
+                        batch_size=batch_size,
+                        num_workers=num_workers,
+                        collate_fn=_collate,
+                        pin_memory=str(device).startswith("cuda"),
+                        persistent_workers=False)
+
+    logit_scale = model.logit_scale.exp().float()
+    with torch.no_grad():
+        for positions, images in tqdm(loader, desc="clip scoring"):
+            if not positions:
+                continue
+            indices = [todo[position] for position in positions]
+
+            # 배치 안의 caption 은 한 번씩만 encode
+            caption_ids: Dict[int, int] = {}
+            for index in indices:
+                for caption in items[index][1]["captions"]:
+                    caption_ids.setdefault(caption_rows[caption], len(caption_ids))
+            text = tokens[list(caption_ids)].to(device)
+
+            image_features = model.encode_image(images.to(device)).float()
+            if text_cache is not None:
+                text_features = text_cache.encode(text).float()
+            else:
+                text_features = model.encode_text(text).float()
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            logits = (logit_scale * image_features @ text_features.t()).cpu().numpy()
+
+            region_logits = []
+            for row, index in enumerate(indices):
+                columns = [caption_ids[caption_rows[caption]] for caption in items[index][1]["captions"]]
+                similarities[offsets[index]:offsets[index + 1]] = logits[row, columns]
+                region_logits.append(logits[row, columns])
+            if on_batch is not None:
+                similarities.flush()
+                on_batch(indices, region_logits)
+
+    similarities.flush()
+    del similarities
+    return ClipScores(output_dir)
+
+
+def embed_regions(model: torch.nn.Module,
+                  preprocess: Callable[[Image.Image], torch.Tensor],
+                  items: Sequence[RegionItem],
+                  store: EmbeddingStore,
+                  crop_dir: Optional[str] = None,
+                  image_dir: Optional[str] = None,
+                  padding: int = 0,
+                  batch_size: int = 256,
+                  num_workers: Optional[int] = None,
+                  device: str = "cpu") -> int:
+    """store 에 없는 region crop 의 encode_image 결과를 배치로 계산해서 store 에 추가합니다.
+
+    Args:
+        model (torch.nn.Module): clip.load 로 불러온 모델
+        preprocess (Callable): clip.load 가 반환한 이미지 transform
+        items (Sequence[RegionItem]): 임베딩할 (vgid, region) 목록
+        store (EmbeddingStore): 결과를 추가할 저장소
+        crop_dir (Optional[str]): 미리 저장된 crop 이미지 디렉토리
+        image_dir (Optional[str]): 원본 이미지 디렉토리 (crop_dir 이 없을 때 사용)
+        padding (int, optional): 원본에서 crop 할 때의 padding. Defaults to 0.
+        batch_size (int, optional): encode_image 한 번에 넣을 crop 수. Defaults to 256.
+        num_workers (Optional[int]): 디코딩/preprocess worker 수. 기본값은 cpu_count() - 1.
+        device (str, optional): 모델 device. Defaults to "cpu".
+
+    Returns:
+        int: 새로 추가된 행 수 (읽지 못한 crop 은 추가되지 않음)
+    """
+    items = [(vgid, region) for vgid, region in items if (vgid, region["id"]) not in store]
+    if not items:
+        return 0
+    if num_workers is None:
+        num_workers = max((os.cpu_count() or 1) - 1, 0)
+    if str(device) == "cpu":
+        torch.set_num_threads(os.cpu_count() or 1)
+
+    dataset = RegionCropDataset(items, preprocess, crop_dir=crop_dir, image_dir=image_dir, padding=padding)
+    loader = DataLoader(dataset,
+                        batch_size=batch_size,
+                        num_workers=num_workers,
+                        collate_fn=_collate,
+                        pin_memory=str(device).startswith("cuda"))
+
+    added = 0
+    with torch.no_grad():
+        for indices, images in tqdm(loader, desc="clip embedding"):
+            if not indices:
+                continue
+            image_features = model.encode_image(images.to(device))
+            added += store.append([(items[index][0], items[index][1]["id"]) for index in indices], image_features)
+    return added
+
+
+class ClipScores:
+    def __init__(self, output_dir: str):
+        """score_regions 의 결과를 memory-map 으로 엽니다.
+
+        Args:
+            output_dir (str): score_regions 의 output_dir
+        """
+        self.output_dir = output_dir
+        self.similarities = np.load(os.path.join(output_dir, "similarities.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(output_dir, "offsets.npy"), mmap_mode="r")
+        with open(os.path.join(output_dir, "ids.json"), "r", encoding="utf-8") as file:
+            self.ids = [tuple(key) for key in json.load(file)]
+        self._rows = {key: row for row, key in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def logits(self, row: int) -> np.ndarray:
+        """row 번째 region 의 caption 별 logit (읽지 못한 crop 이면 NaN)"""
+        return np.asarray(self.similarities[self.offsets[row]:self.offsets[row + 1]])
+
+    def probs(self, row: int) -> np.ndarray:
+        """row 번째 region 의 caption 별 softmax 확률"""
+        logits = self.logits(row).astype(np.float64)
+        exp = np.exp(logits - logits.max())
+        return exp / exp.sum()
+
+    def find(self, vgid: str, region_id: str) -> Optional[int]:
+        return self._rows.get((vgid, region_id))
@@ -0,0 +1,74 @@
+import io
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+from PIL import Image
+
+from .cropper import pad_box
+
+
+class CropProvider:
+    def __init__(self, image_dir: str, cache_size: int = 8, padding: int = 0):
+        """원본 이미지에서 region crop 을 바로 만들어 주는 provider
+
+        CROPPED_IMAGE_DIR 에 crop 파일을 미리 저장하지 않고 IMAGE_DIR 의 원본 이미지에서 바로
+        crop 합니다. 디코딩된 원본 이미지를 최근 사용 순으로 cache_size 장까지 보관하므로 같은
+        vgid 의 region 들은 한 번의 디코딩을 공유합니다.
+
+        Args:
+            image_dir (str): 원본 이미지 디렉토리 ({image_dir}/{vgid}.jpg)
+            cache_size (int, optional): 메모리에 보관할 디코딩된 원본 이미지 수. Defaults to 8.
+            padding (int, optional): 기본 padding 픽셀 수. Defaults to 0.
+        """
+        self.image_dir = image_dir
+        self.cache_size = cache_size
+        self.padding = padding
+        self.hits = 0
+        self.misses = 0
+        self._images: "OrderedDict[str, Image.Image]" = OrderedDict()
+
+    def image(self, vgid: str) -> Image.Image:
+        """디코딩된 원본 이미지(RGB)를 반환합니다."""
+        image = self._images.get(vgid)
+        if image is not None:
+            self.hits += 1
+            self._images.move_to_end(vgid)
+            return image
+
+        self.misses += 1
+        with Image.open(os.path.join(self.image_dir, f"{vgid}.jpg")) as source:
+            image = source.convert("RGB")
+        self._images[vgid] = image
+        if len(self._images) > self.cache_size:
+            self._images.popitem(last=False)
+        return image
+
+    def crop(self, vgid: str, bbox: Sequence[int], padding: Optional[int] = None) -> Image.Image:
+        """region crop 을 PIL 이미지로 반환합니다.
+
+        Args:
+            vgid (str): Visual Genome 이미지 id
+            bbox (Sequence[int]): region 의 (x, y, width, height)
+            padding (Optional[int]): 늘릴 픽셀 수. None 이면 생성 시 지정한 값을 사용합니다.
+
+        Returns:
+            Image.Image: crop 된 이미지
+        """
+        image = self.image(vgid)
+        x, y, width, height = bbox
+        box = pad_box(x, y, width, height, self.padding if padding is None else padding, image.size)
+        return image.crop(box)
+
+    def crop_bytes(self,
+                   vgid: str,
+                   bbox: Sequence[int],
+                   padding: Optional[int] = None,
+                   quality: int = 75) -> bytes:
+        """region crop 을 JPEG 바이트로 반환합니다."""
+        buffer = io.BytesIO()
+        self.crop(vgid, bbox, padding).save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self._images)}
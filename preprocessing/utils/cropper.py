@@ -0,0 +1,148 @@
+import json
+import math
+import os
+from collections import defaultdict
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+
+def pad_box(x: int,
+            y: int,
+            width: int,
+            height: int,
+            padding: int,
+            image_size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """region bbox 를 padding 만큼 넓히고 이미지 경계 안으로 잘라낸 crop 박스를 반환합니다.
+
+    Args:
+        x (int): region 왼쪽 위 x 좌표
+        y (int): region 왼쪽 위 y 좌표
+        width (int): region 너비
+        height (int): region 높이
+        padding (int): 네 방향으로 늘릴 픽셀 수
+        image_size (Tuple[int, int]): 원본 이미지 (너비, 높이)
+
+    Returns:
+        Tuple[int, int, int, int]: PIL crop 에 사용할 (left, top, right, bottom)
+    """
+    image_width, image_height = image_size
+    left = min(max(x - padding, 0), image_width)
+    top = min(max(y - padding, 0), image_height)
+    right = max(min(x + width + padding, image_width), left)
+    bottom = max(min(y + height + padding, image_height), top)
+    return left, top, right, bottom
+
+
+def crop_image_regions(image_path: str,
+                       regions: List[Dict[str, Any]],
+                       output_dir: str,
+                       padding: int = 0,
+                       max_crop_side: Optional[int] = None,
+                       quality: int = 75) -> List[Tuple[str, Optional[str]]]:
+    """이미지 한 장을 한 번만 디코딩해서 모든 region 을 crop 하여 저장합니다.
+
+    max_crop_side 가 주어지면 가장 큰 crop 도 그 크기를 넘지 않는 범위에서 JPEG draft 모드로
+    축소 디코딩(1/2, 1/4, 1/8)하고, 저장할 crop 의 긴 변도 max_crop_side 로 제한합니다.
+
+    Args:
+        image_path (str): 원본 이미지 경로
+        regions (List[Dict[str, Any]]): raw JSON 의 region 목록 (id, x, y, width, height)
+        output_dir (str): crop 이미지를 저장할 디렉토리 ({output_dir}/{region_id}.jpg)
+        padding (int, optional): region 마다 늘릴 픽셀 수 (원본 이미지 기준). Defaults to 0.
+        max_crop_side (Optional[int]): 저장할 crop 의 최대 변 길이. None 이면 원본 해상도로 저장합니다.
+        quality (int, optional): 저장 JPEG 품질. Defaults to 75.
+
+    Returns:
+        List[Tuple[str, Optional[str]]]: (region_id, 에러 메시지 또는 None) 목록
+    """
+    results = []
+    os.makedirs(output_dir, exist_ok=True)
+    with Image.open(image_path) as img:
+        full_size = img.size
+        if max_crop_side:
+            # 모든 crop 이 max_crop_side 이상의 해상도를 유지할 수 있는 가장 작은 배율로 디코딩
+            scale = max(min(1.0, max_crop_side / max(region["width"] + 2 * padding, region["height"] + 2 * padding, 1))
+                        for region in regions)
+            img.draft("RGB", (math.ceil(full_size[0] * scale), math.ceil(full_size[1] * scale)))
+        scale_x = img.size[0] / full_size[0]
+        scale_y = img.size[1] / full_size[1]
+        decoded = img.convert("RGB")
+
+    for region in regions:
+        region_id = region["id"]
+        try:
+            left, top, right, bottom = pad_box(region["x"], region["y"], region["width"], region["height"],
+                                               padding, full_size)
+            cropped = decoded.crop((round(left * scale_x), round(top * scale_y),
+                                    round(right * scale_x), round(bottom * scale_y)))
+            if max_crop_side and max(cropped.size) > max_crop_side:
+                cropped.thumbnail((max_crop_side, max_crop_side), Image.BICUBIC)
+            cropped.save(os.path.join(output_dir, f"{region_id}.jpg"), quality=quality)
+            results.append((region_id, None))
+        except Exception as e:
+            results.append((region_id, str(e)))
+    return results
+
+
+def _crop_vgid(item: Tuple[str, List[Dict[str, Any]]],
+               image_dir: str,
+               output_dir: str,
+               padding: int,
+               max_crop_side: Optional[int],
+               quality: int) -> Tuple[str, List[Tuple[str, Optional[str]]]]:
+    vgid, regions = item
+    image_path = os.path.join(image_dir, f"{vgid}.jpg")
+    try:
+        return vgid, crop_image_regions(image_path, regions, os.path.join(output_dir, vgid),
+                                        padding, max_crop_side, quality)
+    except Exception as e:
+        return vgid, [(region["id"], str(e)) for region in regions]
+
+
+def group_regions_by_vgid(raw_json_dir: str, json_files: Optional[Iterable[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """raw JSON 파일들의 region 을 vgid 별로 묶습니다."""
+    if json_files is None:
+        json_files = [f for f in os.listdir(raw_json_dir) if f.endswith('.json')]
+
+    groups = defaultdict(list)
+    for json_file in json_files:
+        with open(os.path.join(raw_json_dir, json_file), 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        for vgid, image_data in data.items():
+            groups[vgid].extend(image_data["regions"])
+    return groups
+
+
+def crop_all_regions(groups: Dict[str, List[Dict[str, Any]]],
+                     image_dir: str,
+                     output_dir: str,
+                     padding: int = 0,
+                     max_crop_side: Optional[int] = None,
+                     quality: int = 75,
+                     processes: Optional[int] = None) -> Dict[str, List[Tuple[str, str]]]:
+    """vgid 별 region 묶음을 프로세스 풀에서 crop 합니다.
+
+    Args:
+        groups (Dict[str, List[Dict[str, Any]]]): group_regions_by_vgid 의 결과
+        image_dir (str): 원본 이미지 디렉토리 ({image_dir}/{vgid}.jpg)
+        output_dir (str): crop 이미지 디렉토리 ({output_dir}/{vgid}/{region_id}.jpg)
+        padding (int, optional): region 마다 늘릴 픽셀 수. Defaults to 0.
+        max_crop_side (Optional[int]): 저장할 crop 의 최대 변 길이. Defaults to None.
+        quality (int, optional): 저장 JPEG 품질. Defaults to 75.
+        processes (Optional[int]): worker 수. 기본값은 cpu_count().
+
+    Returns:
+        Dict[str, List[Tuple[str, str]]]: 실패한 region 의 {vgid: [(region_id, 에러 메시지)]}
+    """
+    worker = partial(_crop_vgid, image_dir=image_dir, output_dir=output_dir,
+                     padding=padding, max_crop_side=max_crop_side, quality=quality)
+    errors = {}
+    with Pool(processes=processes or cpu_count()) as pool:
+        for vgid, results in pool.imap_unordered(worker, groups.items(), chunksize=16):
+            failed = [(region_id, error) for region_id, error in results if error is not None]
+            if failed:
+                errors[vgid] = failed
+    return errors
@@ -0,0 +1,158 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+# (vgid, region_id)
+RegionKey = Tuple[str, str]
+
+
+class EmbeddingStore:
+    def __init__(self, store_dir: str, dim: Optional[int] = None, normalize: bool = True):
+        """(vgid, region_id) 별 CLIP 이미지 임베딩을 float16 memory-map 행렬로 저장하는 저장소
+
+        임베딩은 embeddings.f16 에 행 단위로 이어서 쓰고, 각 행의 key 는 keys.tsv 에 같은 순서로
+        기록합니다. 행을 먼저 쓰고 key 를 나중에 쓰므로 중간에 중단되어도 key 가 있는 행은 항상
+        온전하며, 열 때와 append 할 때 key 가 없는 뒷부분(중단된 append 의 행, 잘린 key 줄)을
+        잘라내므로 이후의 행도 key 와 어긋나지 않습니다. 기존 행은 다시 쓰지 않습니다.
+        한 번에 한 프로세스만 append 해야 합니다.
+
+        Args:
+            store_dir (str): 저장소 디렉토리
+            dim (Optional[int]): 임베딩 차원. 새 저장소이면 첫 append 에서 정해집니다.
+            normalize (bool, optional): 새 저장소에 L2 정규화된 벡터를 저장할지 여부. 기존 저장소는
+                meta.json 의 값을 따릅니다. Defaults to True.
+        """
+        self.store_dir = store_dir
+        self.dim = dim
+        self.normalize = normalize
+        self._keys: List[RegionKey] = []
+        self._rows: Dict[RegionKey, int] = {}
+        self._keys_size = 0
+        self._matrix: Optional[np.memmap] = None
+        os.makedirs(store_dir, exist_ok=True)
+
+        if os.path.isfile(self._path("meta.json")):
+            with open(self._path("meta.json"), 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            self.dim, self.normalize = meta["dim"], meta["normalize"]
+            self._load_keys()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.store_dir, name)
+
+    def _load_keys(self) -> None:
+        keys = []
+        key_bytes = [0]
+        if os.path.isfile(self._path("keys.tsv")):
+            with open(self._path("keys.tsv"), 'rb') as file:
+                # 마지막 줄이 잘린 경우는 무시
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break
+                    vgid, region_id = line.decode("utf-8").rstrip("\n").split("\t")
+                    keys.append((vgid, region_id))
+                    key_bytes.append(key_bytes[-1] + len(line))
+        row_bytes = self.dim * np.dtype(np.float16).itemsize
+        stored_rows = os.path.getsize(self._path("embeddings.f16")) // row_bytes if os.path.isfile(self._path("embeddings.f16")) else 0
+        count = min(len(keys), stored_rows)
+
+        self._truncate(count * row_bytes, key_bytes[count])
+        self._keys = keys[:count]
+        self._keys_size = key_bytes[count]
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        self._matrix = None
+
+    def _truncate(self, embeddings_size: int, keys_size: int) -> None:
+        # key 가 없는 행과 잘린 key 줄을 잘라서 다음 행이 len(self) 번째 자리에 쓰이도록 함
+        for name, size in (("embeddings.f16", embeddings_size), ("keys.tsv", keys_size)):
+            if os.path.isfile(self._path(name)) and os.path.getsize(self._path(name)) > size:
+                os.truncate(self._path(name), size)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: RegionKey) -> bool:
+        return tuple(key) in self._rows
+
+    @property
+    def keys(self) -> List[RegionKey]:
+        return list(self._keys)
+
+    def find(self, vgid: str, region_id: str) -> Optional[int]:
+        """(vgid, region_id) 의 행 번호를 반환합니다 (없으면 None)."""
+        return self._rows.get((vgid, region_id))
+
+    def missing(self, keys: Iterable[RegionKey]) -> List[RegionKey]:
+        """아직 저장되지 않은 key 목록"""
+        return [tuple(key) for key in keys if tuple(key) not in self._rows]
+
+    def append(self, keys: Sequence[RegionKey], embeddings) -> int:
+        """새 임베딩 행들을 파일 끝에 추가합니다. 이미 있는 key 는 건너뜁니다.
+
+        Args:
+            keys (Sequence[RegionKey]): 행마다의 (vgid, region_id)
+            embeddings (np.ndarray | torch.Tensor): [len(keys), dim] 임베딩
+
+        Returns:
+            int: 추가된 행 수
+        """
+        if isinstance(embeddings, torch.Tensor):
+            embeddings = embeddings.detach().float().cpu().numpy()
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            with open(self._path("meta.json"), 'w', encoding='utf-8') as file:
+                json.dump({"dim": self.dim, "dtype": "float16", "normalize": self.normalize}, file)
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"embedding dim {embeddings.shape[1]} does not match store dim {self.dim}")
+
+        new = {}
+        for index, key in enumerate(keys):
+            key = tuple(key)
+            if key not in self._rows and key not in new:
+                new[key] = index
+        if not new:
+            return 0
+
+        # 이전 append 가 중간에 실패했다면 key 가 없는 행을 정리
+        self._truncate(len(self._keys) * self.dim * np.dtype(np.float16).itemsize, self._keys_size)
+        rows = embeddings[list(new.values())]
+        if self.normalize:
+            rows = rows / np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+        with open(self._path("embeddings.f16"), 'ab') as file:
+            file.write(np.ascontiguousarray(rows, dtype=np.float16).tobytes())
+        lines = "".join(f"{vgid}\t{region_id}\n" for vgid, region_id in new).encode("utf-8")
+        with open(self._path("keys.tsv"), 'ab') as file:
+            file.write(lines)
+        self._keys_size += len(lines)
+
+        for key in new:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+        self._matrix = None
+        return len(new)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """[len(self), dim] float16 memory-map (복사 없이 파일을 그대로 매핑, 쓰기는 파일에 반영되지 않음)"""
+        if self._matrix is None:
+            if not self._keys:
+                return np.zeros((0, self.dim or 0), dtype=np.float16)
+            self._matrix = np.memmap(self._path("embeddings.f16"), dtype=np.float16, mode="c",
+                                     shape=(len(self._keys), self.dim))
+        return self._matrix
+
+    def tensor(self) -> torch.Tensor:
+        """matrix 를 복사 없이 감싼 torch 텐서"""
+        return torch.from_numpy(self.matrix)
+
+    def get(self, vgid: str, region_id: str) -> Optional[np.ndarray]:
+        row = self.find(vgid, region_id)
+        return None if row is None else self.matrix[row]
+
+    def rows(self, keys: Iterable[RegionKey]) -> np.ndarray:
+        """key 들의 행 번호 배열 (없는 key 는 -1)"""
+        return np.array([self._rows.get(tuple(key), -1) for key in keys], dtype=np.int64)
@@ -1,9 +1,57 @@
 import openai
 import json
 import base64
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any, Union
+
+from .image_payload import ImageInput, ImagePayload
+from .response_cache import ResponseCache
+
+SYSTEM_PROMPT = """You are a concise and accurate AI assistant.
+                        Do not include phrases like "Sure," "Certainly," "Of course," "Absolutely," "Let me provide that," 
+                        or "Here's the information" in your responses."""
+
+
+def image_content(image: Union[str, ImagePayload]) -> Dict[str, Any]:
+    """Base64 문자열 또는 ImagePayload 를 image_url content 로 변환합니다.
+
+    Base64 문자열은 앞부분으로 JPEG/PNG 를 구분하여 MIME 타입을 지정합니다.
+    """
+    if isinstance(image, ImagePayload):
+        return image.to_content()
+    mime = "image/jpeg" if image.startswith("/9j/") else "image/png"
+    return {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{image}"}}
+
+
+def build_messages(prompt: str,
+                   base64_image: Optional[ImageInput] = None,
+                   system_prompt: str = SYSTEM_PROMPT) -> List[Dict[str, Any]]:
+    """system 프롬프트, 텍스트 프롬프트, 이미지로 chat 메시지를 구성합니다.
+
+    Args:
+        prompt (str): GPT에게 전달할 프롬프트
+        base64_image (Optional[ImageInput]): Base64로 인코딩된 이미지 또는 ImagePayload. 목록이면 순서대로 모두 첨부하고,
+            None 이면 텍스트만 전달합니다.
+        system_prompt (str, optional): system 프롬프트. Defaults to SYSTEM_PROMPT.
+
+    Returns:
+        List[Dict[str, Any]]: ChatCompletion 요청의 messages
+    """
+    if base64_image is None:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+    base64_images = base64_image if isinstance(base64_image, list) else [base64_image]
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": [{"type": "text", "text": prompt}] + [
+            image_content(image) for image in base64_images
+        ]}
+    ]
+
 
 class GPTHandler:
+    @staticmethod
     def load_api_key(json_path: str) -> str:
         """API 키를 JSON 파일에서 로드합니다.
 
@@ -25,52 +73,54 @@ class GPTHandler:
             print("Error: API key file not found.")
             raise
 
-    def __init__(self, json_path: str):
+    def __init__(self, json_path: str, cache: Optional[ResponseCache] = None):
         """GPT 핸들러 초기화
         
         Args:
             json_path (str): OpenAI API 키가 저장된 JSON 파일 경로
+            cache (Optional[ResponseCache]): 동일한 요청의 응답을 재사용할 디스크 캐시
         """
         self.api_key = self.load_api_key(json_path)
+        self.cache = cache
         openai.api_key = self.api_key
 
     def ask_gpt(self, 
                 prompt: str, 
-                base64_image: str, 
+                base64_image: ImageInput, 
                 max_tokens: int = 1000, 
                 model: str = "gpt-4o", 
-                temperature: float = 0) -> Optional[str]:
+                temperature: float = 0,
+                validate: Optional[Callable[[str], bool]] = None) -> Optional[str]:
         """GPT API를 호출하여 응답을 받아옵니다.
 
         Args:
             prompt (str): GPT에게 전달할 프롬프트
-            base64_image (str): Base64로 인코딩된 이미지
+            base64_image (ImageInput): Base64로 인코딩된 이미지 또는 ImagePayload
             max_tokens (int, optional): 최대 토큰 수. Defaults to 1000.
             model (str, optional): 사용할 GPT 모델. Defaults to "gpt-4o".
             temperature (float, optional): 응답의 다양성 조절. Defaults to 0.
+            validate (Optional[Callable[[str], bool]]): 주어지면 True 를 반환한 응답만 캐시에 저장하고 재사용합니다.
 
         Returns:
             Optional[str]: GPT의 응답 또는 에러 발생 시 None
         """
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(model, temperature, max_tokens, SYSTEM_PROMPT, prompt, base64_image)
+            cached = self.cache.get(cache_key)
+            if cached is not None and (validate is None or validate(cached)):
+                return cached
+
         try:
             response = openai.ChatCompletion.create(
                 model=model,
-                messages=[
-                    {"role": "system", 
-                     "content": """You are a concise and accurate AI assistant.
-                        Do not include phrases like "Sure," "Certainly," "Of course," "Absolutely," "Let me provide that," 
-                        or "Here's the information" in your responses."""},
-                    {"role": "user", "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {
-                            "url": f"data:image/png;base64,{base64_image}"
-                        }}
-                    ]}
-                ],
+                messages=build_messages(prompt, base64_image),
                 max_tokens=max_tokens,
                 temperature=temperature
             )
-            return response.choices[0].message['content'].strip()
+            answer = response.choices[0].message['content'].strip()
+            if self.cache is not None and (validate is None or validate(answer)):
+                self.cache.put(cache_key, answer)
+            return answer
         except openai.error.OpenAIError as e:
             print(f"OpenAI error: {e}")
         except Exception as e:
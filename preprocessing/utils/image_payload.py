@@ -0,0 +1,97 @@
+import base64
+import io
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from PIL import Image, UnidentifiedImageError
+
+ImageSource = Union[str, Callable[[], Image.Image]]
+
+
+class ImagePayload:
+    def __init__(self,
+                 source: ImageSource,
+                 max_side: int = 768,
+                 quality: int = 85,
+                 low_detail_side: int = 512):
+        """요청 직전에 crop 이미지를 인코딩하는 lazy payload
+
+        생성 시에는 파일을 읽지 않고, encode() 가 처음 호출될 때 이미지를 읽어 긴 변이
+        max_side 를 넘으면 줄이고 JPEG(quality)로 다시 인코딩합니다. 이미 충분히 작은 JPEG 는
+        다시 인코딩하지 않고 원본 바이트를 그대로 사용합니다.
+
+        Args:
+            source (ImageSource): 이미지 파일 경로 또는 PIL 이미지를 반환하는 함수
+            max_side (int, optional): 전송할 이미지의 최대 변 길이(px). Defaults to 768.
+            quality (int, optional): 다시 인코딩할 때의 JPEG 품질. Defaults to 85.
+            low_detail_side (int, optional): 긴 변이 이 값 이하이면 detail 을 "low" 로 요청합니다. Defaults to 512.
+        """
+        self.source = source
+        self.max_side = max_side
+        self.quality = quality
+        self.low_detail_side = low_detail_side
+        self.size = None
+        self._encoded: Optional[str] = None
+
+    def _load_bytes(self) -> bytes:
+        if callable(self.source):
+            image = self.source()
+            return self._reencode(image)
+
+        with open(self.source, "rb") as image_file:
+            data = image_file.read()
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format == "JPEG" and max(image.size) <= self.max_side:
+                self.size = image.size
+                return data
+            image.load()
+            return self._reencode(image)
+
+    def _reencode(self, image: Image.Image) -> bytes:
+        image = image.convert("RGB")
+        if max(image.size) > self.max_side:
+            image.thumbnail((self.max_side, self.max_side), Image.BICUBIC)
+        self.size = image.size
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=self.quality)
+        return buffer.getvalue()
+
+    def encode(self) -> str:
+        """Base64로 인코딩된 JPEG 를 반환합니다. 이미지가 없으면 빈 문자열을, 읽을 수 없는 이미지이면 원본 바이트를 반환합니다."""
+        if self._encoded is None:
+            try:
+                self._encoded = base64.b64encode(self._load_bytes()).decode("utf-8")
+            except FileNotFoundError:
+                self._encoded = ""
+            except (OSError, UnidentifiedImageError):
+                # 깨진 crop 은 해당 region 만 실패하도록 원본 바이트를 그대로 보냅니다 (기존 동작)
+                self._encoded = self._raw_encoded()
+        return self._encoded
+
+    def _raw_encoded(self) -> str:
+        self.size = None
+        if callable(self.source):
+            return ""
+        try:
+            with open(self.source, "rb") as image_file:
+                return base64.b64encode(image_file.read()).decode("utf-8")
+        except OSError:
+            return ""
+
+    @property
+    def detail(self) -> str:
+        """crop 크기에 따른 detail 수준 ("low" 는 512px 한 장으로 처리되어 vision 토큰이 적습니다)."""
+        self.encode()
+        if self.size is not None and max(self.size) <= self.low_detail_side:
+            return "low"
+        return "high"
+
+    def to_content(self) -> Dict[str, Any]:
+        """chat 메시지의 image_url content 를 반환합니다."""
+        return {"type": "image_url", "image_url": {
+            "url": f"data:image/jpeg;base64,{self.encode()}",
+            "detail": self.detail
+        }}
+
+
+# 요청에 첨부할 이미지: Base64 문자열 또는 ImagePayload, 여러 장이면 그 목록
+ImageInput = Union[str, ImagePayload, List[Union[str, ImagePayload]]]
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# region 처리 상태
+PENDING = 0
+DONE = 1
+FAILED = 2
+SUBMITTED = 3  # Batch API 로 제출되어 결과를 기다리는 중
+
+# Batch API 의 completion window. 제출 후 이 시간이 지나도 결과가 반영되지 않은 region 은
+# batch 가 만료/실패/유실된 것으로 보고 다시 pending 과 같이 처리합니다.
+SUBMITTED_TIMEOUT = 24 * 60 * 60
+
+
+class Manifest:
+    def __init__(self, db_path: str):
+        """작업 진행 상황을 기록하는 SQLite manifest 초기화
+
+        (file, vgid, region_id) 단위로 pending/done/failed 상태를 저장합니다.
+        재시작 시 manifest 만 조회하면 남은 작업을 알 수 있으므로 이미 끝난 파일의
+        JSON 파싱이나 이미지 인코딩을 다시 하지 않습니다. WAL 모드를 사용하므로
+        Pool 의 여러 worker 가 각자 연결을 열어 동시에 상태를 갱신할 수 있습니다.
+        연결은 만든 thread 밖(예: 비동기 모드의 전용 executor)에서도 쓸 수 있지만 한 번에
+        한 thread 에서만 사용해야 합니다.
+
+        Args:
+            db_path (str): SQLite 데이터베이스 파일 경로
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                file TEXT PRIMARY KEY,
+                vgid TEXT
+            );
+            CREATE TABLE IF NOT EXISTS units (
+                file TEXT NOT NULL,
+                vgid TEXT NOT NULL,
+                region_id TEXT NOT NULL,
+                status INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                submitted_at REAL,
+                PRIMARY KEY (vgid, region_id)
+            );
+            CREATE INDEX IF NOT EXISTS units_status ON units (status, file);
+            CREATE TABLE IF NOT EXISTS submissions (
+                task TEXT NOT NULL,
+                vgid TEXT NOT NULL,
+                region_id TEXT NOT NULL,
+                submitted_at REAL NOT NULL,
+                PRIMARY KEY (task, vgid, region_id)
+            );
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(units)")}
+        if "submitted_at" not in columns:
+            # 이전 버전의 manifest: 이미 submitted 인 region 은 지금 제출된 것으로 간주
+            self.conn.execute("ALTER TABLE units ADD COLUMN submitted_at REAL")
+            self.conn.execute("UPDATE units SET submitted_at = ? WHERE status = ?", (time.time(), SUBMITTED))
+        self.conn.commit()
+
+    def known_files(self) -> Set[str]:
+        """manifest 에 등록된 raw JSON 파일 이름 집합을 반환합니다."""
+        return {row[0] for row in self.conn.execute("SELECT file FROM files")}
+
+    def register_file(self,
+                      file: str,
+                      vgid: str,
+                      region_ids: Iterable[str],
+                      done_keys: Optional[Set[Tuple[str, str]]] = None) -> None:
+        """raw JSON 파일 하나의 region 들을 pending 상태로 등록합니다.
+
+        Args:
+            file (str): raw JSON 파일 이름
+            vgid (str): Visual Genome 이미지 id
+            region_ids (Iterable[str]): 파일에 포함된 region id 목록
+            done_keys (Optional[Set[Tuple[str, str]]]): 이미 처리된 (vgid, region_id). 해당 region 은 done 으로 등록됩니다.
+        """
+        done_keys = done_keys or set()
+        rows = [(file, vgid, region_id, DONE if (vgid, region_id) in done_keys else PENDING)
+                for region_id in region_ids]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO units (file, vgid, region_id, status) VALUES (?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT OR IGNORE INTO files (file, vgid) VALUES (?, ?)", (file, vgid))
+
+    def mark(self, vgid: str, region_id: str, status: int, error: Optional[str] = None) -> None:
+        """region 의 상태를 갱신합니다. submitted 로 바꾸면 제출 시각도 기록합니다."""
+        submitted_at = time.time() if status == SUBMITTED else None
+        with self.conn:
+            self.conn.execute("UPDATE units SET status = ?, error = ?, submitted_at = ? WHERE vgid = ? AND region_id = ?",
+                              (status, error, submitted_at, vgid, region_id))
+
+    def mark_done(self, vgid: str, region_id: str) -> None:
+        self.mark(vgid, region_id, DONE)
+
+    def mark_failed(self, vgid: str, region_id: str, error: Optional[str] = None) -> None:
+        self.mark(vgid, region_id, FAILED, error)
+
+    def mark_submitted(self, vgid: str, region_id: str) -> None:
+        self.mark(vgid, region_id, SUBMITTED)
+
+    def status(self, vgid: str, region_id: str) -> Optional[int]:
+        """region 의 현재 상태를 반환합니다. manifest 에 없으면 None 을 반환합니다."""
+        row = self.conn.execute("SELECT status FROM units WHERE vgid = ? AND region_id = ?",
+                                (vgid, region_id)).fetchone()
+        return row[0] if row else None
+
+    def mark_task_submitted(self, task: str, keys: Iterable[Tuple[str, str]]) -> None:
+        """caption 선택 외의 작업(예: category)으로 Batch API 에 제출된 region 들을 기록합니다."""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO submissions (task, vgid, region_id, submitted_at) VALUES (?, ?, ?, ?)",
+                ((task, vgid, region_id, now) for vgid, region_id in keys))
+
+    def clear_task_submitted(self, task: str, vgid: str, region_id: str) -> None:
+        """결과가 반영된 region 의 제출 기록을 지웁니다."""
+        with self.conn:
+            self.conn.execute("DELETE FROM submissions WHERE task = ? AND vgid = ? AND region_id = ?",
+                              (task, vgid, region_id))
+
+    def task_submitted(self, task: str, submitted_timeout: float = SUBMITTED_TIMEOUT) -> Set[Tuple[str, str]]:
+        """task 로 제출된 뒤 submitted_timeout(초)이 지나지 않은 (vgid, region_id) 집합을 반환합니다."""
+        rows = self.conn.execute("SELECT vgid, region_id FROM submissions WHERE task = ? AND submitted_at >= ?",
+                                 (task, time.time() - submitted_timeout))
+        return {(vgid, region_id) for vgid, region_id in rows}
+
+    def lookup_file(self, vgid: str, region_id: str) -> Optional[str]:
+        """region 이 포함된 raw JSON 파일 이름을 반환합니다."""
+        row = self.conn.execute("SELECT file FROM units WHERE vgid = ? AND region_id = ?",
+                                (vgid, region_id)).fetchone()
+        return row[0] if row else None
+
+    def outstanding(self,
+                    include_failed: bool = True,
+                    submitted_timeout: Optional[float] = SUBMITTED_TIMEOUT) -> List[Tuple[str, List[str]]]:
+        """아직 끝나지 않은 region 들을 파일별로 묶어 반환합니다.
+
+        Args:
+            include_failed (bool, optional): failed 상태도 다시 처리할지 여부. Defaults to True.
+            submitted_timeout (Optional[float], optional): 제출 후 이 시간(초)이 지나도 결과가 없는 submitted
+                region 을 다시 포함합니다. None 이면 submitted region 은 포함하지 않습니다. Defaults to SUBMITTED_TIMEOUT.
+
+        Returns:
+            List[Tuple[str, List[str]]]: (raw JSON 파일 이름, region id 목록) 목록
+        """
+        statuses = (PENDING, FAILED) if include_failed else (PENDING,)
+        placeholders = ", ".join("?" * len(statuses))
+        query = f"SELECT file, region_id FROM units WHERE status IN ({placeholders})"
+        params: Tuple = statuses
+        if submitted_timeout is not None:
+            query += " OR (status = ? AND submitted_at < ?)"
+            params += (SUBMITTED, time.time() - submitted_timeout)
+        tasks: Dict[str, List[str]] = {}
+        for file, region_id in self.conn.execute(query + " ORDER BY file, rowid", params):
+            tasks.setdefault(file, []).append(region_id)
+        return list(tasks.items())
+
+    def counts(self) -> Dict[str, int]:
+        """상태별 region 수를 반환합니다."""
+        names = {PENDING: "pending", DONE: "done", FAILED: "failed", SUBMITTED: "submitted"}
+        result = {name: 0 for name in names.values()}
+        for status, count in self.conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status"):
+            result[names[status]] = count
+        return result
+
+    def close(self) -> None:
+        self.conn.close()
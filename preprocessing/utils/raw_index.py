@@ -0,0 +1,166 @@
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# 인덱스 디렉토리에 저장되는 배열 이름
+COLUMNS = [
+    "string_offsets", "string_blob",
+    "region_file", "region_vgid", "region_id", "region_bbox",
+    "caption_offsets", "caption_text", "counterfactual_text"
+]
+
+
+class _StringTable:
+    """중복을 제거한 문자열 목록을 utf-8 blob 과 offset 배열로 저장하기 위한 builder"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.chunks: List[bytes] = []
+
+    def add(self, text: str) -> int:
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = len(self.chunks)
+            self.ids[text] = string_id
+            self.chunks.append(text.encode("utf-8"))
+        return string_id
+
+    def arrays(self):
+        offsets = np.zeros(len(self.chunks) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in self.chunks], out=offsets[1:])
+        blob = np.frombuffer(b"".join(self.chunks), dtype=np.uint8)
+        return offsets, blob
+
+
+class RawIndex:
+    def __init__(self, index_dir: str):
+        """build() 로 만든 raw JSON 컬럼 인덱스를 memory-map 으로 엽니다.
+
+        region 마다 vgid, region_id, bbox, 원본 파일 이름을 한 행으로, caption 과
+        counterfactual caption 은 caption_offsets 로 구간이 나뉜 평탄한 배열로 저장합니다.
+        문자열은 모두 중복 제거된 string table 의 id 로 저장됩니다.
+
+        Args:
+            index_dir (str): 인덱스 디렉토리 경로
+        """
+        self.index_dir = index_dir
+        for column in COLUMNS:
+            setattr(self, column, np.load(os.path.join(index_dir, f"{column}.npy"), mmap_mode="r"))
+        self._rows_by_region_id: Optional[Dict[str, int]] = None
+        self._rows_by_file: Optional[Dict[str, range]] = None
+        self._rows_by_vgid: Optional[Dict[str, range]] = None
+
+    @classmethod
+    def build(cls, raw_json_dir: str, index_dir: str, json_files: Optional[Iterable[str]] = None) -> "RawIndex":
+        """raw JSON 파일들을 한 번 읽어 컬럼 인덱스를 만듭니다.
+
+        Args:
+            raw_json_dir (str): raw JSON 디렉토리 경로
+            index_dir (str): 인덱스를 저장할 디렉토리 경로
+            json_files (Optional[Iterable[str]]): 인덱싱할 파일 이름 목록. 기본값은 디렉토리의 모든 .json 파일
+
+        Returns:
+            RawIndex: 만들어진 인덱스
+        """
+        if json_files is None:
+            json_files = sorted(f for f in os.listdir(raw_json_dir) if f.endswith('.json'))
+
+        strings = _StringTable()
+        region_file, region_vgid, region_id, region_bbox = [], [], [], []
+        caption_offsets, caption_text, counterfactual_text = [0], [], []
+        for json_file in json_files:
+            with open(os.path.join(raw_json_dir, json_file), 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            file_id = strings.add(json_file)
+            for vgid, image_data in data.items():
+                vgid_id = strings.add(vgid)
+                for region in image_data["regions"]:
+                    region_file.append(file_id)
+                    region_vgid.append(vgid_id)
+                    region_id.append(strings.add(region["id"]))
+                    region_bbox.append((region["x"], region["y"], region["width"], region["height"]))
+                    for caption in region["captions"]:
+                        caption_text.append(strings.add(caption["caption"]))
+                        counterfactual_text.append(strings.add(caption.get("counterfactual_caption", "")))
+                    caption_offsets.append(len(caption_text))
+
+        string_offsets, string_blob = strings.arrays()
+        arrays = {
+            "string_offsets": string_offsets,
+            "string_blob": string_blob,
+            "region_file": np.asarray(region_file, dtype=np.int32),
+            "region_vgid": np.asarray(region_vgid, dtype=np.int32),
+            "region_id": np.asarray(region_id, dtype=np.int32),
+            "region_bbox": np.asarray(region_bbox, dtype=np.int32).reshape(-1, 4),
+            "caption_offsets": np.asarray(caption_offsets, dtype=np.int64),
+            "caption_text": np.asarray(caption_text, dtype=np.int32),
+            "counterfactual_text": np.asarray(counterfactual_text, dtype=np.int32),
+        }
+        os.makedirs(index_dir, exist_ok=True)
+        for column, array in arrays.items():
+            np.save(os.path.join(index_dir, f"{column}.npy"), array)
+        return cls(index_dir)
+
+    def __len__(self) -> int:
+        return len(self.region_id)
+
+    def string(self, string_id: int) -> str:
+        start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+        return self.string_blob[start:end].tobytes().decode("utf-8")
+
+    def captions(self, row: int) -> List[str]:
+        start, end = self.caption_offsets[row], self.caption_offsets[row + 1]
+        return [self.string(string_id) for string_id in self.caption_text[start:end]]
+
+    def counterfactual_captions(self, row: int) -> List[str]:
+        start, end = self.caption_offsets[row], self.caption_offsets[row + 1]
+        return [self.string(string_id) for string_id in self.counterfactual_text[start:end]]
+
+    def region(self, row: int) -> Dict[str, Any]:
+        """row 번째 region 을 raw JSON 과 비슷한 dict 로 반환합니다."""
+        x, y, width, height = (int(value) for value in self.region_bbox[row])
+        return {
+            "file": self.string(self.region_file[row]),
+            "vgid": self.string(self.region_vgid[row]),
+            "id": self.string(self.region_id[row]),
+            "x": x, "y": y, "width": width, "height": height,
+            "captions": self.captions(row),
+            "counterfactual_captions": self.counterfactual_captions(row),
+        }
+
+    def iter_regions(self, rows: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        """region 들을 순서대로 반환합니다."""
+        for row in (range(len(self)) if rows is None else rows):
+            yield self.region(row)
+
+    def _group_rows(self, column: np.ndarray) -> Dict[str, range]:
+        # 같은 파일의 region 은 연속된 행에 저장되므로 값이 바뀌는 지점으로 구간을 나눔
+        groups = {}
+        if len(column) == 0:
+            return groups
+        boundaries = np.flatnonzero(np.diff(column)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(column)]))
+        for start, end in zip(starts, ends):
+            groups[self.string(column[start])] = range(int(start), int(end))
+        return groups
+
+    def find(self, region_id: str) -> Optional[int]:
+        """region_id 의 행 번호를 반환합니다 (없으면 None)."""
+        if self._rows_by_region_id is None:
+            self._rows_by_region_id = {self.string(string_id): row for row, string_id in enumerate(self.region_id)}
+        return self._rows_by_region_id.get(region_id)
+
+    def rows_for_file(self, json_file: str) -> range:
+        """raw JSON 파일 하나에 속한 행 구간을 반환합니다."""
+        if self._rows_by_file is None:
+            self._rows_by_file = self._group_rows(self.region_file)
+        return self._rows_by_file.get(json_file, range(0))
+
+    def rows_for_vgid(self, vgid: str) -> range:
+        """vgid 하나에 속한 행 구간을 반환합니다 (vgid 의 region 들이 한 파일에 모여 있다고 가정)."""
+        if self._rows_by_vgid is None:
+            self._rows_by_vgid = self._group_rows(self.region_vgid)
+        return self._rows_by_vgid.get(vgid, range(0))
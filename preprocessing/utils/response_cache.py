@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from .image_payload import ImageInput
+
+
+class ResponseCache:
+    # 이 횟수만큼 조회가 쌓이면 사용 시각과 통계를 반영
+    ACCESS_FLUSH_INTERVAL = 1000
+
+    def __init__(self, db_path: str, max_bytes: int = 512 * 1024 * 1024):
+        """GPT 응답을 요청 내용의 해시로 저장하는 디스크 캐시 초기화
+
+        SQLite(WAL) 위에 구현되어 있어 multiprocessing.Pool 의 여러 worker 가 각자
+        ResponseCache 를 열어 동시에 사용할 수 있습니다. 저장된 응답의 총 크기가
+        max_bytes 를 넘으면 가장 오래 사용되지 않은 항목부터 삭제합니다(LRU).
+        연결은 만든 thread 밖에서도 쓸 수 있지만 한 번에 한 thread 에서만 사용해야 합니다.
+
+        Args:
+            db_path (str): SQLite 데이터베이스 파일 경로
+            max_bytes (int, optional): 저장할 응답의 최대 총 크기(바이트). Defaults to 512MB.
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # get() 은 SELECT 만 하고, 사용 시각과 hit/miss 통계는 모아 두었다가 put()/stats()/close() 때
+        # (또는 ACCESS_FLUSH_INTERVAL 번 조회마다) 한 번의 쓰기 트랜잭션으로 반영합니다
+        self._accessed: Dict[str, float] = {}
+        self._pending_hits = 0
+        self._pending_misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats (name, value) VALUES ('hits', 0), ('misses', 0), ('bytes', 0);
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str,
+                 temperature: float,
+                 max_tokens: int,
+                 system_prompt: str,
+                 prompt: str,
+                 base64_image: ImageInput) -> str:
+        """요청을 구성하는 모든 값으로 캐시 키(sha256)를 만듭니다.
+
+        Args:
+            model (str): GPT 모델 이름
+            temperature (float): temperature
+            max_tokens (int): 최대 토큰 수
+            system_prompt (str): system 프롬프트
+            prompt (str): user 프롬프트
+            base64_image (ImageInput): Base64로 인코딩된 이미지 또는 ImagePayload (여러 장이면 첨부 순서대로)
+
+        Returns:
+            str: 16진수 sha256 digest
+        """
+        header = json.dumps([model, temperature, max_tokens, system_prompt, prompt], ensure_ascii=False)
+        digest = hashlib.sha256(header.encode("utf-8"))
+        # base64 는 이미지 바이트와 1:1 대응이므로 디코딩하지 않고 그대로 해시합니다
+        # ImagePayload 는 전송될 바이트(인코딩 결과)로 해시합니다
+        images = base64_image if isinstance(base64_image, list) else [base64_image]
+        for image in images:
+            if image is not None and not isinstance(image, str):
+                image = image.encode()
+            digest.update(b"\0")
+            digest.update((image or "").encode("ascii"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """캐시된 응답을 반환합니다. 쓰기 트랜잭션을 열지 않으므로 여러 프로세스가 동시에 조회할 수 있습니다."""
+        row = self.conn.execute("SELECT response FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            self._pending_misses += 1
+        else:
+            self.hits += 1
+            self._pending_hits += 1
+            self._accessed[key] = time.time()
+        if self._pending_hits + self._pending_misses >= self.ACCESS_FLUSH_INTERVAL:
+            with self.conn:
+                self._flush_access()
+        return row[0] if row is not None else None
+
+    def _flush_access(self) -> None:
+        # 호출하는 쪽에서 트랜잭션을 엽니다
+        if self._accessed:
+            self.conn.executemany("UPDATE entries SET last_access = ? WHERE key = ?",
+                                  ((accessed, key) for key, accessed in self._accessed.items()))
+        self.conn.execute("UPDATE stats SET value = value + ? WHERE name = 'hits'", (self._pending_hits,))
+        self.conn.execute("UPDATE stats SET value = value + ? WHERE name = 'misses'", (self._pending_misses,))
+        self._accessed = {}
+        self._pending_hits = 0
+        self._pending_misses = 0
+
+    def put(self, key: str, response: str) -> None:
+        """응답을 저장하고 최대 크기를 넘으면 LRU 순서로 삭제합니다.
+
+        해석할 수 없는 응답을 저장하면 같은 요청을 다시 보내도 계속 같은 응답이 반환되므로,
+        호출하는 쪽에서 사용할 수 있는 응답인지 확인한 뒤 저장해야 합니다.
+        """
+        size = len(response.encode("utf-8"))
+        with self.conn:
+            self._flush_access()
+            old = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO entries (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                              (key, response, size, time.time()))
+            self.conn.execute("UPDATE stats SET value = value + ? WHERE name = 'bytes'",
+                              (size - (old[0] if old else 0),))
+            self._evict()
+
+    def _evict(self) -> None:
+        total = self.conn.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self.conn.execute("SELECT key, size FROM entries ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.conn.execute("UPDATE stats SET value = value - ? WHERE name = 'bytes'", (size,))
+                total -= size
+
+    def stats(self) -> Dict[str, int]:
+        """모든 프로세스를 합친 누적 통계와 현재 항목 수를 반환합니다 (다른 프로세스의 최근 조회는 늦게 반영될 수 있음)."""
+        with self.conn:
+            self._flush_access()
+        result = dict(self.conn.execute("SELECT name, value FROM stats"))
+        result["entries"] = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return result
+
+    def close(self) -> None:
+        with self.conn:
+            self._flush_access()
+        self.conn.close()
@@ -0,0 +1,119 @@
+import heapq
+import json
+import os
+import time
+from typing import Dict, Iterator, Optional, Set, Tuple, Any
+
+
+class ResultStore:
+    def __init__(self, segment_dir: str):
+        """append-only 결과 저장소 초기화
+
+        각 worker 프로세스는 자신의 pid 이름으로 된 JSONL segment 파일에 region 단위 결과를
+        한 줄씩 덧붙입니다. 전체 결과 파일을 다시 쓰지 않기 때문에 region 하나를 저장하는 비용이
+        지금까지 처리한 데이터의 양과 무관하게 일정합니다.
+
+        Args:
+            segment_dir (str): segment 파일(*.jsonl)을 저장할 디렉토리 경로
+        """
+        self.segment_dir = segment_dir
+        os.makedirs(segment_dir, exist_ok=True)
+        self._segment = None
+        self._segment_pid = None
+
+    def _segment_file(self):
+        # fork 된 worker 가 부모의 파일 핸들을 공유하지 않도록 pid 가 바뀌면 새로 엽니다
+        pid = os.getpid()
+        if self._segment is None or self._segment_pid != pid:
+            path = os.path.join(self.segment_dir, f"{pid}.jsonl")
+            self._segment = open(path, 'a', encoding='utf-8', buffering=1)
+            self._segment_pid = pid
+        return self._segment
+
+    def append(self, vgid: str, region_id: str, record: Dict[str, Any]) -> None:
+        """region 하나의 결과를 현재 프로세스의 segment 에 추가합니다.
+
+        Args:
+            vgid (str): Visual Genome 이미지 id
+            region_id (str): region id
+            record (Dict[str, Any]): 저장할 필드. 같은 region 에 여러 번 기록하면 compact 시 병합됩니다.
+        """
+        line = json.dumps({"vgid": vgid, "region_id": region_id, "record": record, "ts": time.time_ns()},
+                          ensure_ascii=False)
+        self._segment_file().write(line + "\n")
+
+    def iter_records(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """모든 segment 의 (vgid, region_id, record) 를 기록된 순서대로 반환합니다.
+
+        각 segment 는 한 프로세스가 시간순으로 쓴 것이므로, 줄마다 기록된 시각(ts)을 기준으로
+        segment 들을 병합합니다. ts 가 없는 이전 형식의 줄은 가장 먼저 기록된 것으로 봅니다.
+        프로세스가 쓰는 도중 종료되어 마지막 줄이 잘린 경우 해당 줄은 건너뜁니다.
+        """
+        segments = sorted(f for f in os.listdir(self.segment_dir) if f.endswith('.jsonl'))
+        merged = heapq.merge(*(self._iter_segment(os.path.join(self.segment_dir, segment)) for segment in segments),
+                             key=lambda item: item.get("ts", 0))
+        for item in merged:
+            yield item["vgid"], item["region_id"], item["record"]
+
+    @staticmethod
+    def _iter_segment(path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def processed_keys(self) -> Set[Tuple[str, str]]:
+        """segment 에 기록된 (vgid, region_id) 집합을 반환합니다."""
+        return {(vgid, region_id) for vgid, region_id, _ in self.iter_records()}
+
+    def merged(self, base_path: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """기존 결과 파일 위에 segment 의 record 를 순서대로 병합한 결과를 반환합니다.
+
+        Args:
+            base_path (Optional[str]): 병합의 기준이 될 기존 결과 파일. 없으면 빈 상태에서 시작합니다.
+
+        Returns:
+            Dict[str, Dict[str, Dict[str, Any]]]: {vgid: {region_id: {...}}}
+        """
+        return self._merge(base_path)[0]
+
+    def _merge(self, base_path: Optional[str]) -> Tuple[Dict[str, Dict[str, Dict[str, Any]]], int]:
+        save_data = {}
+        if base_path and os.path.exists(base_path):
+            with open(base_path, 'r', encoding='utf-8') as file:
+                save_data = json.load(file)
+
+        count = 0
+        for vgid, region_id, record in self.iter_records():
+            save_data.setdefault(vgid, {}).setdefault(region_id, {}).update(record)
+            count += 1
+        return save_data, count
+
+    def compact(self, output_path: str, base_path: Optional[str] = None) -> int:
+        """segment 들을 기존 image_metadata.json 과 같은 형태로 병합하여 저장합니다.
+
+        결과 형태는 {vgid: {region_id: {...}}} 이며, base_path 의 기존 결과 위에 segment 의
+        record 가 순서대로 덮어씌워집니다. 임시 파일에 쓴 뒤 교체하므로 중간에 실패해도
+        기존 출력 파일은 손상되지 않습니다.
+
+        Args:
+            output_path (str): 병합 결과를 저장할 JSON 파일 경로
+            base_path (Optional[str]): 병합의 기준이 될 기존 결과 파일. 없으면 빈 상태에서 시작합니다.
+
+        Returns:
+            int: 병합된 segment record 수
+        """
+        save_data, count = self._merge(base_path)
+
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(save_data, file, ensure_ascii=False, indent='\t')
+        os.replace(tmp_path, output_path)
+        return count
+
+    def close(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
@@ -7,7 +7,22 @@ device = "cuda" if torch.cuda.is_available() else "cpu"
 model, preprocess = clip.load("ViT-B/32", device=device)
 
 image_path = "/home/cwhjpaper/preprovessing/" 
-image = preprocess(Image.open(image_path)).unsqueeze(0).to(device)
+
+# Visual Genome region 을 원본 이미지에서 바로 crop 해서 사용할 경우 (예: VGID = "2333448", REGION_BBOX = (x, y, width, height))
+IMAGE_DIR = "/home/cwhjpaper/data/images"
+VGID = None
+REGION_BBOX = None
+REGION_PADDING = 0
+
+if VGID is not None:
+    import os
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from utils.crop_provider import CropProvider
+
+    image = preprocess(CropProvider(IMAGE_DIR).crop(VGID, REGION_BBOX, REGION_PADDING)).unsqueeze(0).to(device)
+else:
+    image = preprocess(Image.open(image_path)).unsqueeze(0).to(device)
 
 captions = [
    